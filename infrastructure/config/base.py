@@ -18,9 +18,44 @@ class BaseConfig:
     LAMBDA_MEMORY_SIZE = 512
     
     # Bedrock設定
-    BEDROCK_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+    BEDROCK_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"  # 再分析（エスカレーション）用
+    BEDROCK_FAST_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"  # 最初に使う高速・安価なモデル
+    BEDROCK_ROUTER_MAX_FAST_CHARS = 600  # これより長い相談は最初から大きいモデル
+    BEDROCK_ROUTER_MIN_CONFIDENCE = 0.6  # これ未満の確信度なら大きいモデルで再分析
     BEDROCK_MAX_TOKENS = 2000
     BEDROCK_TEMPERATURE = 0.7
+    BEDROCK_STREAMING_ENABLED = True  # WebSocket接続がある場合に部分結果を送信
+    BEDROCK_STREAM_FLUSH_CHARS = 80
+    BEDROCK_STREAM_FLUSH_INTERVAL_MS = 300
+    BEDROCK_CACHE_TTL_SECONDS = 3600  # 分析結果キャッシュの有効期間
+    BEDROCK_REQUESTS_PER_MINUTE = 100  # アカウントのRPMクォータ
+    BEDROCK_TOKENS_PER_MINUTE = 200000  # アカウントのTPMクォータ
+    BEDROCK_EXPECTED_CONCURRENCY = 10  # クォータを分け合うコンテナ数（各コンテナはクォータ÷この数のペースで送る）
+    BEDROCK_MAX_WAIT_SECONDS = 5  # クォータ待ちがこれを超えたら簡易分析に切り替え
+    BEDROCK_MAX_ATTEMPTS = 3
+    BEDROCK_CIRCUIT_FAILURE_THRESHOLD = 5  # 連続でこの回数失敗したら一定時間Bedrockを呼ばない
+    BEDROCK_CIRCUIT_RESET_SECONDS = 30
+    BEDROCK_HEDGING_ENABLED = False  # 応答が遅い場合にセカンダリリージョンへも送信
+    BEDROCK_SECONDARY_REGION = "us-east-1"
+    BEDROCK_HEDGE_PERCENTILE = 95  # プライマリの応答時間のこのパーセンタイルを超えたらヘッジ
+    BEDROCK_HEDGE_MIN_DELAY_MS = 300
+    BEDROCK_HEDGE_MAX_DELAY_MS = 3000  # ストリーミングの最初のチャンクの待ち時間の上限（非ストリーミングは上限なし）
+    
+    # 会話履歴設定
+    HISTORY_TOKEN_BUDGET = 1500  # プロンプトに原文で含める直近のやり取りのトークン数上限
+    HISTORY_MAX_TURNS = 20  # 1回に読み込むやり取りの上限
+    HISTORY_SUMMARY_MAX_CHARS = 400  # 古いやり取りの要約の最大文字数
+    
+    # バッチ分析設定（キュー経由でまとめて分析する場合）
+    BATCH_ANALYZER_ENABLED = False
+    BATCH_ANALYZER_BATCH_SIZE = 10  # 1回の起動で受け取る最大件数
+    BATCH_ANALYZER_MAX_WAIT_SECONDS = 2  # バッチが揃うまで待つ最大時間
+    BATCH_ANALYZER_MAX_CONCURRENCY = 8  # 同時にBedrockを呼び出す最大数
+    BATCH_ANALYZER_MAX_RECEIVE_COUNT = 3  # これを超えて失敗したらDLQへ
+    
+    # 類似相談検索設定
+    VECTOR_INDEX_ENABLED = False
+    VECTOR_INDEX_SIMILARITY_THRESHOLD = 0.92  # これ以上類似していれば過去の分析結果を再利用
     
     # DynamoDB設定
     DYNAMODB_BILLING_MODE = "PAY_PER_REQUEST"
@@ -29,6 +64,12 @@ class BaseConfig:
     # API Gateway設定
     API_GATEWAY_THROTTLE_RATE_LIMIT = 100
     API_GATEWAY_THROTTLE_BURST_LIMIT = 200
+    API_IDEMPOTENCY_EXPIRES_SECONDS = 3600  # Idempotency-Keyによる再送判定の有効期間
+    API_DIRECT_STEP_FUNCTIONS_INTEGRATION = False  # POST /chatをLambdaを経由せずStep Functionsで受け付ける
+    API_STATUS_MAX_WAIT_SECONDS = 20  # 状態取得のロングポーリング（?waitSeconds）の上限（統合タイムアウト29秒未満）
+    API_STATUS_CACHE_ENABLED = False  # 最終状態（/status/final）をAPI Gatewayのステージキャッシュから返す
+    API_STATUS_CACHE_TTL_SECONDS = 3600  # ステージキャッシュの有効期間（上限3600秒）
+    API_CACHE_CLUSTER_SIZE = "0.5"  # キャッシュクラスターのサイズ（GB）
     
     # WebSocket設定
     WEBSOCKET_ROUTE_SELECTION_EXPRESSION = "$request.body.action"
@@ -46,9 +87,17 @@ class BaseConfig:
     LOG_RETENTION_DAYS = 7
     ALARM_EVALUATION_PERIODS = 1
     ALARM_THRESHOLD_PERIOD = 300  # 5分
+    BEDROCK_TTFT_P99_ALARM_MS = 5000  # 最初のトークンまでの時間（p99）がこれを超えたら通知
+    BEDROCK_TOKENS_PER_REQUEST_ALARM = 4000  # 1回の呼び出しの平均トークン数がこれを超えたら通知
     
     # Step Functions設定
     STEP_FUNCTIONS_TIMEOUT_MINUTES = 5
+    STEP_FUNCTIONS_EXPRESS_ENABLED = False  # 短い相談はExpressワークフローで同期的に分析して結果を直接返す
+    STEP_FUNCTIONS_SYNC_DEADLINE_SECONDS = 8  # これを超えたら非同期（202）の流れに切り替え
+    STEP_FUNCTIONS_SYNC_MAX_CHARS = 400  # これより長い相談は最初から非同期で分析
+    STEP_FUNCTIONS_BATCH_ENABLED = False  # POST /chat/batch による一括送信
+    STEP_FUNCTIONS_BATCH_MAX_MESSAGES = 100  # 1回の一括送信で受け付ける最大件数
+    STEP_FUNCTIONS_BATCH_MAX_CONCURRENCY = 5  # Map状態で同時に分析する件数（Bedrockのクォータに合わせる）
     
     # セキュリティ設定
     ALLOWED_ORIGINS = ["http://localhost:8100"]  # 開発用
@@ -68,8 +117,43 @@ class BaseConfig:
             },
             "bedrock": {
                 "model_id": cls.BEDROCK_MODEL_ID,
+                "fast_model_id": cls.BEDROCK_FAST_MODEL_ID,
+                "router_max_fast_chars": cls.BEDROCK_ROUTER_MAX_FAST_CHARS,
+                "router_min_confidence": cls.BEDROCK_ROUTER_MIN_CONFIDENCE,
                 "max_tokens": cls.BEDROCK_MAX_TOKENS,
                 "temperature": cls.BEDROCK_TEMPERATURE,
+                "streaming_enabled": cls.BEDROCK_STREAMING_ENABLED,
+                "stream_flush_chars": cls.BEDROCK_STREAM_FLUSH_CHARS,
+                "stream_flush_interval_ms": cls.BEDROCK_STREAM_FLUSH_INTERVAL_MS,
+                "cache_ttl_seconds": cls.BEDROCK_CACHE_TTL_SECONDS,
+                "requests_per_minute": cls.BEDROCK_REQUESTS_PER_MINUTE,
+                "tokens_per_minute": cls.BEDROCK_TOKENS_PER_MINUTE,
+                "expected_concurrency": cls.BEDROCK_EXPECTED_CONCURRENCY,
+                "max_wait_seconds": cls.BEDROCK_MAX_WAIT_SECONDS,
+                "max_attempts": cls.BEDROCK_MAX_ATTEMPTS,
+                "circuit_failure_threshold": cls.BEDROCK_CIRCUIT_FAILURE_THRESHOLD,
+                "circuit_reset_seconds": cls.BEDROCK_CIRCUIT_RESET_SECONDS,
+                "hedging_enabled": cls.BEDROCK_HEDGING_ENABLED,
+                "secondary_region": cls.BEDROCK_SECONDARY_REGION,
+                "hedge_percentile": cls.BEDROCK_HEDGE_PERCENTILE,
+                "hedge_min_delay_ms": cls.BEDROCK_HEDGE_MIN_DELAY_MS,
+                "hedge_max_delay_ms": cls.BEDROCK_HEDGE_MAX_DELAY_MS,
+            },
+            "history": {
+                "token_budget": cls.HISTORY_TOKEN_BUDGET,
+                "max_turns": cls.HISTORY_MAX_TURNS,
+                "summary_max_chars": cls.HISTORY_SUMMARY_MAX_CHARS,
+            },
+            "batch_analyzer": {
+                "enabled": cls.BATCH_ANALYZER_ENABLED,
+                "batch_size": cls.BATCH_ANALYZER_BATCH_SIZE,
+                "max_wait_seconds": cls.BATCH_ANALYZER_MAX_WAIT_SECONDS,
+                "max_concurrency": cls.BATCH_ANALYZER_MAX_CONCURRENCY,
+                "max_receive_count": cls.BATCH_ANALYZER_MAX_RECEIVE_COUNT,
+            },
+            "vector_index": {
+                "enabled": cls.VECTOR_INDEX_ENABLED,
+                "similarity_threshold": cls.VECTOR_INDEX_SIMILARITY_THRESHOLD,
             },
             "dynamodb": {
                 "billing_mode": cls.DYNAMODB_BILLING_MODE,
@@ -83,6 +167,12 @@ class BaseConfig:
                 "cors": {
                     "allowed_origins": cls.ALLOWED_ORIGINS,
                 },
+                "idempotency_expires_seconds": cls.API_IDEMPOTENCY_EXPIRES_SECONDS,
+                "direct_step_functions_integration": cls.API_DIRECT_STEP_FUNCTIONS_INTEGRATION,
+                "status_max_wait_seconds": cls.API_STATUS_MAX_WAIT_SECONDS,
+                "status_cache_enabled": cls.API_STATUS_CACHE_ENABLED,
+                "status_cache_ttl_seconds": cls.API_STATUS_CACHE_TTL_SECONDS,
+                "cache_cluster_size": cls.API_CACHE_CLUSTER_SIZE,
             },
             "websocket": {
                 "route_selection_expression": cls.WEBSOCKET_ROUTE_SELECTION_EXPRESSION,
@@ -96,9 +186,19 @@ class BaseConfig:
                     "evaluation_periods": cls.ALARM_EVALUATION_PERIODS,
                     "threshold_period": cls.ALARM_THRESHOLD_PERIOD,
                 },
+                "bedrock": {
+                    "ttft_p99_threshold_ms": cls.BEDROCK_TTFT_P99_ALARM_MS,
+                    "tokens_per_request_threshold": cls.BEDROCK_TOKENS_PER_REQUEST_ALARM,
+                },
             },
             "step_functions": {
                 "timeout_minutes": cls.STEP_FUNCTIONS_TIMEOUT_MINUTES,
+                "express_enabled": cls.STEP_FUNCTIONS_EXPRESS_ENABLED,
+                "sync_deadline_seconds": cls.STEP_FUNCTIONS_SYNC_DEADLINE_SECONDS,
+                "sync_max_chars": cls.STEP_FUNCTIONS_SYNC_MAX_CHARS,
+                "batch_enabled": cls.STEP_FUNCTIONS_BATCH_ENABLED,
+                "batch_max_messages": cls.STEP_FUNCTIONS_BATCH_MAX_MESSAGES,
+                "batch_max_concurrency": cls.STEP_FUNCTIONS_BATCH_MAX_CONCURRENCY,
             },
         }
     
@@ -3,12 +3,62 @@ from aws_cdk import (
     aws_lambda as lambda_,
     aws_cognito as cognito,
     aws_iam as iam,
+    aws_stepfunctions as sfn,
     Duration,
     RemovalPolicy,
 )
 from constructs import Construct
 
 
+# Step Functionsへの直接統合（input_handlerを経由しない）のマッピングテンプレート
+# 所有者を確認できないため新しい会話の開始だけを受け付け、会話IDはリクエストIDを使う（実行名は "chat-{会話ID}"）
+# 利用者はオーソライザーから取り、ステートマシンが最初のやり取りとして記録する（以降の続きは所有者だけが送れる）
+
+# リクエストの受付時刻をISO 8601形式（UTC、ミリ秒まで）にする
+# 要求・応答の両方のテンプレートで同じ値になり、ステートマシンはこれをやり取りの時刻として保存する
+# $context.requestTimeは "18/Oct/2026:09:15:30 +0000" の形式
+REQUEST_TIMESTAMP_TEMPLATE = """#set($months = {"Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06", "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12"})
+#set($requestTime = $context.requestTime)
+#set($epochMillis = "$context.requestTimeEpoch")
+#set($month = $months.get($requestTime.substring(3, 6)))
+#set($millisStart = $epochMillis.length() - 3)
+#set($millis = $epochMillis.substring($millisStart))
+#set($timestamp = "$requestTime.substring(7, 11)-$month-$requestTime.substring(0, 2)T$requestTime.substring(12, 20).${millis}Z")
+"""
+
+START_EXECUTION_REQUEST_TEMPLATE = REQUEST_TIMESTAMP_TEMPLATE + """#set($conversationId = $context.requestId)
+#set($executionName = "chat-$conversationId")
+#set($userId = $context.authorizer.claims.sub)
+#set($connectionId = $input.path('$.connectionId'))
+#set($bypassCache = $input.path('$.bypassCache'))
+{
+  "stateMachineArn": "{stateMachineArn}",
+  "name": "$util.escapeJavaScript($executionName)",
+  "input": "{\\"conversationId\\": \\"$util.escapeJavaScript($conversationId)\\", \\"message\\": $util.escapeJavaScript($input.json('$.message')).replaceAll("\\\\'", "'"), \\"timestamp\\": \\"$timestamp\\", \\"connectionId\\": \\"$util.escapeJavaScript($!connectionId)\\", \\"bypassCache\\": #if($bypassCache == true)true#{else}false#end, \\"provisional\\": null, \\"userId\\": \\"$util.escapeJavaScript($!userId)\\", \\"recordTurn\\": true}"
+}"""
+
+# input_handlerの202応答と同じ形式（会話IDはリクエストID、timestampは要求テンプレートと同じ受付時刻）
+START_EXECUTION_RESPONSE_TEMPLATE = REQUEST_TIMESTAMP_TEMPLATE + """#set($executionArn = $input.path('$.executionArn'))
+{
+  "conversationId": "$context.requestId",
+  "status": "processing",
+  "message": "分析を開始しました",
+  "executionArn": "$executionArn",
+  "timestamp": "$timestamp"
+}"""
+
+
+# 最終状態の取得（ステージキャッシュの対象）
+STATUS_FINAL_RESOURCE_PATH = "/api/v1/chat/{conversationId}/status/final"
+
+# キャッシュキー（やり取りの時刻ごとに分け、If-None-Matchを含めて304の応答を別のクライアントへ返さない）
+STATUS_CACHE_KEY_PARAMETERS = [
+    "method.request.path.conversationId",
+    "method.request.querystring.turn",
+    "method.request.header.If-None-Match",
+]
+
+
 class ApiGatewayConstruct(Construct):
     """API Gateway構築用コンストラクト"""
 
@@ -21,6 +71,7 @@ class ApiGatewayConstruct(Construct):
         input_handler_function: lambda_.Function,
         status_handler_function: lambda_.Function,  # ★ 追加
         config: dict = None,
+        state_machine: sfn.IStateMachine = None,
         **kwargs
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -30,6 +81,7 @@ class ApiGatewayConstruct(Construct):
         self.user_pool = user_pool
         self.input_handler_function = input_handler_function
         self.status_handler_function = status_handler_function  # ★ 追加
+        self.state_machine = state_machine
 
         # REST API作成
         self.rest_api = self._create_rest_api()
@@ -55,6 +107,7 @@ class ApiGatewayConstruct(Construct):
                 tracing_enabled=True,
                 throttling_rate_limit=self.config.get("throttle", {}).get("rate_limit", 100),
                 throttling_burst_limit=self.config.get("throttle", {}).get("burst_limit", 200),
+                **self._cache_stage_options(),
             ),
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=self.config.get("cors", {}).get("allowed_origins", ["*"]),
@@ -66,12 +119,33 @@ class ApiGatewayConstruct(Construct):
                     "X-Api-Key",
                     "X-Amz-Security-Token",
                     "X-Amz-User-Agent",
+                    "Idempotency-Key",
+                    "If-None-Match",
                 ],
                 allow_credentials=True,
             ),
             endpoint_types=[apigateway.EndpointType.REGIONAL],
         )
 
+    def _cache_stage_options(self) -> dict:
+        """
+        最終状態の取得だけをステージキャッシュの対象にする
+        （キャッシュはメソッド単位のため、分析中の状態を返すGET /statusは対象にしない）
+        """
+        if not self.config.get("status_cache_enabled", False):
+            return {}
+        return {
+            "cache_cluster_enabled": True,
+            "cache_cluster_size": self.config.get("cache_cluster_size", "0.5"),
+            "method_options": {
+                f"{STATUS_FINAL_RESOURCE_PATH}/GET": apigateway.MethodDeploymentOptions(
+                    caching_enabled=True,
+                    cache_ttl=Duration.seconds(self.config.get("status_cache_ttl_seconds", 3600)),
+                    cache_data_encrypted=True,
+                ),
+            },
+        }
+
     def _create_authorizer(self) -> apigateway.CognitoUserPoolsAuthorizer:
         """Cognitoオーソライザーを作成"""
         return apigateway.CognitoUserPoolsAuthorizer(
@@ -92,43 +166,32 @@ class ApiGatewayConstruct(Construct):
         chat_resource = api_v1.add_resource("chat")
 
         # POST /api/v1/chat - チャットメッセージ送信
-        chat_resource.add_method(
+        if self.state_machine and self.config.get("direct_step_functions_integration", False):
+            self._add_start_execution_method(chat_resource)
+        else:
+            self._add_input_handler_method(chat_resource)
+
+        # POST /api/v1/chat/batch - 複数の相談の一括送信
+        batch_resource = chat_resource.add_resource("batch")
+        batch_resource.add_method(
             "POST",
             apigateway.LambdaIntegration(
                 self.input_handler_function,
                 proxy=True,
-                integration_responses=[
-                    apigateway.IntegrationResponse(
-                        status_code="200",
-                        response_parameters={
-                            "method.response.header.Access-Control-Allow-Origin": "'*'",
-                        },
-                    ),
-                    apigateway.IntegrationResponse(
-                        status_code="202",
-                        selection_pattern="202",
-                        response_parameters={
-                            "method.response.header.Access-Control-Allow-Origin": "'*'",
-                        },
-                    ),
-                ],
             ),
             authorizer=self.authorizer,
             authorization_type=apigateway.AuthorizationType.COGNITO,
-            method_responses=[
-                apigateway.MethodResponse(
-                    status_code="200",
-                    response_parameters={
-                        "method.response.header.Access-Control-Allow-Origin": True,
-                    },
-                ),
-                apigateway.MethodResponse(
-                    status_code="202",
-                    response_parameters={
-                        "method.response.header.Access-Control-Allow-Origin": True,
-                    },
-                ),
-            ],
+        )
+
+        # GET /api/v1/chat/batch/{batchId} - 一括送信の各件の状態取得
+        batch_resource.add_resource("{batchId}").add_method(
+            "GET",
+            apigateway.LambdaIntegration(
+                self.input_handler_function,
+                proxy=True,
+            ),
+            authorizer=self.authorizer,
+            authorization_type=apigateway.AuthorizationType.COGNITO,
         )
 
         # /api/v1/chat/{conversationId} リソース
@@ -157,6 +220,35 @@ class ApiGatewayConstruct(Construct):
             authorization_type=apigateway.AuthorizationType.COGNITO,
         )
 
+        # GET /api/v1/chat/{conversationId}/status/final?turn={やり取りの時刻} - 最終状態の取得（変更不可としてキャッシュ）
+        status_resource.add_resource("final").add_method(
+            "GET",
+            apigateway.LambdaIntegration(
+                self.status_handler_function,
+                proxy=True,
+                cache_key_parameters=STATUS_CACHE_KEY_PARAMETERS,
+            ),
+            authorizer=self.authorizer,
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+            request_parameters={
+                "method.request.path.conversationId": True,
+                "method.request.querystring.turn": True,
+                "method.request.header.If-None-Match": False,
+            },
+        )
+
+        # POST /api/v1/chat/status:batchGet - 複数の会話の状態を一括取得（管理画面・受信箱用）
+        status_batch_resource = chat_resource.add_resource("status:batchGet")
+        status_batch_resource.add_method(
+            "POST",
+            apigateway.LambdaIntegration(
+                self.status_handler_function,
+                proxy=True,
+            ),
+            authorizer=self.authorizer,
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+        )
+
         # /api/v1/health - ヘルスチェック（認証不要）
         health_resource = api_v1.add_resource("health")
         health_resource.add_method(
@@ -183,6 +275,139 @@ class ApiGatewayConstruct(Construct):
         if self.config.get("enable_usage_plan", False):
             self._create_usage_plan()
 
+    def _add_input_handler_method(self, chat_resource: apigateway.Resource):
+        """POST /api/v1/chat をinput_handler Lambdaで処理する"""
+        chat_resource.add_method(
+            "POST",
+            apigateway.LambdaIntegration(
+                self.input_handler_function,
+                proxy=True,
+                integration_responses=[
+                    apigateway.IntegrationResponse(
+                        status_code="200",
+                        response_parameters={
+                            "method.response.header.Access-Control-Allow-Origin": "'*'",
+                        },
+                    ),
+                    apigateway.IntegrationResponse(
+                        status_code="202",
+                        selection_pattern="202",
+                        response_parameters={
+                            "method.response.header.Access-Control-Allow-Origin": "'*'",
+                        },
+                    ),
+                ],
+            ),
+            authorizer=self.authorizer,
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+            method_responses=[
+                apigateway.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                    },
+                ),
+                apigateway.MethodResponse(
+                    status_code="202",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                    },
+                ),
+            ],
+        )
+
+    def _add_start_execution_method(self, chat_resource: apigateway.Resource):
+        """
+        POST /api/v1/chat をStep FunctionsのStartExecutionに直接統合する
+        Lambdaを経由しないため、暫定結果・Idempotency-Key・Expressの同期実行には対応しない
+        会話の所有者を確認できないため、既存の会話の続き（conversationIdの指定）は受け付けない
+        """
+        role = iam.Role(
+            self,
+            "StartExecutionRole",
+            assumed_by=iam.ServicePrincipal("apigateway.amazonaws.com"),
+        )
+        self.state_machine.grant_start_execution(role)
+
+        cors_parameters = {
+            "method.response.header.Access-Control-Allow-Origin": "'*'",
+        }
+        error_template = {
+            "application/json": "{\"error\": $input.json('$.message')}",
+        }
+
+        # messageは必須（空の入力でワークフローを開始しない）、conversationIdは指定できない
+        request_model = self.rest_api.add_model(
+            "ChatRequestModel",
+            content_type="application/json",
+            schema=apigateway.JsonSchema(
+                schema=apigateway.JsonSchemaVersion.DRAFT4,
+                type=apigateway.JsonSchemaType.OBJECT,
+                required=["message"],
+                properties={
+                    "message": apigateway.JsonSchema(type=apigateway.JsonSchemaType.STRING, min_length=1),
+                    "connectionId": apigateway.JsonSchema(type=apigateway.JsonSchemaType.STRING),
+                    "bypassCache": apigateway.JsonSchema(type=apigateway.JsonSchemaType.BOOLEAN),
+                },
+                not_=apigateway.JsonSchema(required=["conversationId"]),
+            ),
+        )
+
+        chat_resource.add_method(
+            "POST",
+            apigateway.AwsIntegration(
+                service="states",
+                action="StartExecution",
+                integration_http_method="POST",
+                options=apigateway.IntegrationOptions(
+                    credentials_role=role,
+                    passthrough_behavior=apigateway.PassthroughBehavior.NEVER,
+                    request_templates={
+                        "application/json": START_EXECUTION_REQUEST_TEMPLATE.replace(
+                            "{stateMachineArn}", self.state_machine.state_machine_arn
+                        ),
+                    },
+                    integration_responses=[
+                        apigateway.IntegrationResponse(
+                            status_code="202",
+                            response_parameters=cors_parameters,
+                            response_templates={
+                                "application/json": START_EXECUTION_RESPONSE_TEMPLATE,
+                            },
+                        ),
+                        apigateway.IntegrationResponse(
+                            status_code="400",
+                            selection_pattern=r"4\d{2}",
+                            response_parameters=cors_parameters,
+                            response_templates=error_template,
+                        ),
+                        apigateway.IntegrationResponse(
+                            status_code="500",
+                            selection_pattern=r"5\d{2}",
+                            response_parameters=cors_parameters,
+                            response_templates=error_template,
+                        ),
+                    ],
+                ),
+            ),
+            authorizer=self.authorizer,
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+            request_validator=self.rest_api.add_request_validator(
+                "ChatRequestValidator",
+                validate_request_body=True,
+            ),
+            request_models={"application/json": request_model},
+            method_responses=[
+                apigateway.MethodResponse(
+                    status_code=status_code,
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                    },
+                )
+                for status_code in ["202", "400", "500"]
+            ],
+        )
+
     def _create_usage_plan(self):
         """API使用量プランを作成"""
         # APIキーの作成
@@ -62,6 +62,20 @@ class DynamoDBConstruct(Construct):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
+        # GSI: 一括送信（batchId）ごとの各件の状態を検索
+        self.conversations_table.add_global_secondary_index(
+            index_name="batchId-timestamp-index",
+            partition_key=dynamodb.Attribute(
+                name="batchId",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="timestamp",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
         # 組織構造テーブル
         self.organizations_table = dynamodb.Table(
             self,
@@ -123,6 +137,34 @@ class DynamoDBConstruct(Construct):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
+        # 分析結果キャッシュテーブル（正規化した相談内容のハッシュをキーにする）
+        self.analysis_cache_table = dynamodb.Table(
+            self,
+            "AnalysisCacheTable",
+            table_name=f"houkokusou-chatbot-{self.env_name}-analysis-cache",
+            partition_key=dynamodb.Attribute(
+                name="cacheKey",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl",
+        )
+
+        # 冪等性テーブル（Idempotency-Keyごとの最初の応答。属性名はPowertoolsの既定値）
+        self.idempotency_table = dynamodb.Table(
+            self,
+            "IdempotencyTable",
+            table_name=f"houkokusou-chatbot-{self.env_name}-idempotency",
+            partition_key=dynamodb.Attribute(
+                name="id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="expiration",
+        )
+
         # WebSocket接続管理テーブル（オプション）
         if self.config.get("enable_websocket_connections_table", True):
             self.connections_table = dynamodb.Table(
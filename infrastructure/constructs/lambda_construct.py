@@ -3,8 +3,14 @@ from aws_cdk import (
     aws_iam as iam,
     aws_cognito as cognito,
     aws_dynamodb as dynamodb,
+    aws_s3 as s3,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_event_sources,
     Duration,
     RemovalPolicy,
+    Stack,
+    ArnFormat,
+    SymlinkFollowMode,
 )
 from constructs import Construct
 import os
@@ -33,6 +39,17 @@ class LambdaConstruct(Construct):
         # Lambda Layer作成
         self.common_layer = self._create_common_layer()
 
+        # 類似相談検索用のベクトルインデックス格納バケット（オプション）
+        self.vector_index_bucket = None
+        if self.config.get("vector_index", {}).get("enabled", False):
+            self.vector_index_bucket = self._create_vector_index_bucket()
+
+        # バッチ分析用のキュー（オプション）
+        self.analysis_queue = None
+        self.bedrock_batch_analyzer_function = None
+        if self.config.get("batch_analyzer", {}).get("enabled", False):
+            self.analysis_queue = self._create_analysis_queue()
+
         # Lambda関数作成
         self._create_lambda_functions()
 
@@ -41,12 +58,53 @@ class LambdaConstruct(Construct):
         return lambda_.LayerVersion(
             self,
             "CommonLayer",
-            code=lambda_.Code.from_asset("src/lambda/layers/common"),
+            # data/organization_structure.json はシンボリックリンクで同梱
+            code=lambda_.Code.from_asset("src/lambda/layers/common", follow_symlinks=SymlinkFollowMode.ALWAYS),
             compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
             description="共通ライブラリとユーティリティ",
             removal_policy=RemovalPolicy.DESTROY,
         )
 
+    def _create_vector_index_bucket(self) -> s3.Bucket:
+        """ベクトルインデックス（スナップショットと差分）を格納するバケットを作成"""
+        return s3.Bucket(
+            self,
+            "VectorIndexBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            removal_policy=RemovalPolicy.DESTROY if self.env_name == "dev" else RemovalPolicy.RETAIN,
+            auto_delete_objects=self.env_name == "dev",
+            lifecycle_rules=[
+                # 差分はスナップショットに統合されるため一定期間で削除
+                s3.LifecycleRule(
+                    prefix="vector-index/deltas/",
+                    expiration=Duration.days(7),
+                ),
+            ],
+        )
+
+    def _create_analysis_queue(self) -> sqs.Queue:
+        """バッチ分析用のキューと、失敗を繰り返したメッセージ用のDLQを作成"""
+        dead_letter_queue = sqs.Queue(
+            self,
+            "AnalysisDeadLetterQueue",
+            retention_period=Duration.days(14),
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+        )
+
+        return sqs.Queue(
+            self,
+            "AnalysisQueue",
+            # バッチ分析Lambdaのタイムアウト（60秒）の6倍を確保
+            visibility_timeout=Duration.seconds(360),
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            dead_letter_queue=sqs.DeadLetterQueue(
+                queue=dead_letter_queue,
+                max_receive_count=self.config.get("batch_analyzer", {}).get("max_receive_count", 3),
+            ),
+        )
+
     def _create_lambda_functions(self):
         """各Lambda関数を作成"""
         # 共通の環境変数
@@ -66,6 +124,11 @@ class LambdaConstruct(Construct):
                 **common_env,
                 "CONVERSATION_TABLE_NAME": self.tables["conversations"].table_name,
                 "STATE_MACHINE_ARN": "",  # 後でStep Functionsから設定
+                "ANALYSIS_QUEUE_URL": self.analysis_queue.queue_url if self.analysis_queue else "",
+                "IDEMPOTENCY_TABLE_NAME": self.tables["idempotency"].table_name if "idempotency" in self.tables else "",
+                "IDEMPOTENCY_EXPIRES_SECONDS": str(
+                    self.config.get("api_gateway", {}).get("idempotency_expires_seconds", 3600)
+                ),
             }
         )
 
@@ -73,14 +136,23 @@ class LambdaConstruct(Construct):
         self.status_handler_function = self._create_function(
             "StatusHandler",
             "src/lambda/api/status_handler",
-            "Status Handler Lambda - Step Functions結果取得",
+            "Status Handler Lambda - 分析状態の取得",
             {
                 **common_env,
                 "CONVERSATION_TABLE_NAME": self.tables["conversations"].table_name,
                 "STATE_MACHINE_ARN": "",  # 後でStep Functionsから設定
+                "LONG_POLL_MAX_WAIT_SECONDS": str(
+                    self.config.get("api_gateway", {}).get("status_max_wait_seconds", 20)
+                ),
+                "STATUS_FINAL_MAX_AGE_SECONDS": str(
+                    self.config.get("api_gateway", {}).get("status_cache_ttl_seconds", 3600)
+                ),
             }
         )
 
+        # WebSocket接続管理テーブル（接続時に登録し、通知時に利用者の全接続を検索する）
+        connections_table_name = self.tables["connections"].table_name if "connections" in self.tables else ""
+
         # WebSocket Handlers
         self.websocket_handlers = {
             "connect": self._create_function(
@@ -90,7 +162,7 @@ class LambdaConstruct(Construct):
                 {
                     **common_env,
                     "HANDLER": "connect",
-                    "CONNECTIONS_TABLE": self.tables["conversations"].table_name,
+                    "CONNECTIONS_TABLE": connections_table_name,
                 },
                 handler="connect.lambda_handler"
             ),
@@ -101,7 +173,7 @@ class LambdaConstruct(Construct):
                 {
                     **common_env,
                     "HANDLER": "disconnect",
-                    "CONNECTIONS_TABLE": self.tables["conversations"].table_name,
+                    "CONNECTIONS_TABLE": connections_table_name,
                 },
                 handler="disconnect.lambda_handler"
             ),
@@ -113,6 +185,7 @@ class LambdaConstruct(Construct):
                     **common_env,
                     "HANDLER": "message",
                     "CONVERSATIONS_TABLE": self.tables["conversations"].table_name,
+                    "CONNECTIONS_TABLE": connections_table_name,
                 },
                 handler="message.lambda_handler"
             ),
@@ -130,29 +203,107 @@ class LambdaConstruct(Construct):
         )
 
         # Bedrock Analyzer Lambda
+        bedrock_config = self.config.get("bedrock", {})
+        history_config = self.config.get("history", {})
+        # 会話履歴の要約は通常の分析Lambdaを非同期で呼び出して更新する
+        summary_function_name = f"houkokusou-chatbot-{self.env_name}-BedrockAnalyzer"
+        bedrock_env = {
+            **common_env,
+            "BEDROCK_MODEL_ID": bedrock_config.get("model_id", "anthropic.claude-3-sonnet-20240229-v1:0"),
+            "BEDROCK_FAST_MODEL_ID": bedrock_config.get("fast_model_id", "anthropic.claude-3-haiku-20240307-v1:0"),
+            "ROUTER_MAX_FAST_CHARS": str(bedrock_config.get("router_max_fast_chars", 600)),
+            "ROUTER_MIN_CONFIDENCE": str(bedrock_config.get("router_min_confidence", 0.6)),
+            "CONVERSATIONS_TABLE": self.tables["conversations"].table_name,
+            "BEDROCK_STREAMING_ENABLED": str(bedrock_config.get("streaming_enabled", False)).lower(),
+            "STREAM_FLUSH_CHARS": str(bedrock_config.get("stream_flush_chars", 80)),
+            "STREAM_FLUSH_INTERVAL_MS": str(bedrock_config.get("stream_flush_interval_ms", 300)),
+            "ANALYSIS_CACHE_TABLE": self.tables["analysis_cache"].table_name if "analysis_cache" in self.tables else "",
+            "ANALYSIS_CACHE_TTL_SECONDS": str(bedrock_config.get("cache_ttl_seconds", 3600)),
+            "BEDROCK_REQUESTS_PER_MINUTE": str(bedrock_config.get("requests_per_minute", 100)),
+            "BEDROCK_TOKENS_PER_MINUTE": str(bedrock_config.get("tokens_per_minute", 200000)),
+            "BEDROCK_EXPECTED_CONCURRENCY": str(bedrock_config.get("expected_concurrency", 10)),
+            "BEDROCK_MAX_WAIT_SECONDS": str(bedrock_config.get("max_wait_seconds", 5)),
+            "BEDROCK_MAX_ATTEMPTS": str(bedrock_config.get("max_attempts", 3)),
+            "BEDROCK_CIRCUIT_FAILURE_THRESHOLD": str(bedrock_config.get("circuit_failure_threshold", 5)),
+            "BEDROCK_CIRCUIT_RESET_SECONDS": str(bedrock_config.get("circuit_reset_seconds", 30)),
+            "BEDROCK_HEDGING_ENABLED": str(bedrock_config.get("hedging_enabled", False)).lower(),
+            "BEDROCK_SECONDARY_REGION": bedrock_config.get("secondary_region", "us-east-1"),
+            "HEDGE_PERCENTILE": str(bedrock_config.get("hedge_percentile", 95)),
+            "HEDGE_MIN_DELAY_MS": str(bedrock_config.get("hedge_min_delay_ms", 300)),
+            "HEDGE_MAX_DELAY_MS": str(bedrock_config.get("hedge_max_delay_ms", 3000)),
+            "VECTOR_INDEX_BUCKET": self.vector_index_bucket.bucket_name if self.vector_index_bucket else "",
+            "SIMILARITY_THRESHOLD": str(self.config.get("vector_index", {}).get("similarity_threshold", 0.92)),
+            "HISTORY_TOKEN_BUDGET": str(history_config.get("token_budget", 1500)),
+            "HISTORY_MAX_TURNS": str(history_config.get("max_turns", 20)),
+            "SUMMARY_MAX_CHARS": str(history_config.get("summary_max_chars", 400)),
+            "SUMMARY_FUNCTION_NAME": summary_function_name,
+        }
         self.bedrock_analyzer_function = self._create_function(
             "BedrockAnalyzer",
             "src/lambda/processors/bedrock_analyzer",
             "Bedrock Analysis Lambda",
-            {
-                **common_env,
-                "BEDROCK_MODEL_ID": self.config.get("bedrock", {}).get("model_id", "anthropic.claude-3-sonnet-20240229-v1:0"),
-                "CONVERSATIONS_TABLE": self.tables["conversations"].table_name,
-            },
+            bedrock_env,
             timeout=Duration.seconds(60),
             memory_size=1024,
         )
+        analyzer_functions = [self.bedrock_analyzer_function]
+
+        # Bedrock Batch Analyzer Lambda（キューからまとめて受け取り並行して分析）
+        if self.analysis_queue:
+            batch_config = self.config.get("batch_analyzer", {})
+            self.bedrock_batch_analyzer_function = self._create_function(
+                "BedrockBatchAnalyzer",
+                "src/lambda/processors/bedrock_analyzer",
+                "Bedrock Batch Analysis Lambda",
+                {
+                    **bedrock_env,
+                    "BATCH_MAX_CONCURRENCY": str(batch_config.get("max_concurrency", 8)),
+                    "BATCH_MAX_RECEIVE_COUNT": str(batch_config.get("max_receive_count", 3)),
+                },
+                handler="batch_handler.lambda_handler",
+                timeout=Duration.seconds(60),
+                memory_size=1024,
+            )
+            self.bedrock_batch_analyzer_function.add_event_source(
+                lambda_event_sources.SqsEventSource(
+                    self.analysis_queue,
+                    batch_size=batch_config.get("batch_size", 10),
+                    max_batching_window=Duration.seconds(batch_config.get("max_wait_seconds", 2)),
+                    report_batch_item_failures=True,
+                )
+            )
+            self.analysis_queue.grant_send_messages(self.input_handler_function)
+            analyzer_functions.append(self.bedrock_batch_analyzer_function)
 
-        # Bedrock権限を追加
-        self.bedrock_analyzer_function.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=[
-                    "bedrock:InvokeModel",
-                    "bedrock:InvokeModelWithResponseStream",
-                ],
-                resources=["*"],
+        for analyzer_function in analyzer_functions:
+            # Bedrock権限を追加
+            analyzer_function.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "bedrock:InvokeModel",
+                        "bedrock:InvokeModelWithResponseStream",
+                    ],
+                    resources=["*"],
+                )
+            )
+
+            if self.vector_index_bucket:
+                self.vector_index_bucket.grant_read_write(analyzer_function)
+
+            # 要約更新の非同期呼び出し（関数名から組み立てて循環参照を避ける）
+            analyzer_function.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["lambda:InvokeFunction"],
+                    resources=[
+                        Stack.of(self).format_arn(
+                            service="lambda",
+                            resource="function",
+                            resource_name=summary_function_name,
+                            arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                        )
+                    ],
+                )
             )
-        )
 
         # Organization Matcher Lambda
         self.organization_matcher_function = self._create_function(
@@ -174,6 +325,7 @@ class LambdaConstruct(Construct):
             {
                 **common_env,
                 "CONVERSATIONS_TABLE": self.tables["conversations"].table_name,
+                "CONNECTIONS_TABLE": connections_table_name,
             }
         )
 
@@ -198,18 +350,21 @@ class LambdaConstruct(Construct):
         )
         
         self.status_handler_function.add_to_role_policy(step_functions_policy)
-        self.input_handler_function.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=["states:StartExecution"],
-                resources=["*"],
+        # WebSocketのsendmessageルートからも分析を開始する
+        for function in (self.input_handler_function, self.websocket_handlers["message"]):
+            function.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["states:StartExecution"],
+                    resources=["*"],
+                )
             )
-        )
 
         # DynamoDBアクセス権限を付与
         for table in self.tables.values():
             table.grant_read_write_data(self.input_handler_function)
             table.grant_read_write_data(self.status_handler_function)  # ★ 追加
-            table.grant_read_write_data(self.bedrock_analyzer_function)
+            for analyzer_function in analyzer_functions:
+                table.grant_read_write_data(analyzer_function)
             table.grant_read_write_data(self.organization_matcher_function)
             table.grant_read_write_data(self.notification_sender_function)
             table.grant_read_write_data(self.organization_manager_function)
@@ -245,7 +400,28 @@ class LambdaConstruct(Construct):
             retry_attempts=2,
         )
 
-    def update_step_functions_arn(self, state_machine_arn: str):
+    def update_step_functions_arn(
+        self,
+        state_machine_arn: str,
+        express_state_machine_arn: str = None,
+        batch_state_machine_arn: str = None,
+    ):
         """Step FunctionsのARNを環境変数に設定"""
         self.input_handler_function.add_environment("STATE_MACHINE_ARN", state_machine_arn)
-        self.status_handler_function.add_environment("STATE_MACHINE_ARN", state_machine_arn)  # ★ 追加
\ No newline at end of file
+        self.status_handler_function.add_environment("STATE_MACHINE_ARN", state_machine_arn)  # ★ 追加
+        self.websocket_handlers["message"].add_environment("STATE_MACHINE_ARN", state_machine_arn)
+        if express_state_machine_arn:
+            step_functions_config = self.config.get("step_functions", {})
+            self.input_handler_function.add_environment("EXPRESS_STATE_MACHINE_ARN", express_state_machine_arn)
+            self.input_handler_function.add_environment(
+                "SYNC_DEADLINE_SECONDS", str(step_functions_config.get("sync_deadline_seconds", 8))
+            )
+            self.input_handler_function.add_environment(
+                "SYNC_MAX_CHARS", str(step_functions_config.get("sync_max_chars", 400))
+            )
+        if batch_state_machine_arn:
+            self.input_handler_function.add_environment("BATCH_STATE_MACHINE_ARN", batch_state_machine_arn)
+            self.input_handler_function.add_environment(
+                "BATCH_MAX_MESSAGES",
+                str(self.config.get("step_functions", {}).get("batch_max_messages", 100)),
+            )
\ No newline at end of file
@@ -10,6 +10,10 @@ from aws_cdk import (
 from constructs import Construct
 from typing import List
 
+# Lambda Powertoolsのメトリクス（分析Lambdaが出力）
+METRICS_NAMESPACE = "HoukokusouChatbot"
+METRICS_SERVICE = "houkokusou-chatbot"
+
 
 class MonitoringConstruct(Construct):
     """CloudWatch監視構築用コンストラクト"""
@@ -147,8 +151,81 @@ class MonitoringConstruct(Construct):
             ),
         )
 
+        # Bedrock呼び出しのレイテンシとトークン数
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Bedrock - Time to First Token",
+                left=[
+                    self._bedrock_metric("BedrockTimeToFirstToken", cloudwatch.Stats.p(50)),
+                    self._bedrock_metric("BedrockTimeToFirstToken", cloudwatch.Stats.p(99)),
+                ],
+                right=[
+                    self._bedrock_metric("BedrockLatency", cloudwatch.Stats.p(99)),
+                ],
+                width=12,
+            ),
+            cloudwatch.GraphWidget(
+                title="Bedrock - Tokens per Request",
+                left=[
+                    self._bedrock_metric("BedrockInputTokens", cloudwatch.Stats.AVERAGE),
+                    self._bedrock_metric("BedrockOutputTokens", cloudwatch.Stats.AVERAGE),
+                    self._bedrock_metric("BedrockTokensPerRequest", cloudwatch.Stats.p(99)),
+                ],
+                right=[
+                    self._bedrock_metric("BedrockOutputTokensPerSecond", cloudwatch.Stats.AVERAGE),
+                ],
+                width=12,
+            ),
+        )
+
+        # カテゴリ・緊急度・モデル別の内訳（次元の値は事前に決まらないため検索式で表示）
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Bedrock - Time to First Token by Category (p99)",
+                left=[
+                    cloudwatch.MathExpression(
+                        expression=(
+                            f"SEARCH('Namespace=\"{METRICS_NAMESPACE}\" "
+                            f"MetricName=\"BedrockTimeToFirstToken\" Category', 'p99', 300)"
+                        ),
+                        label="",
+                        using_metrics={},
+                        period=Duration.minutes(5),
+                    ),
+                ],
+                width=12,
+            ),
+            cloudwatch.GraphWidget(
+                title="Bedrock - Tokens by Category",
+                left=[
+                    cloudwatch.MathExpression(
+                        expression=(
+                            f"SEARCH('Namespace=\"{METRICS_NAMESPACE}\" "
+                            f"MetricName=\"BedrockTokensPerRequest\" Category', 'Sum', 300)"
+                        ),
+                        label="",
+                        using_metrics={},
+                        period=Duration.minutes(5),
+                    ),
+                ],
+                width=12,
+            ),
+        )
+
         return dashboard
 
+    def _bedrock_metric(self, metric_name: str, statistic: str) -> cloudwatch.Metric:
+        """分析Lambdaが出力するBedrock呼び出しのメトリクス（全体）"""
+        return cloudwatch.Metric(
+            metric_name=metric_name,
+            namespace=METRICS_NAMESPACE,
+            dimensions_map={
+                "service": METRICS_SERVICE,
+            },
+            statistic=statistic,
+            period=Duration.minutes(5),
+        )
+
     def _create_alarms(self):
         """CloudWatchアラームを作成"""
         
@@ -224,4 +301,34 @@ class MonitoringConstruct(Construct):
             datapoints_to_alarm=1,
             treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
         )
-        sfn_failure_alarm.add_alarm_action(cw_actions.SnsAction(self.alarm_topic))
\ No newline at end of file
+        sfn_failure_alarm.add_alarm_action(cw_actions.SnsAction(self.alarm_topic))
+
+        bedrock_config = self.config.get("bedrock", {})
+
+        # Bedrockの最初のトークンまでの時間（p99）アラーム
+        ttft_alarm = cloudwatch.Alarm(
+            self,
+            "BedrockTtftAlarm",
+            alarm_name=f"houkokusou-chatbot-{self.env_name}-bedrock-ttft-p99",
+            alarm_description="Bedrock time to first token p99 is high",
+            metric=self._bedrock_metric("BedrockTimeToFirstToken", cloudwatch.Stats.p(99)),
+            threshold=bedrock_config.get("ttft_p99_threshold_ms", 5000),
+            evaluation_periods=3,
+            datapoints_to_alarm=2,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        ttft_alarm.add_alarm_action(cw_actions.SnsAction(self.alarm_topic))
+
+        # 1回の呼び出しあたりのトークン数アラーム（プロンプトの肥大化・コスト増の検知）
+        tokens_alarm = cloudwatch.Alarm(
+            self,
+            "BedrockTokensPerRequestAlarm",
+            alarm_name=f"houkokusou-chatbot-{self.env_name}-bedrock-tokens-per-request",
+            alarm_description="Bedrock tokens per request is high",
+            metric=self._bedrock_metric("BedrockTokensPerRequest", cloudwatch.Stats.AVERAGE),
+            threshold=bedrock_config.get("tokens_per_request_threshold", 4000),
+            evaluation_periods=3,
+            datapoints_to_alarm=2,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        tokens_alarm.add_alarm_action(cw_actions.SnsAction(self.alarm_topic))
\ No newline at end of file
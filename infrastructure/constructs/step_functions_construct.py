@@ -11,6 +11,13 @@ from aws_cdk import (
 from constructs import Construct
 import json
 
+# 会話ごとの処理状態（processing/completed/error）を保持するアイテムのソートキー
+# 状態取得APIはこのアイテムを1回のGetItemで読む（やり取りのアイテムは時刻をソートキーに持つ）
+STATUS_SORT_KEY = "#status"
+
+# Expressワークフローで分析後の完了処理（組織マッチング・保存・通知・記録）に残す時間（秒）
+SYNC_COMPLETION_MARGIN_SECONDS = 2
+
 
 class StepFunctionsConstruct(Construct):
     """Step Functions構築用コンストラクト"""
@@ -37,8 +44,37 @@ class StepFunctionsConstruct(Construct):
         # CloudWatch Logsグループ作成
         self.log_group = self._create_log_group()
 
+        # Bedrock Analyzer（分析途中のテキスト）とNotification Sender（分析結果）からWebSocketへ送信できるようにする
+        self.websocket_api.grant_manage_connections(self.lambda_functions["bedrock_analyzer"])
+        self.websocket_api.grant_manage_connections(self.lambda_functions["notification_sender"])
+        batch_analyzer = self.lambda_functions.get("bedrock_batch_analyzer")
+        if batch_analyzer:
+            # キュー経由の分析はペイロードにWebSocketのURLを含まないため環境変数で渡す
+            self.websocket_api.grant_manage_connections(batch_analyzer)
+            batch_analyzer.add_environment("WEBSOCKET_URL", f"{self.websocket_api.api_endpoint}/{self.env_name}")
+
         # ステートマシン作成
         self.state_machine = self._create_state_machine()
+        if batch_analyzer:
+            # キュー経由で分析した結果は、このステートマシンで完了処理（組織マッチング・保存・通知）を行う
+            self.state_machine.grant_start_execution(batch_analyzer)
+            batch_analyzer.add_environment("STATE_MACHINE_ARN", self.state_machine.state_machine_arn)
+
+        # 短い相談を同期的に分析するExpressワークフロー（オプション）
+        self.express_state_machine = None
+        if self.config.get("express_enabled", False):
+            self.express_state_machine = self._create_express_state_machine()
+            input_handler = self.lambda_functions.get("input_handler")
+            if input_handler:
+                self.express_state_machine.grant_start_sync_execution(input_handler)
+
+        # 一括送信を1つの実行で分析するステートマシン（オプション）
+        self.batch_state_machine = None
+        if self.config.get("batch_enabled", False):
+            self.batch_state_machine = self._create_batch_state_machine()
+            input_handler = self.lambda_functions.get("input_handler")
+            if input_handler:
+                self.batch_state_machine.grant_start_execution(input_handler)
 
     def _create_log_group(self) -> logs.LogGroup:
         """CloudWatch Logsグループを作成"""
@@ -50,56 +86,319 @@ class StepFunctionsConstruct(Construct):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
-    def _create_state_machine(self) -> sfn.StateMachine:
-        """ステートマシンを作成"""
-        # 初期化タスク
-        initialize_task = tasks.DynamoUpdateItem(
+    def _analysis_payload(self, **extra) -> sfn.TaskInput:
+        """Bedrock分析Lambdaへの入力（Standard・Expressで共通、extraは経路ごとの追加項目）"""
+        return sfn.TaskInput.from_object({
+            "conversationId": sfn.JsonPath.string_at("$.conversationId"),
+            "message": sfn.JsonPath.string_at("$.message"),
+            "timestamp": sfn.JsonPath.string_at("$.timestamp"),
+            "context": sfn.JsonPath.object_at("$.context"),
+            "connectionId": sfn.JsonPath.string_at("$.connectionId"),
+            "websocketUrl": f"{self.websocket_api.api_endpoint}/{self.env_name}",
+            "bypassCache": sfn.JsonPath.object_at("$.bypassCache"),
+            "provisional": sfn.JsonPath.object_at("$.provisional"),
+            **extra,
+        })
+
+    def _apply_defaults(self, prefix: str = "") -> sfn.Chain:
+        """
+        入力にない項目を既定値で補う（入力の値が優先）
+        開始元（input_handler・キュー・WebSocket・API Gatewayの直接統合）によって含まれる項目が異なるため。
+        時刻がない場合（API Gatewayの直接統合）は実行開始時刻を使う
+        """
+        set_defaults = sfn.Pass(
             self,
-            "InitializeConversation",
-            table=self.tables["conversations"],
-            key={
-                "conversationId": tasks.DynamoAttributeValue.from_string(
-                    sfn.JsonPath.string_at("$.conversationId")
+            f"{prefix}SetDefaults",
+            parameters={
+                "timestamp.$": "$$.Execution.StartTime",
+                "connectionId": "",
+                "bypassCache": False,
+                # Noneは定義から省かれるため、組み込み関数でnullを作る
+                "provisional.$": "States.StringToJson('null')",
+                "context": {},
+                "userInfo": {},
+                "userId": "",
+                "recordTurn": False,
+            },
+            result_path="$.defaults",
+        )
+        apply_defaults = sfn.Pass(
+            self,
+            f"{prefix}ApplyDefaults",
+            parameters={
+                "input": sfn.JsonPath.json_merge(
+                    sfn.JsonPath.object_at("$.defaults"), sfn.JsonPath.object_at("$")
                 ),
             },
-            update_expression="SET #status = :status, #timestamp = :timestamp",
+            output_path="$.input",
+        )
+        return set_defaults.next(apply_defaults)
+
+    def _status_item_key(self) -> dict:
+        """会話の状態アイテムのキー"""
+        return {
+            "conversationId": tasks.DynamoAttributeValue.from_string(
+                sfn.JsonPath.string_at("$.conversationId")
+            ),
+            "timestamp": tasks.DynamoAttributeValue.from_string(STATUS_SORT_KEY),
+        }
+
+    def _create_express_state_machine(self) -> sfn.StateMachine:
+        """
+        StartSyncExecutionで呼び出すExpressワークフローを作成
+        Standardと同じ完了処理（組織マッチング・保存・通知・状態アイテムの記録）を行い、分析結果を返す
+        （失敗・期限切れの場合は呼び出し側がStandardの流れで分析し直す）
+        """
+        sync_deadline_seconds = self.config.get("sync_deadline_seconds", 8)
+        analyze_task = tasks.LambdaInvoke(
+            self,
+            "ExpressAnalyzeWithBedrock",
+            lambda_function=self.lambda_functions["bedrock_analyzer"],
+            # 期限切れ後も分析Lambdaは動き続けるため、ワークフローより短い期限を渡して結果を記録させない
+            # （呼び出し側がStandardで分析し直すため、記録・通知の重複を防ぐ）。
+            # 結果は応答で直接返すため、ストリーミングも行わない
+            payload=self._analysis_payload(
+                deadlineSeconds=max(1, sync_deadline_seconds - SYNC_COMPLETION_MARGIN_SECONDS),
+                stream=False,
+            ),
+            result_path="$.bedrockResult",
+            # 期限が短いため再試行しない
+            retry_on_service_exceptions=False,
+        )
+
+        # エラーを記録した後は実行を失敗させる（呼び出し側がStandardの流れで分析し直す）
+        failed = sfn.Fail(self, "ExpressAnalysisFailed", error="AnalysisFailed")
+        return_analysis = sfn.Pass(
+            self,
+            "ExpressReturnAnalysis",
+            output_path="$.bedrockResult.Payload",
+        )
+
+        definition = self._processing_chain("Express", analyze_task, analyze_task, failed).next(return_analysis)
+
+        return sfn.StateMachine(
+            self,
+            "ChatProcessorExpressStateMachine",
+            definition=definition,
+            state_machine_name=f"houkokusou-chatbot-processor-express-{self.env_name}",
+            state_machine_type=sfn.StateMachineType.EXPRESS,
+            timeout=Duration.seconds(sync_deadline_seconds),
+            logs=sfn.LogOptions(
+                destination=self.log_group,
+                level=sfn.LogLevel.ERROR,
+            ),
+            tracing_enabled=True,
+        )
+
+    def _create_batch_state_machine(self) -> sfn.StateMachine:
+        """
+        一括送信の各件をMap状態で並行して分析するステートマシンを作成
+        各件の状態（completed/error）は分析Lambdaが会話レコードに記録する
+        分析Lambda自体が失敗した件（タイムアウトなど）はここでエラーを記録し、他の件の分析を続ける
+        """
+        analyze_item = tasks.LambdaInvoke(
+            self,
+            "AnalyzeBatchItem",
+            lambda_function=self.lambda_functions["bedrock_analyzer"],
+            payload=sfn.TaskInput.from_json_path_at("$"),
+            # 出力は状態だけにして実行履歴のサイズを抑える
+            result_selector={
+                "conversationId.$": "$.Payload.conversationId",
+                "status.$": "$.Payload.status",
+            },
+            retry_on_service_exceptions=True,
+        )
+        analyze_item.add_retry(
+            errors=["States.TaskFailed"],
+            interval=Duration.seconds(5),
+            max_attempts=1,
+        )
+
+        record_item_error = tasks.DynamoUpdateItem(
+            self,
+            "RecordBatchItemError",
+            table=self.tables["conversations"],
+            key=self._status_item_key(),
+            update_expression="SET #status = :status, #error = :error, #updatedAt = :updatedAt",
             expression_attribute_names={
                 "#status": "status",
-                "#timestamp": "timestamp",
+                "#error": "error",
+                "#updatedAt": "updatedAt",
             },
             expression_attribute_values={
-                ":status": tasks.DynamoAttributeValue.from_string("processing"),
-                ":timestamp": tasks.DynamoAttributeValue.from_string(
+                ":status": tasks.DynamoAttributeValue.from_string("error"),
+                ":error": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$.error.Error")
+                ),
+                ":updatedAt": tasks.DynamoAttributeValue.from_string(
                     sfn.JsonPath.string_at("$$.State.EnteredTime")
                 ),
             },
-            result_path="$.initializeResult",
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        item_failed = sfn.Pass(
+            self,
+            "BatchItemFailed",
+            parameters={
+                "conversationId.$": "$.conversationId",
+                "status": "error",
+            },
+        )
+        analyze_item.add_catch(
+            record_item_error.next(item_failed),
+            errors=["States.ALL"],
+            result_path="$.error",
+        )
+
+        analyze_batch = sfn.Map(
+            self,
+            "AnalyzeBatch",
+            items_path="$.items",
+            max_concurrency=self.config.get("batch_max_concurrency", 5),
+            item_selector={
+                "batchId.$": "$.batchId",
+                "conversationId.$": "$$.Map.Item.Value.conversationId",
+                "message.$": "$$.Map.Item.Value.message",
+                "timestamp.$": "$$.Map.Item.Value.timestamp",
+                "bypassCache.$": "$$.Map.Item.Value.bypassCache",
+            },
+            result_path="$.results",
         )
+        analyze_batch.item_processor(analyze_item)
 
+        return sfn.StateMachine(
+            self,
+            "ChatBatchStateMachine",
+            definition=analyze_batch,
+            state_machine_name=f"houkokusou-chatbot-batch-{self.env_name}",
+            timeout=Duration.hours(2),
+            logs=sfn.LogOptions(
+                destination=self.log_group,
+                level=sfn.LogLevel.ERROR,
+            ),
+            tracing_enabled=True,
+        )
+
+    def _create_state_machine(self) -> sfn.StateMachine:
+        """ステートマシンを作成"""
         # Bedrock分析タスク
         bedrock_task = tasks.LambdaInvoke(
             self,
             "AnalyzeWithBedrock",
             lambda_function=self.lambda_functions["bedrock_analyzer"],
-            payload=sfn.TaskInput.from_object({
-                "conversationId": sfn.JsonPath.string_at("$.conversationId"),
-                "message": sfn.JsonPath.string_at("$.message"),
-                "context": sfn.JsonPath.object_at("$.context"),
-            }),
+            payload=self._analysis_payload(),
             result_path="$.bedrockResult",
             retry_on_service_exceptions=True,
-            retry=sfn.Retry(
-                errors=["States.TaskFailed"],
-                interval=Duration.seconds(2),
-                max_attempts=3,
-                backoff_rate=2,
+        )
+        # Bedrockの再試行・スロットリング対策はLambda内のクライアントで行うため、
+        # ここで重ねて再試行すると負荷を増幅する。想定外の失敗に1回だけ再試行する
+        bedrock_task.add_retry(
+            errors=["States.TaskFailed"],
+            interval=Duration.seconds(5),
+            max_attempts=1,
+        )
+
+        # キュー経由で分析済みの場合はBedrockを呼び出さず、分析結果をそのまま使う
+        use_queued_analysis = sfn.Pass(
+            self,
+            "UseQueuedAnalysis",
+            parameters={"Payload.$": "$.analysis"},
+            result_path="$.bedrockResult",
+        )
+        analyze = (
+            sfn.Choice(self, "HasAnalysis")
+            .when(sfn.Condition.is_present("$.analysis"), use_queued_analysis)
+            .otherwise(bedrock_task)
+            .afterwards()
+        )
+
+        # ステートマシン作成
+        return sfn.StateMachine(
+            self,
+            "ChatProcessorStateMachine",
+            definition=self._processing_chain("", bedrock_task, analyze),
+            state_machine_name=f"houkokusou-chatbot-processor-{self.env_name}",
+            logs=sfn.LogOptions(
+                destination=self.log_group,
+                level=sfn.LogLevel.ALL,
             ),
+            tracing_enabled=True,
+        )
+
+    def _processing_chain(
+        self,
+        prefix: str,
+        analyze_task: sfn.TaskStateBase,
+        analyze: sfn.IChainable,
+        after_error: sfn.IChainable = None,
+    ) -> sfn.Chain:
+        """
+        （やり取りの記録 →）受付の記録 → 分析 → 組織マッチング → 保存と通知 → 完了の記録（Standard・Expressで共通）
+        いずれかのタスクが失敗したら状態アイテムにエラーを記録し、after_errorがあれば続けて実行する
+        分析Lambdaは例外時にerrorを含む結果を返すため、その場合も完了として記録せずにエラーとして扱う
+        """
+        # やり取りの記録（API Gatewayの直接統合で開始した場合のみ。他の経路は開始元が記録する）
+        # 最初のやり取りの利用者が会話の所有者になるため、既にある会話には書き込まない
+        record_turn = tasks.DynamoPutItem(
+            self,
+            f"{prefix}RecordTurn",
+            table=self.tables["conversations"],
+            item={
+                "conversationId": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$.conversationId")
+                ),
+                "timestamp": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.timestamp")),
+                "message": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.message")),
+                "status": tasks.DynamoAttributeValue.from_string("processing"),
+                "userId": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at("$.userId")),
+            },
+            condition_expression="attribute_not_exists(conversationId)",
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        should_record_turn = (
+            sfn.Choice(self, f"{prefix}ShouldRecordTurn")
+            .when(sfn.Condition.boolean_equals("$.recordTurn", True), record_turn)
+            .afterwards(include_otherwise=True)
+        )
+
+        # 初期化タスク
+        initialize_task = tasks.DynamoUpdateItem(
+            self,
+            f"{prefix}InitializeConversation",
+            table=self.tables["conversations"],
+            key=self._status_item_key(),
+            # 同じ会話の前回の結果・エラーは消し、受付時の暫定結果を分析中の結果として持つ
+            update_expression=(
+                "SET #status = :status, #turn = :turn, #provisional = :provisional, "
+                "#updatedAt = :updatedAt REMOVE #result, #error"
+            ),
+            expression_attribute_names={
+                "#status": "status",
+                "#turn": "turnTimestamp",
+                "#provisional": "provisional",
+                "#updatedAt": "updatedAt",
+                "#result": "result",
+                "#error": "error",
+            },
+            expression_attribute_values={
+                ":status": tasks.DynamoAttributeValue.from_string("processing"),
+                ":turn": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$.timestamp")
+                ),
+                ":provisional": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.json_to_string(sfn.JsonPath.object_at("$.provisional"))
+                ),
+                ":updatedAt": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$$.State.EnteredTime")
+                ),
+            },
+            result_path=sfn.JsonPath.DISCARD,
         )
 
         # 組織マッチングタスク
         organization_task = tasks.LambdaInvoke(
             self,
-            "MatchOrganization",
+            f"{prefix}MatchOrganization",
             lambda_function=self.lambda_functions["organization_matcher"],
             payload=sfn.TaskInput.from_object({
                 "conversationId": sfn.JsonPath.string_at("$.conversationId"),
@@ -112,7 +411,7 @@ class StepFunctionsConstruct(Construct):
         # 結果保存とWebSocket通知の並列実行
         save_results = tasks.DynamoUpdateItem(
             self,
-            "SaveResults",
+            f"{prefix}SaveResults",
             table=self.tables["suggestions"],
             key={
                 "conversationId": tasks.DynamoAttributeValue.from_string(
@@ -125,8 +424,9 @@ class StepFunctionsConstruct(Construct):
                 "#status": "status",
             },
             expression_attribute_values={
-                ":suggestion": tasks.DynamoAttributeValue.from_json(
-                    sfn.JsonPath.object_at("$.organizationResult.Payload")
+                # 組織マッチングの結果はJSON文字列として保存する（状態アイテムの結果と同じ形式）
+                ":suggestion": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.json_to_string(sfn.JsonPath.object_at("$.organizationResult.Payload"))
                 ),
                 ":status": tasks.DynamoAttributeValue.from_string("completed"),
             },
@@ -135,13 +435,17 @@ class StepFunctionsConstruct(Construct):
 
         notify_client = tasks.LambdaInvoke(
             self,
-            "NotifyClient",
+            f"{prefix}NotifyClient",
             lambda_function=self.lambda_functions["notification_sender"],
             payload=sfn.TaskInput.from_object({
                 "connectionId": sfn.JsonPath.string_at("$.connectionId"),
                 "conversationId": sfn.JsonPath.string_at("$.conversationId"),
+                # 利用者はこのやり取りの記録から特定し、その利用者の全ての接続へ送る
+                "timestamp": sfn.JsonPath.string_at("$.timestamp"),
+                "status": "completed",
+                "analysis": sfn.JsonPath.object_at("$.bedrockResult.Payload"),
                 "suggestion": sfn.JsonPath.object_at("$.organizationResult.Payload"),
-                "websocketEndpoint": self.websocket_api.api_endpoint,
+                "websocketEndpoint": f"{self.websocket_api.api_endpoint}/{self.env_name}",
             }),
             result_path="$.notifyResult",
         )
@@ -149,7 +453,7 @@ class StepFunctionsConstruct(Construct):
         # 並列実行
         parallel_tasks = sfn.Parallel(
             self,
-            "SaveAndNotify",
+            f"{prefix}SaveAndNotify",
             result_path="$.parallelResults",
         )
         parallel_tasks.branch(save_results)
@@ -158,48 +462,110 @@ class StepFunctionsConstruct(Construct):
         # エラーハンドリング
         error_handler = tasks.DynamoUpdateItem(
             self,
-            "HandleError",
+            f"{prefix}HandleError",
             table=self.tables["conversations"],
-            key={
-                "conversationId": tasks.DynamoAttributeValue.from_string(
-                    sfn.JsonPath.string_at("$.conversationId")
-                ),
-            },
-            update_expression="SET #status = :status, #error = :error",
+            key=self._status_item_key(),
+            update_expression="SET #status = :status, #error = :error, #updatedAt = :updatedAt",
             expression_attribute_names={
                 "#status": "status",
                 "#error": "error",
+                "#updatedAt": "updatedAt",
             },
             expression_attribute_values={
                 ":status": tasks.DynamoAttributeValue.from_string("error"),
+                # catchの結果は {"Error", "Cause"}
                 ":error": tasks.DynamoAttributeValue.from_string(
-                    sfn.JsonPath.string_at("$.error")
+                    sfn.JsonPath.string_at("$.error.Error")
+                ),
+                ":updatedAt": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$$.State.EnteredTime")
                 ),
             },
         )
+        # エラーの記録で実行を終える（分析結果のエラーを判定するChoiceの後続につながらないように明示する）
+        if after_error is not None:
+            error_handler.next(after_error)
+        else:
+            # 失敗も利用者の接続へ通知する（状態取得APIと同じくerrorとして）
+            # after_errorがある場合（Express）は呼び出し側が分析し直すため通知しない
+            notify_error = tasks.LambdaInvoke(
+                self,
+                f"{prefix}NotifyError",
+                lambda_function=self.lambda_functions["notification_sender"],
+                payload=sfn.TaskInput.from_object({
+                    "connectionId": sfn.JsonPath.string_at("$.connectionId"),
+                    "conversationId": sfn.JsonPath.string_at("$.conversationId"),
+                    "timestamp": sfn.JsonPath.string_at("$.timestamp"),
+                    "status": "error",
+                    "error": sfn.JsonPath.string_at("$.error.Error"),
+                    "websocketEndpoint": f"{self.websocket_api.api_endpoint}/{self.env_name}",
+                }),
+                result_path=sfn.JsonPath.DISCARD,
+            )
+            error_recorded = sfn.Succeed(self, f"{prefix}ErrorRecorded")
+            # 通知に失敗してもエラーは記録済み
+            notify_error.add_catch(error_recorded, errors=["States.ALL"], result_path=sfn.JsonPath.DISCARD)
+            error_handler.next(notify_error).next(error_recorded)
 
-        # タスクチェーンの構築
-        definition = (
-            initialize_task
-            .next(bedrock_task)
-            .next(organization_task)
-            .next(parallel_tasks)
-            .add_catch(
+        # 分析結果を状態アイテムに記録（状態取得APIが実行履歴を参照せずに返せるように）
+        record_completed = tasks.DynamoUpdateItem(
+            self,
+            f"{prefix}RecordCompleted",
+            table=self.tables["conversations"],
+            key=self._status_item_key(),
+            update_expression="SET #status = :status, #result = :result, #updatedAt = :updatedAt REMOVE #provisional",
+            expression_attribute_names={
+                "#status": "status",
+                "#result": "result",
+                "#updatedAt": "updatedAt",
+                "#provisional": "provisional",
+            },
+            expression_attribute_values={
+                ":status": tasks.DynamoAttributeValue.from_string("completed"),
+                ":result": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.json_to_string(sfn.JsonPath.object_at("$.bedrockResult.Payload"))
+                ),
+                ":updatedAt": tasks.DynamoAttributeValue.from_string(
+                    sfn.JsonPath.string_at("$$.State.EnteredTime")
+                ),
+            },
+            result_path=sfn.JsonPath.DISCARD,
+        )
+
+        # いずれかのタスクが失敗したら状態アイテムにエラーを記録する
+        # （ChainにはCatchを付けられないため、タスクごとに付ける）
+        for task in (record_turn, initialize_task, analyze_task, organization_task, parallel_tasks, record_completed):
+            task.add_catch(
                 error_handler,
                 errors=["States.ALL"],
                 result_path="$.error",
             )
-        )
 
-        # ステートマシン作成
-        return sfn.StateMachine(
+        # 分析結果がエラーの場合は、catchの結果と同じ形にしてエラーの記録へ進む
+        analysis_error = sfn.Pass(
             self,
-            "ChatProcessorStateMachine",
-            definition=definition,
-            state_machine_name=f"houkokusou-chatbot-processor-{self.env_name}",
-            logs=sfn.LogOptions(
-                destination=self.log_group,
-                level=sfn.LogLevel.ALL,
-            ),
-            tracing_enabled=True,
-        )
\ No newline at end of file
+            f"{prefix}AnalysisError",
+            parameters={
+                "Error": "AnalysisFailed",
+                "Cause.$": "$.bedrockResult.Payload.error",
+            },
+            result_path="$.error",
+        )
+        analysis_error.next(error_handler)
+        check_analysis = (
+            sfn.Choice(self, f"{prefix}HasAnalysisError")
+            .when(sfn.Condition.is_present("$.bedrockResult.Payload.error"), analysis_error)
+            .afterwards(include_otherwise=True)
+        )
+
+        # タスクチェーンの構築
+        return (
+            self._apply_defaults(prefix)
+            .next(should_record_turn)
+            .next(initialize_task)
+            .next(analyze)
+            .next(check_analysis)
+            .next(organization_task)
+            .next(parallel_tasks)
+            .next(record_completed)
+        )
@@ -7,9 +7,13 @@ from aws_cdk import (
     aws_stepfunctions as sfn,
     aws_stepfunctions_tasks as tasks,
     Duration,
+    RemovalPolicy,
+    SymlinkFollowMode,
 )
 from constructs import Construct
 
+from infrastructure.constructs.step_functions_construct import SYNC_COMPLETION_MARGIN_SECONDS
+
 
 class HoukokusouChatbotStack(Stack):
     """報連相チャットボットのメインスタック（Bedrock対応版）"""
@@ -17,6 +21,17 @@ class HoukokusouChatbotStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, env_name: str, config: dict, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
+        # 共通Lambda Layer（キーワードマッチャー・報告ルール・Bedrockクライアント）
+        self.common_layer = lambda_.LayerVersion(
+            self,
+            "CommonLayer",
+            # data/organization_structure.json はシンボリックリンクで同梱
+            code=lambda_.Code.from_asset("src/lambda/layers/common", follow_symlinks=SymlinkFollowMode.ALWAYS),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+            description="共通ライブラリとユーティリティ",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        
         # 1. Lambda関数の作成
         # Input Handler Lambda
         self.input_handler = lambda_.Function(
@@ -26,6 +41,7 @@ class HoukokusouChatbotStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("src/lambda/api/input_handler"),
+            layers=[self.common_layer],
             timeout=Duration.seconds(30),
             memory_size=256,
             environment={
@@ -41,6 +57,7 @@ class HoukokusouChatbotStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("src/lambda/api/status_handler"),
+            layers=[self.common_layer],
             timeout=Duration.seconds(30),
             memory_size=256,
             environment={
@@ -56,10 +73,13 @@ class HoukokusouChatbotStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("src/lambda/processors/bedrock_analyzer"),
+            layers=[self.common_layer],
             timeout=Duration.seconds(60),
             memory_size=512,
             environment={
                 "ENVIRONMENT": env_name,
+                "POWERTOOLS_SERVICE_NAME": "houkokusou-chatbot",
+                "POWERTOOLS_METRICS_NAMESPACE": "HoukokusouChatbot",
             }
         )
         
@@ -94,17 +114,79 @@ class HoukokusouChatbotStack(Stack):
             state_machine_name=f"houkokusou-chatbot-{env_name}-processor",
         )
         
+        # 短い相談を同期的に分析するExpressワークフロー（期限内に終わらなければ非同期の流れへ）
+        step_functions_config = config.get("step_functions", {})
+        self.express_state_machine = None
+        if step_functions_config.get("express_enabled", False):
+            sync_deadline_seconds = step_functions_config.get("sync_deadline_seconds", 8)
+            # StepFunctionsConstructのExpressワークフローと同じく、ワークフローより短い期限を分析Lambdaに渡す
+            # （期限切れ後も分析Lambdaは動き続けるため、呼び出し側がStandardで分析し直す分と記録を重複させない）
+            set_sync_options = sfn.Pass(
+                self,
+                "ExpressSetSyncOptions",
+                parameters={
+                    "deadlineSeconds": max(1, sync_deadline_seconds - SYNC_COMPLETION_MARGIN_SECONDS),
+                    "stream": False,
+                },
+                result_path="$.syncOptions",
+            )
+            apply_sync_options = sfn.Pass(
+                self,
+                "ExpressApplySyncOptions",
+                parameters={
+                    "input": sfn.JsonPath.json_merge(
+                        sfn.JsonPath.object_at("$"), sfn.JsonPath.object_at("$.syncOptions")
+                    ),
+                },
+                output_path="$.input",
+            )
+            express_analyze_task = tasks.LambdaInvoke(
+                self,
+                "ExpressAnalyzeWithBedrock",
+                lambda_function=self.bedrock_analyzer,
+                output_path="$.Payload",
+                # 期限が短いため再試行しない
+                retry_on_service_exceptions=False,
+            )
+            # 分析Lambdaは例外時にerrorを含む結果を返すため、完了として返さずに失敗させる
+            express_analysis_failed = sfn.Fail(self, "ExpressAnalysisFailed", error="AnalysisFailed")
+            express_definition = (
+                set_sync_options
+                .next(apply_sync_options)
+                .next(express_analyze_task)
+                .next(
+                    sfn.Choice(self, "ExpressHasAnalysisError")
+                    .when(sfn.Condition.is_present("$.error"), express_analysis_failed)
+                    .otherwise(sfn.Succeed(self, "ExpressAnalysisSucceeded"))
+                )
+            )
+            self.express_state_machine = sfn.StateMachine(
+                self,
+                "ChatProcessorExpressStateMachine",
+                definition=express_definition,
+                state_machine_name=f"houkokusou-chatbot-{env_name}-processor-express",
+                state_machine_type=sfn.StateMachineType.EXPRESS,
+                timeout=Duration.seconds(sync_deadline_seconds),
+            )
+            self.express_state_machine.grant_start_sync_execution(self.input_handler)
+            self.input_handler.add_environment(
+                "EXPRESS_STATE_MACHINE_ARN", self.express_state_machine.state_machine_arn
+            )
+            self.input_handler.add_environment("SYNC_DEADLINE_SECONDS", str(sync_deadline_seconds))
+            self.input_handler.add_environment(
+                "SYNC_MAX_CHARS", str(step_functions_config.get("sync_max_chars", 400))
+            )
+        
         # ★ Step Functions権限を付与
         # Input HandlerにStep Functions実行権限を付与
         self.state_machine.grant_start_execution(self.input_handler)
-        
-        # Status HandlerにStep Functions読み取り権限を付与
+
+        # Status HandlerにStep Functions読み取り権限を付与（状態アイテムがない会話のフォールバック用）
         self.status_handler.add_to_role_policy(
             iam.PolicyStatement(
                 actions=[
                     "states:DescribeExecution",
                     "states:GetExecutionHistory",
-                    "sts:GetCallerIdentity",
                 ],
                 resources=["*"],
             )
@@ -115,7 +197,7 @@ class HoukokusouChatbotStack(Stack):
         
         # ★ Status Handlerの環境変数にState Machine ARNを追加
         self.status_handler.add_environment("STATE_MACHINE_ARN", self.state_machine.state_machine_arn)
-        
+
         # 3. API Gatewayの作成
         self.api = apigateway.RestApi(
             self,
@@ -125,7 +207,7 @@ class HoukokusouChatbotStack(Stack):
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=["*"],
                 allow_methods=["GET", "POST", "OPTIONS"],
-                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token"],
+                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token", "Idempotency-Key"],
             ),
         )
         
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+ローカル用のBedrock Runtimeエミュレーター
+
+実際のトークンを消費せずにbedrock_analyzerの負荷試験・再試行・並列化の検証を
+行うためのもの。boto3のendpoint_urlで向け先を変えるだけで使える。
+
+対応API:
+    POST /model/{modelId}/invoke                       （invoke_model）
+    POST /model/{modelId}/invoke-with-response-stream  （invoke_model_with_response_stream）
+
+応答:
+    - Anthropic Messagesモデル: ANALYSIS_PROMPT_TEMPLATEの回答形式に沿ったJSON
+      （要約用プロンプトには要約テキスト）
+    - Titan Embeddingsモデル: 入力テキストから決まる疑似的な埋め込みベクトル
+
+遅延・スロットリング・エラーは引数で指定し、--seedで再現できる。
+
+使い方:
+    python scripts/utils/bedrock_emulator.py --port 8787 --latency-ms 800 --throttle-rate 0.05
+    BEDROCK_ENDPOINT_URL=http://localhost:8787 AWS_ACCESS_KEY_ID=dummy AWS_SECRET_ACCESS_KEY=dummy ...
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+CATEGORY_RULES = [
+    ("技術的な問題", ["エラー", "バグ", "不具合", "システム", "障害"], "開発部", "開発マネージャー"),
+    ("人事・組織", ["人事", "異動", "評価", "休暇", "退職"], "人事部", "人事担当"),
+    ("業務相談", ["業務", "プロジェクト", "タスク", "顧客", "予算"], "営業部", "営業課長"),
+]
+URGENT_WORDS = ["緊急", "至急", "今すぐ", "大至急"]
+
+
+class EmulatorConfig:
+    """遅延・エラー注入の設定（全リクエストで共有する乱数は再現性のためロックで保護）"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """1リクエスト分の乱数をまとめて引く（スレッドの実行順に依存しないよう一度に）"""
+        with self.lock:
+            return {
+                "latency": self._latency_ms(),
+                "fault": self.random.random(),
+                "stall": self.random.random(),
+                "seed": self.random.getrandbits(32),
+            }
+
+    def _latency_ms(self):
+        args = self.args
+        if args.latency_dist == "fixed":
+            return args.latency_ms
+        if args.latency_dist == "uniform":
+            return self.random.uniform(args.latency_ms * (1 - args.latency_spread), args.latency_ms * (1 + args.latency_spread))
+        # 対数正規分布（latency_msが中央値）。実際の応答時間は右に裾が長い
+        return args.latency_ms * math.exp(self.random.gauss(0, args.latency_sigma))
+
+
+def extract_prompt(request):
+    """Messages API形式のリクエストからユーザーのプロンプトを取り出す"""
+    texts = []
+    for message in request.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        texts.append(content)
+    return "\n".join(texts)
+
+
+def build_analysis_text(prompt, rng):
+    """ANALYSIS_PROMPT_TEMPLATEの回答形式に沿ったJSONテキストを作成"""
+    match = re.search(r"■ ユーザーからの相談:\n(.*?)\n\n", prompt, re.S)
+    message = match.group(1).strip() if match else prompt[:200]
+
+    category, department, role = "その他", "所属部署", "直属の上司"
+    keywords = []
+    for name, words, rule_department, rule_role in CATEGORY_RULES:
+        found = [word for word in words if word in message]
+        if found:
+            category, department, role = name, rule_department, rule_role
+            keywords = found
+            break
+
+    urgency = "高" if any(word in message for word in URGENT_WORDS) else rng.choice(["中", "低"])
+    summary = message[:40] + ("…" if len(message) > 40 else "")
+    return json.dumps({
+        "suggested_message": f"{role}へ: {summary} について報告・相談させてください。現状と影響範囲を整理した上で、今後の対応についてご判断をお願いします。",
+        "category": category,
+        "urgency": urgency,
+        "recommended_recipients": [
+            {"department": department, "role": role, "reason": f"{category}の一次窓口のため"}
+        ],
+        "keywords": keywords or ["報告"],
+        "additional_notes": "事実と推測を分けて伝えると判断が早くなります。",
+        "confidence": round(rng.uniform(0.5, 0.95), 2),
+    }, ensure_ascii=False, indent=2)
+
+
+def build_response_text(prompt, rng):
+    """プロンプトの種類に応じた応答テキスト"""
+    if "■ ユーザーからの相談:" in prompt:
+        return build_analysis_text(prompt, rng)
+    # 要約などその他のプロンプト
+    return "これまでの相談の要約: " + re.sub(r"\s+", " ", prompt[-200:]).strip()[:150]
+
+
+def build_embedding(text, dimensions):
+    """入力テキストから決まる正規化済みの疑似埋め込み（同じ入力は同じベクトル）"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def encode_event(headers, payload):
+    """AWSイベントストリーム形式（application/vnd.amazon.eventstream）の1メッセージ"""
+    header_bytes = b""
+    for name, value in headers.items():
+        name_bytes = name.encode("utf-8")
+        value_bytes = value.encode("utf-8")
+        # 値の型7 = 文字列
+        header_bytes += struct.pack(">B", len(name_bytes)) + name_bytes + struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+
+    total_length = 12 + len(header_bytes) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(header_bytes))
+    prelude += struct.pack(">I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + header_bytes + payload
+    return message + struct.pack(">I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+def chunk_event(body):
+    """Bedrockのストリーミング応答のチャンクイベント"""
+    payload = json.dumps({"bytes": base64.b64encode(json.dumps(body, ensure_ascii=False).encode("utf-8")).decode("ascii")})
+    return encode_event(
+        {":event-type": "chunk", ":content-type": "application/json", ":message-type": "event"},
+        payload.encode("utf-8"),
+    )
+
+
+class BedrockEmulatorHandler(BaseHTTPRequestHandler):
+    config = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.config.args.quiet:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        match = re.fullmatch(r"/model/([^/]+)/(invoke|invoke-with-response-stream)", self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not match:
+            return self.send_error_response(404, "ResourceNotFoundException", f"Unknown path: {self.path}")
+
+        model_id = unquote(match.group(1))
+        streaming = match.group(2) == "invoke-with-response-stream"
+        args = self.config.args
+        draw = self.config.draw()
+        rng = random.Random(draw["seed"])
+
+        # エラー注入（リクエストを受け付けた直後に返す）
+        fault = draw["fault"]
+        if fault < args.throttle_rate:
+            return self.send_error_response(429, "ThrottlingException", "Too many requests, please wait before trying again.")
+        fault -= args.throttle_rate
+        if fault < args.error_rate:
+            return self.send_error_response(503, "ServiceUnavailableException", "Service unavailable.")
+        fault -= args.error_rate
+        if fault < args.timeout_rate:
+            time.sleep(args.timeout_ms / 1000)
+            return self.send_error_response(408, "ModelTimeoutException", "Model has timed out in processing the request.")
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_error_response(400, "ValidationException", "Malformed input request.")
+
+        # 最初のトークンまでの時間（数秒単位の停止をまれに混ぜる）
+        ttft_ms = args.ttft_ms if args.ttft_ms is not None else draw["latency"] * 0.3
+        if draw["stall"] < args.stall_rate:
+            ttft_ms += args.stall_ms
+
+        if "titan-embed" in model_id:
+            time.sleep(ttft_ms / 1000)
+            text = request.get("inputText", "")
+            return self.send_json(200, {
+                "embedding": build_embedding(text, int(request.get("dimensions", 1024))),
+                "inputTextTokenCount": len(text),
+            })
+
+        prompt = extract_prompt(request)
+        text = build_response_text(prompt, rng)
+        input_tokens, output_tokens = len(prompt), len(text)
+        seconds_per_token = 1 / args.tokens_per_sec
+
+        if not streaming:
+            # 非ストリーミングは生成が終わるまで待ってから応答
+            time.sleep((ttft_ms + output_tokens * seconds_per_token * 1000) / 1000)
+            return self.send_json(200, {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": model_id,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("x-amzn-bedrock-content-type", "application/json")
+        self.end_headers()
+
+        started = time.monotonic()
+        time.sleep(ttft_ms / 1000)
+        first_token_ms = (time.monotonic() - started) * 1000
+        try:
+            self.write_chunk(chunk_event({
+                "type": "message_start",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant", "model": model_id,
+                    "content": [], "stop_reason": None, "usage": {"input_tokens": input_tokens, "output_tokens": 0},
+                },
+            }))
+            self.write_chunk(chunk_event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}))
+            for start in range(0, len(text), args.chunk_chars):
+                delta = text[start:start + args.chunk_chars]
+                time.sleep(len(delta) * seconds_per_token)
+                self.write_chunk(chunk_event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}}))
+            self.write_chunk(chunk_event({"type": "content_block_stop", "index": 0}))
+            self.write_chunk(chunk_event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": output_tokens}}))
+            self.write_chunk(chunk_event({
+                "type": "message_stop",
+                "amazon-bedrock-invocationMetrics": {
+                    "inputTokenCount": input_tokens,
+                    "outputTokenCount": output_tokens,
+                    "invocationLatency": int((time.monotonic() - started) * 1000),
+                    "firstByteLatency": int(first_token_ms),
+                },
+            }))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアント側で閉じられた（ヘッジで負けた場合など）
+            pass
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_response(self, status, error_type, message):
+        """botocoreはx-amzn-ErrorTypeヘッダーからエラーコードを判定する"""
+        data = json.dumps({"message": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("x-amzn-ErrorType", f"{error_type}:http://internal.amazon.com/coral/com.amazon.bedrock/")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード（同じ順序のリクエストには同じ遅延・エラーを返す）")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=800, help="応答時間の中央値（ms）")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="対数正規分布のσ")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="一様分布の幅（中央値に対する割合）")
+    parser.add_argument("--ttft-ms", type=float, default=None, help="最初のトークンまでの時間（省略時は応答時間の30%%）")
+    parser.add_argument("--tokens-per-sec", type=float, default=60, help="生成速度（1文字≒1トークン）")
+    parser.add_argument("--chunk-chars", type=int, default=8, help="ストリーミング時の1チャンクの文字数")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="ThrottlingExceptionを返す割合")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="ServiceUnavailableExceptionを返す割合")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="ModelTimeoutExceptionを返す割合")
+    parser.add_argument("--timeout-ms", type=float, default=5000, help="ModelTimeoutExceptionを返すまでの時間")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="最初のトークンの前に長く止まる割合")
+    parser.add_argument("--stall-ms", type=float, default=4000, help="停止する時間")
+    parser.add_argument("--quiet", action="store_true", help="アクセスログを出力しない")
+    args = parser.parse_args()
+
+    BedrockEmulatorHandler.config = EmulatorConfig(args)
+    server = ThreadingHTTPServer((args.host, args.port), BedrockEmulatorHandler)
+    print(f"Bedrock emulator listening on http://{args.host}:{args.port} (seed={args.seed})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+キーワード抽出のベンチマーク
+
+- 辞書の読み込み時間（コールドスタート相当: mmapで開いて最初の1件を抽出するまで）
+- 分割の処理速度（tokens/sec）と1件あたりの抽出時間
+
+使い方:
+    python scripts/utils/benchmark_keyword_extractor.py [--iterations 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAYER_PATH = os.path.join(ROOT, "src", "lambda", "layers", "common", "python")
+sys.path.insert(0, LAYER_PATH)
+
+from utils.keyword_extractor import load_extractor  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    "至急！顧客からクレームが入り、システム障害で納品が遅れています。開発部の部長に報告すべきでしょうか？",
+    "来月の予算について経営企画部に相談したいです。新規プロジェクトのコスト見積もりが必要です。",
+    "体調不良のため明日休暇を取りたいのですが、引き継ぎは誰に連絡すればよいですか。",
+    "本番環境のデータベースでエラーが出ています。影響範囲を調査中で、原因はまだ分かっていません。",
+    "会議室のプロジェクターが故障しています。総務部に依頼すればよいでしょうか。",
+]
+
+# 新しいプロセスで辞書を開き、最初の抽出が終わるまでの時間を測る
+COLD_START_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {layer_path!r})
+from utils.keyword_extractor import load_extractor
+extractor = load_extractor()
+loaded = time.perf_counter()
+extractor.extract({message!r})
+first = time.perf_counter()
+print((loaded - start) * 1000, (first - start) * 1000)
+"""
+
+
+def load_corpus():
+    """サンプル相談と報告テンプレートを計測用の本文にする"""
+    with open(os.path.join(ROOT, "data", "organization_structure.json"), encoding="utf-8") as f:
+        templates = [item["template"] for item in json.load(f).get("communicationTemplates", [])]
+    return SAMPLE_MESSAGES + templates
+
+
+def measure_cold_start(runs):
+    """コールドスタート相当の時間（ms）を複数回計測"""
+    load_times, first_times = [], []
+    code = COLD_START_SNIPPET.format(layer_path=LAYER_PATH, message=SAMPLE_MESSAGES[0])
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        load_ms, first_ms = map(float, output.split())
+        load_times.append(load_ms)
+        first_times.append(first_ms)
+    return load_times, first_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200, help="コーパス全体を処理する回数")
+    parser.add_argument("--cold-runs", type=int, default=5, help="コールドスタートの計測回数")
+    args = parser.parse_args()
+
+    load_times, first_times = measure_cold_start(args.cold_runs)
+    print(f"Cold start (median of {args.cold_runs}):")
+    print(f"  import + mmap load : {statistics.median(load_times):.2f} ms")
+    print(f"  until first result : {statistics.median(first_times):.2f} ms")
+
+    extractor = load_extractor()
+    corpus = load_corpus()
+    characters = sum(len(text) for text in corpus)
+
+    tokens = 0
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        for text in corpus:
+            message_start = time.perf_counter()
+            tokens += len(extractor.tokenize(text))
+            extractor.extract(text)
+            latencies.append((time.perf_counter() - message_start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Throughput ({args.iterations} x {len(corpus)} messages, {characters} chars each pass):")
+    print(f"  tokens/sec         : {tokens / elapsed:,.0f}")
+    print(f"  chars/sec          : {characters * args.iterations / elapsed:,.0f}")
+    print(f"  per message p50    : {latencies[len(latencies) // 2]:.3f} ms (tokenize + extract)")
+    print(f"  per message p99    : {latencies[int(len(latencies) * 0.99)]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
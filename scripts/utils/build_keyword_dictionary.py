@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+キーワード辞書（data/keyword_dictionary.tsv）と報告ルールの語を、
+共通Layerに同梱するメモリマップ用のバイナリ辞書に変換する
+
+使い方:
+    python scripts/utils/build_keyword_dictionary.py
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, "src", "lambda", "layers", "common", "python"))
+
+from utils.keyword_extractor import POS_NAMES, POS_NOUN, POS_PROPER, encode_dictionary  # noqa: E402
+
+# 報告ルールの語は部署の振り分けに使うため重みを高くする
+RULE_KEYWORD_WEIGHT = 3
+
+
+def load_tsv(path):
+    """見出し語<TAB>品詞<TAB>重み の行を読み込む（#で始まる行はコメント）"""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            try:
+                word, pos, weight = line.split("\t")
+                entries.append((word, POS_NAMES[pos], int(weight)))
+            except (ValueError, KeyError):
+                raise SystemExit(f"{path}:{line_number}: invalid entry: {line!r}")
+    return entries
+
+
+def load_rule_entries(path):
+    """報告ルールのキーワード・部署名・役職名を辞書の語として取り出す"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    entries = []
+    for rule in data.get("reportingRules", []):
+        entries += [(keyword, POS_NOUN, RULE_KEYWORD_WEIGHT) for keyword in rule.get("keywords", [])]
+    for department in data.get("organization", {}).get("departments", []):
+        entries.append((department["name"], POS_PROPER, RULE_KEYWORD_WEIGHT))
+        entries += [(role["title"], POS_PROPER, RULE_KEYWORD_WEIGHT) for role in department.get("roles", []) if role.get("title")]
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=os.path.join(ROOT, "data", "keyword_dictionary.tsv"))
+    parser.add_argument("--rules", default=os.path.join(ROOT, "data", "organization_structure.json"))
+    parser.add_argument(
+        "--output",
+        default=os.path.join(ROOT, "src", "lambda", "layers", "common", "python", "data", "keyword_dictionary.bin"),
+    )
+    args = parser.parse_args()
+
+    # 同じ語はルール側の設定を優先（後に追加したものが残る）
+    entries = load_tsv(args.source) + load_rule_entries(args.rules)
+    data = encode_dictionary(entries)
+
+    with open(args.output, "wb") as f:
+        f.write(data)
+
+    print(f"Wrote {args.output}: {len({word for word, _, _ in entries})} entries, {len(data)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 // src/frontend/src/app/services/chat.service.ts
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpHeaders } from '@angular/common/http';
-import { BehaviorSubject, Observable, interval, firstValueFrom } from 'rxjs';
-import { switchMap, takeWhile } from 'rxjs/operators';
+import { BehaviorSubject, Observable, defer, firstValueFrom } from 'rxjs';
+import { repeat, takeWhile } from 'rxjs/operators';
 import { environment } from '../../environments/environment';
 
 export interface ChatResponse {
@@ -22,6 +22,11 @@ export interface AnalysisResponse {
     error?: string;
 }
 
+// 状態取得のロングポーリングで1回に待つ秒数（サーバー側の上限は20秒）
+const STATUS_WAIT_SECONDS = 20;
+// ロングポーリングの最大回数（約2分で打ち切る）
+const STATUS_MAX_POLLS = 6;
+
 @Injectable({
     providedIn: 'root'
 })
@@ -88,9 +93,9 @@ export class ChatService {
     }
 
     private startPolling(conversationId: string) {
-        // 30秒間、2秒間隔でポーリング
-        const polling$ = interval(2000).pipe(
-            switchMap(() => this.getAnalysisStatus(conversationId)),
+        // 状態が変わるまでサーバー側で待つため、応答が返ったらすぐ次のリクエストを送る
+        const polling$ = defer(() => this.getAnalysisStatus(conversationId, STATUS_WAIT_SECONDS)).pipe(
+            repeat(STATUS_MAX_POLLS),
             takeWhile((response) => response.status === 'processing', true)
         );
 
@@ -112,10 +117,12 @@ export class ChatService {
         });
     }
 
-    private async getAnalysisStatus(conversationId: string): Promise<AnalysisResponse> {
+    private async getAnalysisStatus(conversationId: string, waitSeconds = 0): Promise<AnalysisResponse> {
         try {
             const response = await firstValueFrom(
-                this.http.get<AnalysisResponse>(`${this.apiUrl}/${conversationId}/status`)
+                this.http.get<AnalysisResponse>(`${this.apiUrl}/${conversationId}/status`, {
+                    params: { waitSeconds: String(waitSeconds) }
+                })
             );
             return response;
         } catch (error) {
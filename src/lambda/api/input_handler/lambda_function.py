@@ -1,14 +1,90 @@
+import base64
 import json
 import os
 import uuid
 from datetime import datetime
 import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.config import Config
+from aws_lambda_powertools.utilities.idempotency import (
+    DynamoDBPersistenceLayer,
+    IdempotencyConfig,
+    idempotent_function,
+)
+from aws_lambda_powertools.utilities.idempotency.exceptions import (
+    IdempotencyAlreadyInProgressError,
+    IdempotencyValidationError,
+)
+
+from utils.conversation_access import can_access_conversation
+from utils.conversation_status import mark_error, mark_processing, processing_item
+from utils.http_cache import build_etag, etag_matches
+from utils.reporting_rules import ReportingRules
 
 # Step Functionsクライアント
 stepfunctions = boto3.client('stepfunctions')
 
+# SQSクライアント
+sqs = boto3.client('sqs')
+
 # 環境変数
 STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN', '')
+ANALYSIS_QUEUE_URL = os.environ.get('ANALYSIS_QUEUE_URL', '')  # 設定時はキュー経由でまとめて分析
+EXPRESS_STATE_MACHINE_ARN = os.environ.get('EXPRESS_STATE_MACHINE_ARN', '')  # 設定時は短い相談を同期的に分析
+SYNC_DEADLINE_SECONDS = float(os.environ.get('SYNC_DEADLINE_SECONDS', '8'))
+SYNC_MAX_CHARS = int(os.environ.get('SYNC_MAX_CHARS', '400'))
+CONVERSATION_TABLE_NAME = os.environ.get('CONVERSATION_TABLE_NAME', '')
+IDEMPOTENCY_TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME', '')  # 未設定の場合は重複送信を判定しない
+IDEMPOTENCY_EXPIRES_SECONDS = int(os.environ.get('IDEMPOTENCY_EXPIRES_SECONDS', '3600'))
+BATCH_STATE_MACHINE_ARN = os.environ.get('BATCH_STATE_MACHINE_ARN', '')  # 一括送信（Map状態で分析）
+BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES', '100'))
+
+# 一括送信の会話を検索するインデックス
+BATCH_INDEX_NAME = 'batchId-timestamp-index'
+
+# Step Functionsの実行入力の上限（256KB）
+MAX_EXECUTION_INPUT_BYTES = 256 * 1024
+
+# 会話履歴のページサイズ
+HISTORY_DEFAULT_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# 会話履歴で返す属性（画面に表示するものだけ。ルーティング記録や使用量は返さない）
+HISTORY_PROJECTION = [
+    "#timestamp",
+    "message",
+    "response",
+    "#status",
+    "category",
+    "urgency",
+    "recommendedRecipient"
+]
+
+# 同期実行用（ワークフローの期限を少し超えたら応答を待たない）
+stepfunctions_sync = boto3.client(
+    'stepfunctions',
+    config=Config(read_timeout=SYNC_DEADLINE_SECONDS + 2, retries={"max_attempts": 1})
+)
+
+# クライアントが再送時に同じ値を付けるヘッダー
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+CORS_HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": f"Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,{IDEMPOTENCY_HEADER}",
+    "Access-Control-Allow-Methods": "OPTIONS,POST,GET"
+}
+
+dynamodb = boto3.resource('dynamodb')
+conversations_table = dynamodb.Table(CONVERSATION_TABLE_NAME) if CONVERSATION_TABLE_NAME else None
+
+# 報告ルール（暫定結果の作成用。コールドスタート時に1回だけ読み込む）
+try:
+    reporting_rules = ReportingRules.load()
+except (OSError, ValueError) as e:
+    print(f"Failed to load reporting rules: {str(e)}")
+    reporting_rules = None
 
 def lambda_handler(event, context):
     """
@@ -16,13 +92,26 @@ def lambda_handler(event, context):
     """
     print(f"Event: {json.dumps(event)}")
     
+    if idempotency_config is not None:
+        # 処理中レコードの有効期限をLambdaの残り時間に合わせる
+        idempotency_config.register_lambda_context(context)
+    
     try:
         # HTTPメソッドをチェック
         http_method = event.get("httpMethod", "")
         
-        if http_method == "GET":
+        path_parameters = event.get("pathParameters") or {}
+        is_batch = event.get("resource", "").startswith("/api/v1/chat/batch")
+        
+        if http_method == "GET" and is_batch:
+            # GET リクエスト - 一括送信の状態取得
+            return handle_get_batch(path_parameters.get("batchId", ""))
+        elif http_method == "GET":
             # GET リクエスト - 会話履歴取得（簡易実装）
             return handle_get_conversation(event)
+        elif http_method == "POST" and is_batch:
+            # POST リクエスト - 一括送信
+            return handle_post_batch(event)
         elif http_method == "POST":
             # POST リクエスト - メッセージ送信
             return handle_post_message(event)
@@ -54,45 +143,132 @@ def handle_post_message(event):
     """POSTリクエスト - メッセージ送信処理"""
     # リクエストボディの解析
     body = json.loads(event.get("body", "{}"))
-    message = body.get("message", "")
+    request = {
+        "message": body.get("message", ""),
+        # WebSocket接続ID（指定された場合は分析途中の結果をプッシュする）
+        "connectionId": body.get("connectionId", ""),
+        # 分析結果キャッシュを使わずに再分析する場合はtrue
+        "bypassCache": bool(body.get("bypassCache", False)),
+        # 指定された場合は既存の会話の続きとして扱う
+        "conversationId": body.get("conversationId", ""),
+        # 新しい会話の場合の会話IDと受付時刻（分析を開始できなかった場合も同じ値を返す。再送の判定には使わない）
+        "newConversationId": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat(),
+        # 再送の判定に使うキー（別ユーザーのキーと衝突しないようユーザーIDと組み合わせる）
+        "idempotencyKey": get_header(event, IDEMPOTENCY_HEADER),
+        "userId": get_user_id(event)
+    }
     
-    # 会話IDの生成
-    conversation_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().isoformat()
+    # 他の利用者の会話には続けて送信できない（存在を知らせないよう404で返す）
+    if request["conversationId"] and not check_conversation_access(request["conversationId"], request["userId"]):
+        return error_response(404, "Conversation not found")
     
-    # Step Functionsを開始する場合
-    if STATE_MACHINE_ARN:
-        try:
-            # Step Functions実行
-            execution = stepfunctions.start_execution(
-                stateMachineArn=STATE_MACHINE_ARN,
-                name=f"chat-{conversation_id}",
-                input=json.dumps({
-                    "conversationId": conversation_id,
-                    "message": message,
-                    "timestamp": timestamp
-                })
-            )
-            
-            response_body = {
-                "conversationId": conversation_id,
-                "status": "processing",
-                "message": "分析を開始しました",
-                "executionArn": execution['executionArn'],
-                "timestamp": timestamp
-            }
-            status_code = 202  # Accepted
-            
-        except Exception as e:
-            print(f"Step Functions error: {str(e)}")
-            # Step Functionsが失敗した場合は通常のレスポンス
-            response_body = {
+    try:
+        if request["idempotencyKey"] and idempotency_config is not None:
+            # 同じキーの再送には最初の応答をそのまま返す（分析は再実行しない）
+            response_body = start_analysis_idempotent(request=request)
+        else:
+            response_body = start_analysis(request)
+        status_code = 202 if response_body["status"] == "processing" else 200
+    except IdempotencyAlreadyInProgressError:
+        return error_response(409, "A request with the same Idempotency-Key is in progress")
+    except IdempotencyValidationError:
+        return error_response(422, "Idempotency-Key was already used with a different request")
+    except Exception as e:
+        print(f"Failed to start analysis: {str(e)}")
+        # 分析を開始できなかった場合は通常のレスポンス（同じキーで再送すれば再度開始を試みる）
+        conversation_id = request["conversationId"] or request["newConversationId"]
+        record_failed(conversation_id, request["timestamp"], str(e))
+        response_body = {
+            "conversationId": conversation_id,
+            "status": "received",
+            "message": f"メッセージを受信しました: {request['message']}",
+            "timestamp": request["timestamp"]
+        }
+        status_code = 200
+    
+    return {
+        "statusCode": status_code,
+        "headers": CORS_HEADERS,
+        "body": json.dumps(response_body, ensure_ascii=False)
+    }
+
+def start_analysis(request):
+    """
+    会話IDを決めて分析を開始し、応答ボディを返す
+    開始に失敗した場合は例外を送出する（冪等性レコードに失敗を保存しないため）
+    """
+    message = request["message"]
+    connection_id = request["connectionId"]
+    bypass_cache = request["bypassCache"]
+    
+    # 会話ID（指定された場合は既存の会話の続きとして扱う）
+    conversation_id = request["conversationId"] or request["newConversationId"]
+    timestamp = request["timestamp"]
+    # 同じ会話の2回目以降は実行名が重複しないよう連番代わりの接尾辞を付ける
+    execution_name = f"chat-{conversation_id}"
+    if request["conversationId"]:
+        execution_name = f"{execution_name}-{uuid.uuid4().hex[:8]}"
+    
+    # 分析が終わるまでの暫定結果（報告ルールのキーワードから即座に作成）
+    provisional = reporting_rules.suggest(message) if reporting_rules else None
+    analysis_input = {
+        "conversationId": conversation_id,
+        "message": message,
+        "timestamp": timestamp,
+        "connectionId": connection_id,
+        "bypassCache": bypass_cache,
+        "provisional": provisional
+    }
+    
+    # 利用者の記録は同期実行でも必要（完了の通知先をこのやり取りの利用者から決める）
+    save_provisional_result(conversation_id, timestamp, message, provisional, request.get("userId", ""))
+    
+    # 短い相談はExpressワークフローで同期的に分析し、期限内に終われば結果を直接返す（ポーリング不要）
+    # 完了処理（組織マッチング・保存・通知・状態アイテムの記録）もワークフロー内で行う
+    if EXPRESS_STATE_MACHINE_ARN and len(message) <= SYNC_MAX_CHARS:
+        result = run_sync_analysis(execution_name, analysis_input)
+        if result is not None:
+            return {
                 "conversationId": conversation_id,
-                "status": "received",
-                "message": f"メッセージを受信しました: {message}",
+                "status": "completed",
+                "message": "分析が完了しました",
+                "result": result,
                 "timestamp": timestamp
             }
-            status_code = 200
+    
+    # キュー経由でバッチ分析する場合
+    if ANALYSIS_QUEUE_URL:
+        # 分析後はバッチ分析Lambdaがこの実行名でステートマシンの完了処理（組織マッチング・保存・通知）を開始する
+        record_processing(conversation_id, timestamp, provisional)
+        sqs.send_message(
+            QueueUrl=ANALYSIS_QUEUE_URL,
+            MessageBody=json.dumps({**analysis_input, "executionName": execution_name}, ensure_ascii=False)
+        )
+        
+        response_body = {
+            "conversationId": conversation_id,
+            "status": "processing",
+            "message": "分析を開始しました",
+            "timestamp": timestamp
+        }
+    # Step Functionsを開始する場合
+    elif STATE_MACHINE_ARN:
+        # 応答を受け取ったクライアントがすぐに状態を問い合わせても見つかるよう、開始前に記録する
+        record_processing(conversation_id, timestamp, provisional)
+        execution = stepfunctions.start_execution(
+            stateMachineArn=STATE_MACHINE_ARN,
+            name=execution_name,
+            input=json.dumps(analysis_input)
+        )
+        
+        response_body = {
+            "conversationId": conversation_id,
+            "status": "processing",
+            "message": "分析を開始しました",
+            "executionArn": execution['executionArn'],
+            "timestamp": timestamp
+        }
     else:
         # Step Functionsが設定されていない場合
         response_body = {
@@ -101,43 +277,343 @@ def handle_post_message(event):
             "message": f"メッセージを受信しました: {message}",
             "timestamp": timestamp
         }
-        status_code = 200
     
+    if provisional:
+        response_body["provisional"] = provisional
+    
+    return response_body
+
+def run_sync_analysis(execution_name, analysis_input):
+    """
+    Expressワークフローを同期実行し、期限内に終わった場合は分析結果を返す
+    （ワークフローが状態アイテムに完了を記録済みのため、状態取得APIでも同じ結果を返せる）
+    失敗・期限切れの場合はNone（呼び出し側は非同期の流れで分析し直す。
+    分析Lambdaにはワークフローより短い期限を渡しているため、期限切れの分析は記録・通知されない）
+    """
+    try:
+        execution = stepfunctions_sync.start_sync_execution(
+            stateMachineArn=EXPRESS_STATE_MACHINE_ARN,
+            name=execution_name,
+            input=json.dumps(analysis_input)
+        )
+    except Exception as e:
+        print(f"Sync execution error: {str(e)}")
+        return None
+    
+    if execution.get('status') != 'SUCCEEDED':
+        print(f"Sync execution {execution.get('status')}: {execution.get('error', '')}")
+        return None
+    
+    result = json.loads(execution.get('output') or '{}')
+    # 分析Lambdaは例外時にerrorを含む結果を返す
+    if 'error' in result:
+        print(f"Sync analysis error: {result['error']}")
+        return None
+    return result
+
+# 冪等性の設定（キーはユーザーIDとIdempotency-Key、同じキーで内容が異なる場合はエラー）
+if IDEMPOTENCY_TABLE_NAME:
+    idempotency_config = IdempotencyConfig(
+        event_key_jmespath="[userId, idempotencyKey]",
+        payload_validation_jmespath="[message, conversationId, bypassCache]",
+        expires_after_seconds=IDEMPOTENCY_EXPIRES_SECONDS
+    )
+    start_analysis_idempotent = idempotent_function(
+        data_keyword_argument="request",
+        config=idempotency_config,
+        persistence_store=DynamoDBPersistenceLayer(table_name=IDEMPOTENCY_TABLE_NAME)
+    )(start_analysis)
+else:
+    idempotency_config = None
+    start_analysis_idempotent = None
+
+def get_header(event, name):
+    """ヘッダーの値を取得（大文字小文字は区別しない）"""
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value or ""
+    return ""
+
+def get_user_id(event):
+    """Cognitoオーソライザーのユーザーを取得（未認証の場合は空文字）"""
+    claims = event.get("requestContext", {}).get("authorizer", {}).get("claims", {}) or {}
+    return claims.get("sub", "")
+
+def check_conversation_access(conversation_id, user_id):
+    """呼び出し元が会話の所有者か（会話テーブルがない場合は確認しない）"""
+    if conversations_table is None:
+        return True
+    return can_access_conversation(conversations_table, conversation_id, user_id)
+
+def error_response(status_code, message):
     return {
         "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-            "Access-Control-Allow-Methods": "OPTIONS,POST,GET"
-        },
-        "body": json.dumps(response_body, ensure_ascii=False)
+        "headers": CORS_HEADERS,
+        "body": json.dumps({"error": message})
+    }
+
+def save_provisional_result(conversation_id, timestamp, message, provisional, user_id=""):
+    """
+    暫定結果を会話レコードに保存（ステータスAPIで分析中に返す）
+    利用者は分析結果をその利用者の全てのWebSocket接続へ通知するために記録する
+    """
+    if conversations_table is None or (provisional is None and not user_id):
+        return
+    
+    item = {
+        "conversationId": conversation_id,
+        "timestamp": timestamp,
+        "message": message,
+        "status": "processing",
+        "provisional": provisional
+    }
+    if user_id:
+        item["userId"] = user_id
+    
+    try:
+        conversations_table.put_item(Item=item)
+    except Exception as e:
+        # 保存に失敗しても分析は開始する
+        print(f"Failed to save provisional result: {str(e)}")
+
+def record_processing(conversation_id, timestamp, provisional):
+    """
+    会話の状態アイテムに分析中を記録（状態取得APIはこのアイテムだけを読む）
+    ステートマシンを経由しない経路、またはステートマシンが記録するより前に使う
+    """
+    if conversations_table is None:
+        return
+    
+    try:
+        mark_processing(conversations_table, conversation_id, timestamp, provisional)
+    except Exception as e:
+        print(f"Failed to record processing status: {str(e)}")
+
+def record_failed(conversation_id, timestamp, error):
+    """分析を開始できなかったやり取りと会話の状態アイテムに失敗を記録（分析中のまま残さない）"""
+    if conversations_table is None:
+        return
+    
+    try:
+        # 暫定結果を保存していない場合はやり取りのレコードを作らない
+        conversations_table.update_item(
+            Key={"conversationId": conversation_id, "timestamp": timestamp},
+            UpdateExpression="SET #status = :status, #error = :error",
+            ConditionExpression="attribute_exists(conversationId)",
+            ExpressionAttributeNames={"#status": "status", "#error": "error"},
+            ExpressionAttributeValues={":status": "error", ":error": error}
+        )
+    except conversations_table.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+    except Exception as e:
+        print(f"Failed to record failed turn: {str(e)}")
+    
+    try:
+        mark_error(conversations_table, conversation_id, error)
+    except Exception as e:
+        print(f"Failed to record error status: {str(e)}")
+
+def handle_post_batch(event):
+    """
+    複数の相談をまとめて受け付け、1つの実行（Map状態）で分析する
+    messagesは文字列、または {"message", "conversationId"} の配列
+    """
+    if not BATCH_STATE_MACHINE_ARN or conversations_table is None:
+        return error_response(501, "Batch submission is not enabled")
+    
+    body = json.loads(event.get("body") or "{}")
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return error_response(400, "messages must be a non-empty array")
+    if len(messages) > BATCH_MAX_MESSAGES:
+        return error_response(400, f"messages must contain at most {BATCH_MAX_MESSAGES} items")
+    
+    batch_id = str(uuid.uuid4())
+    timestamp = datetime.utcnow().isoformat()
+    user_id = get_user_id(event)
+    bypass_cache = bool(body.get("bypassCache", False))
+    
+    items = []
+    for entry in messages:
+        entry = {"message": entry} if isinstance(entry, str) else entry
+        message = entry.get("message", "") if isinstance(entry, dict) else ""
+        if not message:
+            return error_response(400, "Each item requires a message")
+        if entry.get("conversationId") and not check_conversation_access(entry["conversationId"], user_id):
+            return error_response(404, f"Conversation not found: {entry['conversationId']}")
+        items.append({
+            "conversationId": entry.get("conversationId") or str(uuid.uuid4()),
+            "message": message,
+            "timestamp": timestamp,
+            "bypassCache": bypass_cache
+        })
+    
+    execution_input = json.dumps({"batchId": batch_id, "items": items}, ensure_ascii=False)
+    if len(execution_input.encode("utf-8")) > MAX_EXECUTION_INPUT_BYTES:
+        return error_response(413, "Batch is too large; split it into smaller batches")
+    
+    # 会話レコードと状態アイテムをまとめて書き込む（25件ごとにBatchWriteItem。未処理分はbatch_writerが再送する）
+    with conversations_table.batch_writer() as writer:
+        for item in items:
+            record = {
+                "conversationId": item["conversationId"],
+                "timestamp": timestamp,
+                "message": item["message"],
+                "status": "queued",
+                "batchId": batch_id
+            }
+            if user_id:
+                record["userId"] = user_id
+            if reporting_rules:
+                record["provisional"] = reporting_rules.suggest(item["message"])
+            writer.put_item(Item=record)
+            writer.put_item(Item=processing_item(item["conversationId"], timestamp, record.get("provisional")))
+    
+    execution = stepfunctions.start_execution(
+        stateMachineArn=BATCH_STATE_MACHINE_ARN,
+        name=f"batch-{batch_id}",
+        input=execution_input
+    )
+    
+    return {
+        "statusCode": 202,
+        "headers": CORS_HEADERS,
+        "body": json.dumps({
+            "batchId": batch_id,
+            "status": "processing",
+            "count": len(items),
+            "conversationIds": [item["conversationId"] for item in items],
+            "executionArn": execution['executionArn'],
+            "timestamp": timestamp
+        }, ensure_ascii=False)
+    }
+
+def handle_get_batch(batch_id):
+    """一括送信の各件の状態と、状態ごとの件数を返す"""
+    if not batch_id:
+        return error_response(400, "batchId is required")
+    if conversations_table is None:
+        return error_response(501, "Batch submission is not enabled")
+    
+    records = []
+    query = {"IndexName": BATCH_INDEX_NAME, "KeyConditionExpression": Key("batchId").eq(batch_id)}
+    while True:
+        response = conversations_table.query(**query)
+        records.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    
+    if not records:
+        return error_response(404, "Batch not found")
+    
+    items = []
+    counts = {}
+    for record in records:
+        status = record.get("status", "queued")
+        counts[status] = counts.get(status, 0) + 1
+        item = {"conversationId": record["conversationId"], "status": status}
+        analysis = record.get("analysis") or {}
+        if analysis:
+            item.update({
+                "category": analysis.get("category"),
+                "urgency": analysis.get("urgency"),
+                "recommendedRecipient": analysis.get("recommendedRecipient")
+            })
+        if record.get("error"):
+            item["error"] = record["error"]
+        items.append(item)
+    
+    finished = counts.get("completed", 0) + counts.get("error", 0)
+    return {
+        "statusCode": 200,
+        "headers": CORS_HEADERS,
+        "body": json.dumps({
+            "batchId": batch_id,
+            "status": "completed" if finished == len(items) else "processing",
+            "count": len(items),
+            "counts": counts,
+            "items": items
+        }, ensure_ascii=False)
     }
 
 def handle_get_conversation(event):
-    """GETリクエスト - 会話履歴取得処理（簡易実装）"""
-    conversation_id = event.get('pathParameters', {}).get('conversationId')
+    """
+    GETリクエスト - 会話履歴取得処理
+    古い順にページ単位で返す。sinceを指定した場合はその時刻より後のやり取りだけを返す（差分同期用）
+    """
+    conversation_id = (event.get('pathParameters') or {}).get('conversationId')
     
     if not conversation_id:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({"error": "conversationId is required"})
-        }
+        return error_response(400, "conversationId is required")
+    if conversations_table is None:
+        return error_response(501, "Conversation history is not available")
+    # 他の利用者の会話は返さない（存在を知らせないよう404で返す）
+    if not check_conversation_access(conversation_id, get_user_id(event)):
+        return error_response(404, "Conversation not found")
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = max(1, min(HISTORY_MAX_PAGE_SIZE, int(params.get('limit', HISTORY_DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        return error_response(400, "limit must be an integer")
+    
+    # 時刻のソートキーは"0"より大きい（"#summary"などのメタデータは含まれない）
+    since = params.get('since') or '0'
+    query = {
+        "KeyConditionExpression": Key('conversationId').eq(conversation_id) & Key('timestamp').gt(since),
+        "ProjectionExpression": ", ".join(HISTORY_PROJECTION),
+        "ExpressionAttributeNames": {"#timestamp": "timestamp", "#status": "status"},
+        "ScanIndexForward": True,
+        "Limit": limit
+    }
+    if params.get('cursor'):
+        start_key = decode_cursor(params['cursor'])
+        # 別の会話のカーソルは受け付けない
+        if start_key is None or start_key.get('conversationId') != conversation_id:
+            return error_response(400, "Invalid cursor")
+        query["ExclusiveStartKey"] = start_key
+    
+    response = conversations_table.query(**query)
+    turns = response.get('Items', [])
+    
+    response_body = {
+        "conversationId": conversation_id,
+        "turns": turns,
+        "count": len(turns),
+        # 次回の差分同期ではこの値をsinceに指定する
+        "latestTimestamp": turns[-1]['timestamp'] if turns else params.get('since'),
+        "nextCursor": encode_cursor(response['LastEvaluatedKey']) if 'LastEvaluatedKey' in response else None
+    }
+    body = json.dumps(response_body, ensure_ascii=False)
+    etag = build_etag(body)
+    # 分析結果の記録や新しいやり取りで内容が変わるため、毎回再検証させる（一致すれば304で本文を省く）
+    headers = {
+        **CORS_HEADERS,
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Access-Control-Expose-Headers": "ETag"
+    }
+    if etag_matches(get_header(event, 'If-None-Match'), etag):
+        return {"statusCode": 304, "headers": headers, "body": ""}
     
-    # 簡易実装：実際のDBからの取得は後で実装
     return {
         "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        },
-        "body": json.dumps({
-            "conversationId": conversation_id,
-            "status": "found",
-            "message": "会話履歴取得機能は実装中です"
-        })
-    }
\ No newline at end of file
+        "headers": headers,
+        "body": body
+    }
+
+def encode_cursor(last_evaluated_key):
+    """LastEvaluatedKeyをクライアントに渡す不透明なカーソルに変換"""
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """カーソルをExclusiveStartKeyに戻す（不正な値はNone）"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(key, dict) or set(key) != {'conversationId', 'timestamp'}:
+        return None
+    return key
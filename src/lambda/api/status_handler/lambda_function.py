@@ -1,177 +1,479 @@
 import json
 import os
+import random
+import time
+from urllib.parse import quote
 import boto3
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+from utils.http_cache import build_etag, etag_matches
+
+# 会話テーブル（分析の各経路が書き込む状態アイテムと、分析中に返す暫定結果の取得用）
+CONVERSATION_TABLE_NAME = os.environ.get('CONVERSATION_TABLE_NAME', '')
+dynamodb = boto3.resource('dynamodb')
+conversations_table = dynamodb.Table(CONVERSATION_TABLE_NAME) if CONVERSATION_TABLE_NAME else None
+
+# 会話ごとの処理状態を保持するアイテムのソートキー（step_functions_construct.pyと同じ値）
+STATUS_SORT_KEY = '#status'
+
+# 状態アイテムがない場合（記録前に開始された実行など）のみDescribeExecutionで確認する
+STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN', '')
+stepfunctions = boto3.client('stepfunctions')
+
+# ロングポーリング設定（?waitSeconds=N の間、状態が変わるまで応答を保留する）
+LONG_POLL_MAX_WAIT_SECONDS = int(os.environ.get('LONG_POLL_MAX_WAIT_SECONDS', '20'))  # API Gatewayの統合タイムアウト（29秒）未満
+LONG_POLL_INITIAL_INTERVAL = float(os.environ.get('LONG_POLL_INITIAL_INTERVAL', '0.25'))  # 状態アイテムの再確認間隔（倍々に延ばす）
+LONG_POLL_MAX_INTERVAL = float(os.environ.get('LONG_POLL_MAX_INTERVAL', '2'))
+
+# 一括取得の設定
+BATCH_GET_MAX_IDS = 100  # 1リクエストで受け付ける会話IDの上限
+BATCH_GET_CHUNK_SIZE = 100  # BatchGetItemの1回あたりのキー数の上限
+BATCH_GET_MAX_ATTEMPTS = 5  # UnprocessedKeysの再試行を含む呼び出し回数の上限
+BATCH_GET_BASE_DELAY = 0.05  # 再試行の待ち時間の基準（秒、指数バックオフ）
+# 一括取得では結果の全文ではなく、一覧表示に必要な属性だけを返す
+BATCH_GET_PROJECTION = "conversationId, #status, #result, #error, updatedAt"
+BATCH_GET_ATTRIBUTE_NAMES = {"#status": "status", "#result": "result", "#error": "error"}
+
+# これ以上変わらない状態（待たずに返す）
+FINAL_STATUSES = {'completed', 'error'}
+
+# 最終状態の表現（/status/final）をキャッシュしてよい期間（API Gatewayのキャッシュの有効期間と合わせる）
+FINAL_MAX_AGE_SECONDS = int(os.environ.get('STATUS_FINAL_MAX_AGE_SECONDS', '3600'))
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*"
+}
+
 def lambda_handler(event, context):
     """
-    会話IDに基づいてStep Functionsの実行結果を取得する
+    会話IDに基づいて分析の状態と結果を取得する
     """
     print(f"Event: {json.dumps(event)}")
-    
+
+    # POST /api/v1/chat/status:batchGet
+    if event.get('httpMethod') == 'POST':
+        return handle_batch_get(event)
+
     try:
         # パスパラメータから会話IDを取得
-        conversation_id = event.get('pathParameters', {}).get('conversationId')
-        
+        conversation_id = (event.get('pathParameters') or {}).get('conversationId')
+
         if not conversation_id:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "error": "conversationId is required"
-                })
+            return build_response(400, {
+                "error": "conversationId is required"
+            })
+
+        wait_seconds = parse_wait_seconds(event.get('queryStringParameters') or {})
+        if wait_seconds is None:
+            return build_response(400, {
+                "error": f"waitSeconds must be an integer between 0 and {LONG_POLL_MAX_WAIT_SECONDS}"
+            })
+
+        # 最終状態の表現はやり取りごとに別のURLにする（同じ会話の次の相談で状態アイテムは上書きされる）
+        if is_final_resource(event) and not get_requested_turn(event):
+            return build_response(400, {
+                "error": "turn is required"
+            })
+
+        # 分析の各経路が記録した状態アイテムを強い整合性で読む（記録がない会話のみDescribeExecutionで確認する）
+        item = get_status_item(conversation_id)
+        if item:
+            if wait_seconds and item.get('status') not in FINAL_STATUSES:
+                item = wait_for_status_change(conversation_id, item, wait_seconds, context)
+            return build_status_response(event, 200, build_status_body(conversation_id, item), item.get('turnTimestamp'))
+
+        return build_status_response(event, *describe_execution_status(conversation_id))
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return build_response(500, {
+            "conversationId": conversation_id if 'conversation_id' in locals() else 'unknown',
+            "status": "error",
+            "error": "Internal server error"
+        })
+
+def build_response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps(body, ensure_ascii=False, default=str)
+    }
+
+def build_status_response(event, status_code, body, turn_timestamp=None):
+    """
+    状態の応答にETagとCache-Controlを付ける（If-None-Matchが一致すれば304）
+    同じ会話で次の相談が始まると状態は変わるため、通常のURLは毎回再検証させる。
+    最終状態を /status/final?turn={やり取りの時刻} で取得した場合のみ変更不可としてキャッシュさせる
+    （API Gatewayのステージキャッシュもこのリソースだけを対象にし、turnをキーに含める）
+    turn_timestampは状態アイテムが記録している分析中のやり取りの時刻（不明な場合はNone）
+    """
+    response = build_response(status_code, body)
+    if status_code != 200:
+        return response
+
+    final = body.get('status') in FINAL_STATUSES
+    if is_final_resource(event) and not final:
+        # 最終状態の表現はキャッシュされるため、分析中の状態は返さない
+        return build_conflict_response(body, "Conversation has not reached a final status")
+    if is_final_resource(event) and (not turn_timestamp or get_requested_turn(event) != turn_timestamp):
+        # 次の相談が始まった後は、前のやり取りの結果をこのURLで返さない（古い結果をキャッシュさせない）
+        return build_conflict_response(body, "The requested turn is not the latest turn")
+
+    etag = build_etag(response['body'])
+    headers = {
+        **HEADERS,
+        "ETag": etag,
+        "Access-Control-Expose-Headers": "ETag, Content-Location"
+    }
+    if is_final_resource(event):
+        headers["Cache-Control"] = f"private, max-age={FINAL_MAX_AGE_SECONDS}, immutable"
+    elif final:
+        headers["Cache-Control"] = "private, no-cache"
+        if turn_timestamp:
+            # キャッシュできる表現の場所（やり取りごと）
+            headers["Content-Location"] = f"{event.get('path', '')}/final?turn={quote(turn_timestamp, safe='')}"
+    else:
+        headers["Cache-Control"] = "private, no-cache"
+
+    response["headers"] = headers
+    if etag_matches(get_header(event, 'If-None-Match'), etag):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    return response
+
+def build_conflict_response(body, error):
+    """最終状態の表現として返せない場合の応答（キャッシュさせない）"""
+    return {
+        "statusCode": 409,
+        "headers": {**HEADERS, "Cache-Control": "no-store"},
+        "body": json.dumps({
+            "conversationId": body.get('conversationId'),
+            "status": body.get('status'),
+            "error": error
+        })
+    }
+
+def is_final_resource(event):
+    """GET /api/v1/chat/{conversationId}/status/final へのリクエストか"""
+    return (event.get('resource') or '').endswith('/status/final')
+
+def get_requested_turn(event):
+    """最終状態の表現で指定されたやり取りの時刻（?turn=）"""
+    return (event.get('queryStringParameters') or {}).get('turn') or ''
+
+def get_header(event, name):
+    """ヘッダーの値を取得（大文字小文字は区別しない）"""
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value or ""
+    return ""
+
+def parse_wait_seconds(params):
+    """
+    waitSecondsを取得（未指定は0、上限を超える値は上限に丸める、不正な値はNone）
+    """
+    value = params.get('waitSeconds')
+    if value in (None, ''):
+        return 0
+    try:
+        wait_seconds = int(value)
+    except (TypeError, ValueError):
+        return None
+    if wait_seconds < 0:
+        return None
+    return min(wait_seconds, LONG_POLL_MAX_WAIT_SECONDS)
+
+def wait_for_status_change(conversation_id, item, wait_seconds, context=None):
+    """
+    状態アイテムが変わるまで（最大wait_seconds秒）間隔を延ばしながら読み直す
+    期限までに変わらなければ最後に読んだアイテムを返す
+    """
+    deadline = time.monotonic() + wait_seconds
+    if context is not None:
+        # Lambdaのタイムアウトより前に必ず応答する
+        deadline = min(deadline, time.monotonic() + context.get_remaining_time_in_millis() / 1000 - 1)
+
+    interval = LONG_POLL_INITIAL_INTERVAL
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return item
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, LONG_POLL_MAX_INTERVAL)
+
+        latest = get_status_item(conversation_id)
+        if latest is None:
+            continue
+        if latest.get('status') != item.get('status') or latest.get('updatedAt') != item.get('updatedAt'):
+            return latest
+        item = latest
+
+def handle_batch_get(event):
+    """
+    複数の会話の状態を一括取得し、会話IDから状態への対応を返す
+    状態アイテムがない会話はunknown（実行履歴は参照しない）
+    """
+    if conversations_table is None:
+        return build_response(501, {"error": "Batch status lookup is not configured"})
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except (TypeError, ValueError):
+        return build_response(400, {"error": "Invalid JSON body"})
+
+    conversation_ids = body.get('conversationIds') if isinstance(body, dict) else None
+    if not isinstance(conversation_ids, list) or not conversation_ids:
+        return build_response(400, {"error": "conversationIds must be a non-empty list"})
+    if not all(isinstance(conversation_id, str) and conversation_id for conversation_id in conversation_ids):
+        return build_response(400, {"error": "conversationIds must be non-empty strings"})
+
+    # 重複は1回だけ読む（順序は保つ）
+    conversation_ids = list(dict.fromkeys(conversation_ids))
+    if len(conversation_ids) > BATCH_GET_MAX_IDS:
+        return build_response(400, {"error": f"At most {BATCH_GET_MAX_IDS} conversationIds are allowed"})
+
+    try:
+        items, unprocessed = batch_get_status_items(conversation_ids)
+    except Exception as e:
+        print(f"Batch status lookup failed: {str(e)}")
+        return build_response(500, {"error": "Internal server error"})
+
+    statuses = {}
+    for conversation_id in conversation_ids:
+        if conversation_id in unprocessed:
+            continue
+        item = items.get(conversation_id)
+        statuses[conversation_id] = build_compact_status(item) if item else {"status": "unknown"}
+
+    response_body = {"statuses": statuses}
+    if unprocessed:
+        # 再試行しても読めなかった会話（クライアントが後で再度問い合わせる）
+        response_body["unprocessed"] = [conversation_id for conversation_id in conversation_ids if conversation_id in unprocessed]
+    return build_response(200, response_body)
+
+def batch_get_status_items(conversation_ids):
+    """
+    会話IDごとの状態アイテムをBatchGetItemで取得（上限件数ごとに分割）
+    UnprocessedKeysは指数バックオフで再試行し、読めなかった会話IDの集合も返す
+    """
+    items = {}
+    unprocessed = set()
+    for start in range(0, len(conversation_ids), BATCH_GET_CHUNK_SIZE):
+        chunk = conversation_ids[start:start + BATCH_GET_CHUNK_SIZE]
+        request = {
+            CONVERSATION_TABLE_NAME: {
+                "Keys": [{"conversationId": conversation_id, "timestamp": STATUS_SORT_KEY} for conversation_id in chunk],
+                "ConsistentRead": True,
+                "ProjectionExpression": BATCH_GET_PROJECTION,
+                "ExpressionAttributeNames": BATCH_GET_ATTRIBUTE_NAMES,
             }
-        
-        # executionArnを構築
-        execution_arn = construct_execution_arn(conversation_id)
-        
-        if not execution_arn:
+        }
+
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, BATCH_GET_BASE_DELAY * 2 ** attempt))
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(CONVERSATION_TABLE_NAME, []):
+                items[item['conversationId']] = item
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+
+        if request:
+            print(f"Unprocessed keys remain after {BATCH_GET_MAX_ATTEMPTS} attempts")
+            for key in request.get(CONVERSATION_TABLE_NAME, {}).get('Keys', []):
+                unprocessed.add(key['conversationId'])
+
+    return items, unprocessed
+
+def build_compact_status(item):
+    """一括取得用の状態（分析本文は含めない）"""
+    status = item.get('status', 'processing')
+    if status == 'completed':
+        output = parse_json_attribute(item.get('result'))
+        if output.get('error') and not output.get('analysis'):
+            return {"status": "error", "error": output['error']}
+        return {
+            "status": "completed",
+            "category": output.get('category', ''),
+            "urgency": output.get('urgency', ''),
+            "recommendedRecipient": output.get('recommendedRecipient', ''),
+            "updatedAt": item.get('updatedAt')
+        }
+    if status == 'error':
+        return {"status": "error", "error": item.get('error', 'Execution failed')}
+    return {"status": "processing", "updatedAt": item.get('updatedAt')}
+
+def get_status_item(conversation_id):
+    """
+    会話の状態アイテムを取得（テーブル未設定・未記録の場合はNone）
+    """
+    if conversations_table is None:
+        return None
+
+    try:
+        response = conversations_table.get_item(
+            Key={"conversationId": conversation_id, "timestamp": STATUS_SORT_KEY},
+            ConsistentRead=True
+        )
+        return response.get('Item')
+    except Exception as e:
+        print(f"Failed to get status item: {str(e)}")
+        return None
+
+def build_status_body(conversation_id, item):
+    """
+    状態アイテムから応答ボディを作成
+    結果・暫定結果はステートマシンがJSON文字列として記録している
+    """
+    status = item.get('status', 'processing')
+
+    if status == 'completed':
+        output = parse_json_attribute(item.get('result'))
+        # 分析Lambdaが例外をエラー情報として返した場合
+        if output.get('error') and not output.get('analysis'):
             return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "conversationId": conversation_id,
-                    "status": "error",
-                    "error": "Could not construct execution ARN"
-                })
+                "conversationId": conversation_id,
+                "status": "error",
+                "error": output['error']
             }
-        
-        # Step Functionsクライアント作成
-        stepfunctions = boto3.client('stepfunctions')
-        
-        # Step Functionsの実行状態を取得
-        try:
-            response = stepfunctions.describe_execution(executionArn=execution_arn)
-            
-            status = response['status']  # RUNNING, SUCCEEDED, FAILED, TIMED_OUT, ABORTED
-            print(f"Step Functions status: {status}")
-            
-            if status == 'RUNNING':
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    "body": json.dumps({
-                        "conversationId": conversation_id,
-                        "status": "processing",
-                        "message": "分析中です..."
-                    })
-                }
-            elif status == 'SUCCEEDED':
-                # 実行結果を取得
-                output = json.loads(response.get('output', '{}'))
-                
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    "body": json.dumps({
-                        "conversationId": conversation_id,
-                        "status": "completed",
-                        "analysis": output.get('analysis', ''),
-                        "category": output.get('category', ''),
-                        "recommendedRecipient": output.get('recommendedRecipient', ''),
-                        "timestamp": response.get('stopDate', '').isoformat() if response.get('stopDate') else None
-                    })
-                }
-            else:
-                # FAILED, TIMED_OUT, ABORTED
-                error_message = response.get('error', f'Execution {status}')
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    "body": json.dumps({
-                        "conversationId": conversation_id,
-                        "status": "error",
-                        "error": error_message
-                    })
-                }
-                
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            print(f"ClientError: {error_code} - {str(e)}")
-            
-            if error_code == 'ExecutionDoesNotExist':
-                return {
-                    "statusCode": 404,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    "body": json.dumps({
-                        "conversationId": conversation_id,
-                        "status": "error",
-                        "error": "Execution not found"
-                    })
-                }
-            else:
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    "body": json.dumps({
-                        "conversationId": conversation_id,
-                        "status": "error",
-                        "error": f"AWS Error: {error_code}"
-                    })
-                }
-        
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
         return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({
-                "conversationId": conversation_id if 'conversation_id' in locals() else 'unknown',
+            "conversationId": conversation_id,
+            "status": "completed",
+            "analysis": output.get('analysis', ''),
+            "category": output.get('category', ''),
+            "urgency": output.get('urgency', ''),
+            "recommendedRecipient": output.get('recommendedRecipient', ''),
+            "provisional": False,
+            "timestamp": item.get('updatedAt')
+        }
+
+    if status == 'error':
+        return {
+            "conversationId": conversation_id,
+            "status": "error",
+            "error": item.get('error', 'Execution failed')
+        }
+
+    response_body = {
+        "conversationId": conversation_id,
+        "status": "processing",
+        "message": "分析中です..."
+    }
+    provisional = parse_json_attribute(item.get('provisional'))
+    if provisional:
+        response_body["provisional"] = True
+        response_body["result"] = provisional
+    return response_body
+
+def parse_json_attribute(value):
+    """JSON文字列の属性を辞書に変換（不正な値は空の辞書）"""
+    if isinstance(value, dict):
+        return value
+    try:
+        parsed = json.loads(value) if value else {}
+    except (TypeError, ValueError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+def describe_execution_status(conversation_id):
+    """
+    Step Functionsの実行状態から応答のステータスコードとボディを作成（状態アイテムがない会話のみ）
+    """
+    execution_arn = construct_execution_arn(conversation_id)
+
+    # 一時的な失敗は最終状態として扱われない（キャッシュされない）ようエラーのステータスコードで返す
+    if not execution_arn:
+        return (500, {
+            "conversationId": conversation_id,
+            "status": "error",
+            "error": "Could not construct execution ARN"
+        })
+
+    try:
+        response = stepfunctions.describe_execution(executionArn=execution_arn)
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        print(f"ClientError: {error_code} - {str(e)}")
+
+        if error_code == 'ExecutionDoesNotExist':
+            return (404, {
+                "conversationId": conversation_id,
                 "status": "error",
-                "error": "Internal server error"
+                "error": "Execution not found"
             })
+        return (502, {
+            "conversationId": conversation_id,
+            "status": "error",
+            "error": f"AWS Error: {error_code}"
+        })
+
+    status = response['status']  # RUNNING, SUCCEEDED, FAILED, TIMED_OUT, ABORTED
+    print(f"Step Functions status: {status}")
+
+    if status == 'RUNNING':
+        response_body = {
+            "conversationId": conversation_id,
+            "status": "processing",
+            "message": "分析中です..."
         }
+        # 受付時に作成した暫定結果があれば返す（分析結果が出たら置き換わる）
+        provisional = get_provisional_result(conversation_id)
+        if provisional:
+            response_body["provisional"] = True
+            response_body["result"] = provisional
+        return 200, response_body
 
-def construct_execution_arn(conversation_id):
+    if status == 'SUCCEEDED':
+        # 実行結果を取得
+        output = json.loads(response.get('output', '{}'))
+        return (200, {
+            "conversationId": conversation_id,
+            "status": "completed",
+            "analysis": output.get('analysis', ''),
+            "category": output.get('category', ''),
+            "recommendedRecipient": output.get('recommendedRecipient', ''),
+            "provisional": False,
+            "timestamp": response.get('stopDate', '').isoformat() if response.get('stopDate') else None
+        })
+
+    # FAILED, TIMED_OUT, ABORTED
+    return (200, {
+        "conversationId": conversation_id,
+        "status": "error",
+        "error": response.get('error', f'Execution {status}')
+    })
+
+def get_provisional_result(conversation_id):
     """
-    命名規則からexecutionArnを構築
+    会話の最新のやり取りに保存された暫定結果を取得（なければNone）
     """
+    if conversations_table is None:
+        return None
+
     try:
-        # AWS_REGIONは自動的に設定される
-        region = os.environ.get('AWS_REGION')
-        state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
-        
-        print(f"Region: {region}")
-        print(f"State Machine ARN: {state_machine_arn}")
-        
-        if not region or not state_machine_arn:
-            print("Missing region or state machine ARN")
-            return None
-            
-        # アカウントIDとState Machine名を抽出
-        sts = boto3.client('sts')
-        account_id = sts.get_caller_identity()['Account']
-        state_machine_name = state_machine_arn.split(':')[-1]
-        
-        execution_name = f"chat-{conversation_id}"
-        execution_arn = f"arn:aws:states:{region}:{account_id}:execution:{state_machine_name}:{execution_name}"
-        
-        print(f"Constructed execution ARN: {execution_arn}")
-        return execution_arn
+        # 時刻のソートキーは"0"以上（要約・状態などのアイテムは含まれない）
+        response = conversations_table.query(
+            KeyConditionExpression=Key('conversationId').eq(conversation_id) & Key('timestamp').gte('0'),
+            ScanIndexForward=False,
+            Limit=1
+        )
+        items = response.get('Items', [])
+        return items[0].get('provisional') if items else None
     except Exception as e:
-        print(f"Error constructing execution ARN: {str(e)}")
-        return None
\ No newline at end of file
+        print(f"Failed to get provisional result: {str(e)}")
+        return None
+
+def construct_execution_arn(conversation_id):
+    """
+    命名規則からexecutionArnを構築
+    State MachineのARN（arn:aws:states:{region}:{account}:stateMachine:{name}）から導くため、
+    アカウントIDの取得（STS）は不要
+    """
+    if not STATE_MACHINE_ARN or ':stateMachine:' not in STATE_MACHINE_ARN:
+        print(f"Invalid state machine ARN: {STATE_MACHINE_ARN}")
+        return None
+
+    execution_name = f"chat-{conversation_id}"
+    return f"{STATE_MACHINE_ARN.replace(':stateMachine:', ':execution:', 1)}:{execution_name}"
\ No newline at end of file
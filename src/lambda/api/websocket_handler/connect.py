@@ -0,0 +1,62 @@
+# src/lambda/api/websocket_handler/connect.py
+import json
+import os
+import time
+from datetime import datetime
+
+import boto3
+
+# 接続管理テーブル（connectionId → userId、GSI userId-index で利用者の全接続を検索）
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(CONNECTIONS_TABLE) if CONNECTIONS_TABLE else None
+
+# WebSocket接続の最大継続時間（2時間）を過ぎた接続はTTLで削除される
+# （$disconnectが呼ばれなかった場合の取り残しを防ぐ）
+CONNECTION_TTL_SECONDS = int(os.environ.get('CONNECTION_TTL_SECONDS', '7200'))
+
+def lambda_handler(event, context):
+    """WebSocket接続時の処理"""
+    print(f"Connect Event: {json.dumps(event)}")
+
+    request_context = event['requestContext']
+    connection_id = request_context['connectionId']
+
+    try:
+        if table is None:
+            print("Connections table is not configured")
+            return {
+                'statusCode': 200,
+                'body': 'Connected'
+            }
+
+        item = {
+            'connectionId': connection_id,
+            # 送信側はこのエンドポイントに対してpost_to_connectionを呼び出す
+            'endpoint': f"https://{request_context['domainName']}/{request_context['stage']}",
+            'connectedAt': datetime.utcnow().isoformat(),
+            'ttl': int(time.time()) + CONNECTION_TTL_SECONDS
+        }
+        # 利用者はオーソライザーが確認したものだけを使う（クエリ文字列の値は信用しない）
+        user_id = get_user_id(request_context)
+        if user_id:
+            item['userId'] = user_id
+
+        table.put_item(Item=item)
+
+        return {
+            'statusCode': 200,
+            'body': 'Connected'
+        }
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': f'Error: {str(e)}'
+        }
+
+def get_user_id(request_context):
+    """オーソライザーが設定した利用者ID（未認証の場合は空文字）"""
+    authorizer = request_context.get('authorizer') or {}
+    claims = authorizer.get('claims') or {}
+    return claims.get('sub') or authorizer.get('userId') or authorizer.get('principalId') or ''
@@ -0,0 +1,32 @@
+# src/lambda/api/websocket_handler/disconnect.py
+import json
+import os
+
+import boto3
+
+# 接続管理テーブル
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(CONNECTIONS_TABLE) if CONNECTIONS_TABLE else None
+
+def lambda_handler(event, context):
+    """WebSocket切断時の処理"""
+    print(f"Disconnect Event: {json.dumps(event)}")
+
+    connection_id = event['requestContext']['connectionId']
+
+    try:
+        # 接続情報をDynamoDBから削除（存在しない場合も成功）
+        if table is not None:
+            table.delete_item(Key={'connectionId': connection_id})
+
+        return {
+            'statusCode': 200,
+            'body': 'Disconnected'
+        }
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': f'Error: {str(e)}'
+        }
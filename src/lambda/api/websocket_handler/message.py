@@ -0,0 +1,200 @@
+# src/lambda/api/websocket_handler/message.py
+import json
+import os
+import uuid
+from datetime import datetime
+
+import boto3
+
+from utils.conversation_access import can_access_conversation
+from utils.conversation_status import mark_processing
+from utils.reporting_rules import ReportingRules
+from utils.websocket_client import get_management_client
+
+# Step Functionsクライアント
+stepfunctions = boto3.client('stepfunctions')
+STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN', '')
+
+# 会話テーブル（受け付けたやり取りと暫定結果の保存）・接続管理テーブル（接続の利用者の確認）
+CONVERSATIONS_TABLE = os.environ.get('CONVERSATIONS_TABLE', '')
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+dynamodb = boto3.resource('dynamodb')
+conversations_table = dynamodb.Table(CONVERSATIONS_TABLE) if CONVERSATIONS_TABLE else None
+connections_table = dynamodb.Table(CONNECTIONS_TABLE) if CONNECTIONS_TABLE else None
+
+# 相談の最大文字数（WebSocketの1フレームは32KBまで）
+MAX_MESSAGE_CHARS = int(os.environ.get('MAX_MESSAGE_CHARS', '4000'))
+
+# 暫定結果の作成用（読み込めない場合は暫定結果なしで分析を開始）
+try:
+    reporting_rules = ReportingRules.load()
+except (OSError, ValueError) as e:
+    print(f"Failed to load reporting rules: {str(e)}")
+    reporting_rules = None
+
+def lambda_handler(event, context):
+    """
+    WebSocketメッセージ受信時の処理
+    sendmessageルートで相談を受け付け、この接続IDを付けて分析を開始する
+    （分析途中のテキストと結果は同じ接続へプッシュされるため、ポーリングは不要）
+    """
+    print(f"Message Event: {json.dumps(event)}")
+
+    request_context = event['requestContext']
+    connection_id = request_context['connectionId']
+    endpoint = f"https://{request_context['domainName']}/{request_context['stage']}"
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except (TypeError, ValueError):
+        body = None
+    if not isinstance(body, dict):
+        send(endpoint, connection_id, {"type": "error", "error": "Invalid JSON body"})
+        return {'statusCode': 400, 'body': 'Invalid JSON body'}
+
+    # クライアントが応答と対応付けるためのID（そのまま返す）
+    request_id = body.get('requestId')
+
+    if body.get('action', 'sendmessage') != 'sendmessage':
+        send(endpoint, connection_id, {"type": "error", "requestId": request_id, "error": "Unsupported action"})
+        return {'statusCode': 400, 'body': 'Unsupported action'}
+
+    message = body.get('message')
+    if not isinstance(message, str) or not message.strip():
+        send(endpoint, connection_id, {"type": "error", "requestId": request_id, "error": "message is required"})
+        return {'statusCode': 400, 'body': 'message is required'}
+    if len(message) > MAX_MESSAGE_CHARS:
+        send(endpoint, connection_id, {
+            "type": "error",
+            "requestId": request_id,
+            "error": f"message must be at most {MAX_MESSAGE_CHARS} characters"
+        })
+        return {'statusCode': 400, 'body': 'message is too long'}
+
+    conversation_id = body.get('conversationId') or ''
+    user_id = get_connection_user(connection_id)
+    # 他の利用者の会話には続けて送信できない（存在を知らせないよう見つからないとして返す）
+    if conversation_id and not check_conversation_access(conversation_id, user_id):
+        send(endpoint, connection_id, {"type": "error", "requestId": request_id, "error": "Conversation not found"})
+        return {'statusCode': 404, 'body': 'Conversation not found'}
+
+    try:
+        accepted = start_analysis({
+            "message": message,
+            "conversationId": conversation_id,
+            "bypassCache": bool(body.get('bypassCache', False)),
+            "connectionId": connection_id,
+            "userId": user_id
+        })
+    except Exception as e:
+        print(f"Failed to start analysis: {str(e)}")
+        send(endpoint, connection_id, {"type": "error", "requestId": request_id, "error": "Failed to start analysis"})
+        return {'statusCode': 500, 'body': 'Failed to start analysis'}
+
+    send(endpoint, connection_id, {"type": "accepted", "requestId": request_id, **accepted})
+    return {
+        'statusCode': 200,
+        'body': 'Message accepted'
+    }
+
+def start_analysis(request):
+    """
+    やり取りを保存し、送信元の接続IDを付けて分析の実行を開始する
+    開始に失敗した場合は例外を送出する
+    """
+    if not STATE_MACHINE_ARN:
+        raise RuntimeError("State machine is not configured")
+
+    message = request["message"]
+    conversation_id = request["conversationId"] or str(uuid.uuid4())
+    timestamp = datetime.utcnow().isoformat()
+    # 同じ会話の2回目以降は実行名が重複しないよう接尾辞を付ける（input_handlerと同じ命名）
+    execution_name = f"chat-{conversation_id}"
+    if request["conversationId"]:
+        execution_name = f"{execution_name}-{uuid.uuid4().hex[:8]}"
+
+    provisional = reporting_rules.suggest(message) if reporting_rules else None
+    save_turn(conversation_id, timestamp, message, provisional, request["userId"])
+    record_processing(conversation_id, timestamp, provisional)
+
+    stepfunctions.start_execution(
+        stateMachineArn=STATE_MACHINE_ARN,
+        name=execution_name,
+        input=json.dumps({
+            "conversationId": conversation_id,
+            "message": message,
+            "timestamp": timestamp,
+            "connectionId": request["connectionId"],
+            "bypassCache": request["bypassCache"],
+            "provisional": provisional
+        }, ensure_ascii=False)
+    )
+
+    return {
+        "conversationId": conversation_id,
+        "status": "processing",
+        "timestamp": timestamp,
+        "provisional": provisional
+    }
+
+def save_turn(conversation_id, timestamp, message, provisional, user_id):
+    """受け付けたやり取りを会話テーブルに保存（結果の通知先の利用者も記録）"""
+    if conversations_table is None:
+        return
+
+    item = {
+        "conversationId": conversation_id,
+        "timestamp": timestamp,
+        "message": message,
+        "status": "processing",
+        "provisional": provisional
+    }
+    if user_id:
+        item["userId"] = user_id
+
+    try:
+        conversations_table.put_item(Item=item)
+    except Exception as e:
+        # 保存に失敗しても分析は開始する
+        print(f"Failed to save turn: {str(e)}")
+
+def record_processing(conversation_id, timestamp, provisional):
+    """状態取得APIがすぐに見つけられるよう、開始前に会話の状態アイテムへ分析中を記録"""
+    if conversations_table is None:
+        return
+
+    try:
+        mark_processing(conversations_table, conversation_id, timestamp, provisional)
+    except Exception as e:
+        print(f"Failed to record processing status: {str(e)}")
+
+def check_conversation_access(conversation_id, user_id):
+    """接続の利用者が会話の所有者か（会話テーブルがない場合は確認しない）"""
+    if conversations_table is None:
+        return True
+    return can_access_conversation(conversations_table, conversation_id, user_id)
+
+def get_connection_user(connection_id):
+    """接続時に登録した利用者（未認証・未登録の場合は空文字）"""
+    if connections_table is None:
+        return ''
+
+    try:
+        response = connections_table.get_item(
+            Key={'connectionId': connection_id},
+            ProjectionExpression='userId'
+        )
+        return response.get('Item', {}).get('userId', '')
+    except Exception as e:
+        print(f"Failed to get connection user: {str(e)}")
+        return ''
+
+def send(endpoint, connection_id, payload):
+    """送信元の接続に応答を送る（切断済みなどで送れなくても処理は続ける）"""
+    try:
+        get_management_client(endpoint).post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        )
+    except Exception as e:
+        print(f"Failed to reply to {connection_id}: {str(e)}")
@@ -0,0 +1,265 @@
+"""
+Bedrock Runtimeクライアントのラッパー
+
+- トークンバケットによる送信ペース制御（モデルごとのRPM・TPMクォータに合わせる）
+  バケットはコンテナごとに持つため、渡すRPM・TPMはクォータを同時実行数で割った値にする
+- ジッター付きの再試行（再試行予算を使い切ったら再試行しない）
+- サーキットブレーカー（失敗が続いたら一定時間は即座に失敗させる）
+
+スロットリングが起きてから再試行を重ねるより、送信側でペースを守るほうが
+Lambdaの同時実行数を無駄に消費しない。
+"""
+import io
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError, IncompleteReadError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+# 再試行の対象とするエラー
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "ModelTimeoutException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+}
+
+
+class BedrockUnavailableError(Exception):
+    """Bedrockを呼び出せない（呼び出し側はルールベースの分析に切り替える）"""
+
+
+class CircuitOpenError(BedrockUnavailableError):
+    """サーキットブレーカーが開いているため呼び出さなかった"""
+
+
+class RateLimitExceededError(BedrockUnavailableError):
+    """クォータ内に収めるための待ち時間が上限を超えた"""
+
+
+class TokenBucket:
+    """
+    一定の速度で補充されるバケットから量を取り出す（足りなければ補充を待つ）
+    容量より大きな要求は満杯になれば通し、超えた分は残量をマイナス（借り）にして後の要求に待たせる
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount: float, max_wait: float) -> float:
+        """
+        amountを予約し、使えるようになるまでの待ち時間（秒）を返す
+        待ち時間がmax_waitを超える場合は予約せずにRateLimitExceededErrorを送出
+        """
+        with self.lock:
+            self._refill()
+            # バケットより大きな要求は満杯になるまで待ち、全量を引く（1分あたりの総量はクォータに収まる）
+            wait = max(0.0, (min(amount, self.capacity) - self.available) / self.refill_per_second)
+            if wait > max_wait:
+                raise RateLimitExceededError(f"Rate limit wait {wait:.2f}s exceeds {max_wait:.2f}s")
+            self.available -= amount
+            return wait
+
+
+class RetryBudget:
+    """
+    再試行に使える予算（成功するたびに少しずつ回復する）
+    障害時に全リクエストが再試行を重ねて負荷を増幅するのを防ぐ
+    """
+
+    def __init__(self, capacity: float = 10.0, retry_cost: float = 1.0, success_refund: float = 0.1):
+        self.capacity = capacity
+        self.retry_cost = retry_cost
+        self.success_refund = success_refund
+        self.available = capacity
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            if self.available < self.retry_cost:
+                return False
+            self.available -= self.retry_cost
+            return True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.available = min(self.capacity, self.available + self.success_refund)
+
+
+class CircuitBreaker:
+    """連続失敗回数で開き、reset_timeout秒後に1件だけ試して閉じるか判断する"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # 試行の1件だけ通す（試行が結果を返さないまま時間が経った場合は次の1件を通す）
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return
+            raise CircuitOpenError(f"Bedrock circuit is {self.state}")
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Bedrock circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def estimate_request_tokens(body: str) -> int:
+    """
+    リクエストが消費するトークン数を概算（入力の文字数＋max_tokens）
+    日本語は1文字ほぼ1トークンのため文字数で近似する
+    """
+    try:
+        request = json.loads(body)
+    except (TypeError, ValueError):
+        return 0
+
+    input_chars = 0
+    for message in request.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        input_chars += len(content)
+    input_chars += len(request.get("inputText", ""))
+    return input_chars + int(request.get("max_tokens", 0))
+
+
+class BedrockClient:
+    """
+    boto3のbedrock-runtimeクライアントと同じ呼び出し方で使えるラッパー
+    クォータ・再試行・サーキットブレーカーの状態はコンテナ内で共有される
+    （requests_per_minute・tokens_per_minuteはこのコンテナに割り当てる分）
+    """
+
+    def __init__(
+        self,
+        region_name: Optional[str] = None,
+        requests_per_minute: float = 10,
+        tokens_per_minute: float = 20000,
+        max_wait_seconds: float = 5.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        client: Any = None,
+        endpoint_url: Optional[str] = None,
+    ):
+        # 再試行はこのラッパーで行うため、boto3側の再試行は無効にする
+        # endpoint_urlはローカルのエミュレーター（scripts/utils/bedrock_emulator.py）向け
+        self.client = client or boto3.client(
+            "bedrock-runtime",
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=Config(retries={"max_attempts": 1, "mode": "standard"}),
+        )
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait_seconds = max_wait_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = RetryBudget()
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # クォータはモデルごと
+        self.limiters: Dict[str, tuple] = {}
+        self.limiters_lock = threading.Lock()
+
+    def invoke_model(self, **kwargs) -> Dict[str, Any]:
+        return self._call(self._invoke_model_and_read, kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict[str, Any]:
+        # ストリームの途中で切れた場合は再試行しない（送信済みの部分があるため）
+        return self._call(self.client.invoke_model_with_response_stream, kwargs)
+
+    def _invoke_model_and_read(self, **kwargs) -> Dict[str, Any]:
+        """応答本文まで読む（読み込み中の切断・タイムアウトも再試行とサーキットブレーカーの対象にする）"""
+        response = self.client.invoke_model(**kwargs)
+        response["body"] = io.BytesIO(response["body"].read())
+        return response
+
+    def _limiters_for(self, model_id: str) -> tuple:
+        with self.limiters_lock:
+            if model_id not in self.limiters:
+                self.limiters[model_id] = (
+                    TokenBucket(max(1.0, self.requests_per_minute / 60), self.requests_per_minute / 60),
+                    TokenBucket(self.tokens_per_minute / 60, self.tokens_per_minute / 60),
+                )
+            return self.limiters[model_id]
+
+    def _pace(self, model_id: str, body: str) -> None:
+        """クォータ内に収まるまで待つ（1分間のバケットを秒単位の容量で持ち、バーストを抑える）"""
+        request_bucket, token_bucket = self._limiters_for(model_id)
+        wait = request_bucket.reserve(1, self.max_wait_seconds)
+        wait = max(wait, token_bucket.reserve(estimate_request_tokens(body), self.max_wait_seconds))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _call(self, method, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        self.circuit_breaker.before_call()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            # 再試行もクォータの範囲で送る
+            self._pace(kwargs.get("modelId", ""), kwargs.get("body", ""))
+            try:
+                response = method(**kwargs)
+            except (ClientError, BotocoreConnectionError, HTTPClientError, IncompleteReadError) as e:
+                # 接続・読み込みのタイムアウトもモデルのタイムアウトと同様に扱う
+                code = e.response.get("Error", {}).get("Code", "") if isinstance(e, ClientError) else type(e).__name__
+                if isinstance(e, ClientError) and code not in RETRYABLE_ERRORS:
+                    # リクエスト自体の誤りはBedrockの障害としても成功としても数えない
+                    raise
+
+                if attempt >= self.max_attempts or not self.retry_budget.try_acquire():
+                    self.circuit_breaker.record_failure()
+                    raise BedrockUnavailableError(f"{code} after {attempt} attempts") from e
+
+                # フルジッター付きの指数バックオフ
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                print(f"Bedrock {code}, retrying in {delay:.2f}s (attempt {attempt})")
+                time.sleep(delay)
+                continue
+
+            self.retry_budget.record_success()
+            self.circuit_breaker.record_success()
+            return response
@@ -0,0 +1,39 @@
+"""
+会話の利用者（所有者）の確認
+
+会話の所有者は最初のやり取りを記録した利用者とする（やり取りのレコードのuserId）。
+会話IDはクライアントが指定できるため、続きの送信や履歴の取得の前に、
+呼び出し元がその会話の所有者であることを確かめる。
+"""
+from typing import Any, Optional
+
+from boto3.dynamodb.conditions import Key
+
+# やり取りのソートキー（時刻）はこれより大きい（"#status"・"#summary"などのメタデータは含まれない）
+TURN_SORT_KEY_START = "0"
+
+
+def get_conversation_owner(table: Any, conversation_id: str) -> Optional[str]:
+    """
+    最初のやり取りを記録した利用者を返す
+    会話がない場合はNone、利用者が記録されていない場合（未認証の経路）は空文字
+    """
+    response = table.query(
+        KeyConditionExpression=Key("conversationId").eq(conversation_id) & Key("timestamp").gt(TURN_SORT_KEY_START),
+        ProjectionExpression="userId",
+        ScanIndexForward=True,
+        Limit=1,
+    )
+    items = response.get("Items", [])
+    if not items:
+        return None
+    return items[0].get("userId", "")
+
+
+def can_access_conversation(table: Any, conversation_id: str, user_id: str) -> bool:
+    """
+    呼び出し元がその会話を参照・継続できるか
+    まだやり取りのない会話と、所有者が記録されていない会話は許可する
+    """
+    owner = get_conversation_owner(table, conversation_id)
+    return not owner or owner == user_id
@@ -0,0 +1,112 @@
+"""
+会話の状態アイテム（ソートキー "#status"）の書き込み
+
+状態取得APIはこのアイテムだけを読む。分析の経路（Step Functions・キュー・
+Expressワークフロー・一括送信）に関わらず、受付・完了・失敗をここに記録する。
+ステートマシン（step_functions_construct.py）も同じ形式で書き込む:
+    status         processing / completed / error
+    turnTimestamp  分析中のやり取りの時刻
+    provisional    暫定結果（JSON文字列）
+    result         分析結果（JSON文字列）
+    error          エラーの内容
+    updatedAt      更新時刻（ISO 8601、UTC）
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+STATUS_SORT_KEY = "#status"
+
+PROCESSING = "processing"
+COMPLETED = "completed"
+ERROR = "error"
+
+
+def status_key(conversation_id: str) -> Dict[str, str]:
+    """会話の状態アイテムのキー"""
+    return {"conversationId": conversation_id, "timestamp": STATUS_SORT_KEY}
+
+
+def mark_processing(table: Any, conversation_id: str, turn_timestamp: str,
+                    provisional: Optional[Dict[str, Any]] = None) -> None:
+    """分析の受付を記録（前回のやり取りの結果・エラーは消す）"""
+    table.update_item(
+        Key=status_key(conversation_id),
+        UpdateExpression=(
+            "SET #status = :status, #turn = :turn, #provisional = :provisional, "
+            "#updatedAt = :updatedAt REMOVE #result, #error"
+        ),
+        ExpressionAttributeNames={
+            "#status": "status",
+            "#turn": "turnTimestamp",
+            "#provisional": "provisional",
+            "#updatedAt": "updatedAt",
+            "#result": "result",
+            "#error": "error",
+        },
+        ExpressionAttributeValues={
+            ":status": PROCESSING,
+            ":turn": turn_timestamp,
+            ":provisional": to_json(provisional),
+            ":updatedAt": now(),
+        },
+    )
+
+
+def processing_item(conversation_id: str, turn_timestamp: str,
+                    provisional: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """分析の受付を表す状態アイテム（BatchWriteItemでまとめて書き込む場合用。前回の結果・エラーは含まない）"""
+    return {
+        **status_key(conversation_id),
+        "status": PROCESSING,
+        "turnTimestamp": turn_timestamp,
+        "provisional": to_json(provisional),
+        "updatedAt": now(),
+    }
+
+
+def mark_completed(table: Any, conversation_id: str, result: Dict[str, Any]) -> None:
+    """分析結果を記録（暫定結果は消す）"""
+    table.update_item(
+        Key=status_key(conversation_id),
+        UpdateExpression="SET #status = :status, #result = :result, #updatedAt = :updatedAt REMOVE #provisional",
+        ExpressionAttributeNames={
+            "#status": "status",
+            "#result": "result",
+            "#updatedAt": "updatedAt",
+            "#provisional": "provisional",
+        },
+        ExpressionAttributeValues={
+            ":status": COMPLETED,
+            ":result": to_json(result),
+            ":updatedAt": now(),
+        },
+    )
+
+
+def mark_error(table: Any, conversation_id: str, error: str) -> None:
+    """分析の失敗を記録"""
+    table.update_item(
+        Key=status_key(conversation_id),
+        UpdateExpression="SET #status = :status, #error = :error, #updatedAt = :updatedAt",
+        ExpressionAttributeNames={
+            "#status": "status",
+            "#error": "error",
+            "#updatedAt": "updatedAt",
+        },
+        ExpressionAttributeValues={
+            ":status": ERROR,
+            ":error": error,
+            ":updatedAt": now(),
+        },
+    )
+
+
+def to_json(value: Any) -> str:
+    """ステートマシンのJsonToStringと同じく、JSON文字列として保存する"""
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def now() -> str:
+    """ステートマシンの$$.State.EnteredTimeと同じ形式の現在時刻"""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
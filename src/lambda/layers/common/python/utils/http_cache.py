@@ -0,0 +1,19 @@
+"""
+条件付きGET（ETag / If-None-Match）の共通処理
+
+状態取得APIと履歴取得APIが同じ方法でETagを作成・比較する。
+"""
+import hashlib
+
+
+def build_etag(body: str) -> str:
+    """応答ボディから強いETagを作成"""
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Matchのいずれかが一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in [value[2:] if value.startswith("W/") else value for value in candidates]
@@ -0,0 +1,213 @@
+"""
+メモリマップした辞書による軽量な日本語キーワード抽出
+
+辞書ファイルの形式（リトルエンディアン）:
+    ヘッダ
+        magic        4バイト  b"HKDC"
+        version      uint16
+        max_chars    uint16   見出し語の最大文字数
+        count        uint32
+    エントリ表  count × (offset uint32, length uint16, pos uint8, weight uint8)
+        見出し語のUTF-8バイト列の昇順（= コードポイント順）に並ぶ
+    文字列領域  見出し語のUTF-8バイト列を連結したもの
+
+ファイルはmmapで開くだけで、起動時に全体を読み込んだり解析したりしない。
+検索はエントリ表の二分探索で、必要なページだけがOSによって読み込まれる。
+"""
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+MAGIC = b"HKDC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+ENTRY = struct.Struct("<IHBB")
+
+# 品詞
+POS_NOUN = 1
+POS_PROPER = 2
+POS_STOP = 3
+POS_NAMES = {"noun": POS_NOUN, "proper": POS_PROPER, "stop": POS_STOP}
+
+# 辞書にない語の品詞（文字種から推定）
+POS_UNKNOWN = 0
+POS_FUNCTION = 4
+
+DEFAULT_DICTIONARY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "keyword_dictionary.bin"
+)
+
+
+class Token(NamedTuple):
+    """分割結果の1語"""
+    surface: str
+    start: int
+    pos: int
+    weight: int
+
+
+def encode_dictionary(entries: Iterable[Tuple[str, int, int]]) -> bytes:
+    """(見出し語, 品詞, 重み) の組をバイナリ形式にエンコード"""
+    encoded = sorted({word.encode("utf-8"): (pos, weight) for word, pos, weight in entries}.items())
+
+    table = bytearray()
+    strings = bytearray()
+    max_chars = 0
+    for word_bytes, (pos, weight) in encoded:
+        table += ENTRY.pack(len(strings), len(word_bytes), pos, weight)
+        strings += word_bytes
+        max_chars = max(max_chars, len(word_bytes.decode("utf-8")))
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, max_chars, len(encoded)) + bytes(table) + bytes(strings)
+
+
+class KeywordDictionary:
+    """メモリマップした辞書ファイル"""
+
+    def __init__(self, path: str = DEFAULT_DICTIONARY_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.max_chars, self.count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported keyword dictionary format: {magic!r} v{version}")
+
+        self._table_offset = HEADER.size
+        self._strings_offset = HEADER.size + self.count * ENTRY.size
+        # 先頭文字ごとの探索範囲（使われた文字だけを覚えておく）
+        self._first_char_ranges: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, index: int) -> Tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self._mmap, self._table_offset + index * ENTRY.size)
+
+    def _word(self, index: int) -> bytes:
+        offset, length, _, _ = self._entry(index)
+        start = self._strings_offset + offset
+        return self._mmap[start:start + length]
+
+    def _narrow(self, lo: int, hi: int, prefix: bytes) -> Tuple[int, int]:
+        """[lo, hi) のうち、prefixで始まる見出し語の範囲を返す"""
+        size = len(prefix)
+
+        left, right = lo, hi
+        while left < right:
+            middle = (left + right) // 2
+            if self._word(middle)[:size] < prefix:
+                left = middle + 1
+            else:
+                right = middle
+        start = left
+
+        right = hi
+        while left < right:
+            middle = (left + right) // 2
+            if self._word(middle)[:size] <= prefix:
+                left = middle + 1
+            else:
+                right = middle
+        return start, left
+
+    def longest_match(self, text: str, start: int) -> Optional[Tuple[int, int, int]]:
+        """textのstart位置から始まる最長の見出し語を探し (文字数, 品詞, 重み) を返す"""
+        first = text[start]
+        if first not in self._first_char_ranges:
+            self._first_char_ranges[first] = self._narrow(0, self.count, first.encode("utf-8"))
+        lo, hi = self._first_char_ranges[first]
+
+        best = None
+        prefix = first.encode("utf-8")
+        end = start + 1
+        while lo < hi:
+            # 範囲の先頭が接頭辞そのものなら見出し語として一致
+            if self._word(lo) == prefix:
+                _, _, pos, weight = self._entry(lo)
+                best = (end - start, pos, weight)
+
+            if end >= len(text) or end - start >= self.max_chars:
+                break
+            prefix += text[end].encode("utf-8")
+            end += 1
+            lo, hi = self._narrow(lo, hi, prefix)
+
+        return best
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+def char_type(char: str) -> str:
+    """文字種を判定（未知語はこの単位でまとめる）"""
+    code = ord(char)
+    if 0x3041 <= code <= 0x309F:
+        return "hiragana"
+    if 0x30A1 <= code <= 0x30FF or 0xFF66 <= code <= 0xFF9F:
+        return "katakana"
+    if 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or char in "々〆ヶ":
+        return "kanji"
+    if char.isalnum():
+        return "alnum"
+    return "other"
+
+
+class KeywordExtractor:
+    """
+    辞書による最長一致と文字種による未知語の切り出しで本文を分割し、キーワードを抽出する
+    """
+
+    def __init__(self, dictionary: KeywordDictionary):
+        self.dictionary = dictionary
+
+    def tokenize(self, text: str) -> List[Token]:
+        """本文を語に分割（空白・記号は除く）"""
+        tokens = []
+        position = 0
+        length = len(text)
+        while position < length:
+            kind = char_type(text[position])
+            if kind == "other":
+                position += 1
+                continue
+
+            match = self.dictionary.longest_match(text, position)
+            if match:
+                size, pos, weight = match
+                tokens.append(Token(text[position:position + size], position, pos, weight))
+                position += size
+                continue
+
+            # 未知語: 同じ文字種が続く範囲（途中から辞書の語が始まる場合はそこまで）
+            end = position + 1
+            while end < length and char_type(text[end]) == kind:
+                if kind != "hiragana" and self.dictionary.longest_match(text, end):
+                    break
+                end += 1
+
+            pos = POS_FUNCTION if kind == "hiragana" else POS_UNKNOWN
+            tokens.append(Token(text[position:end], position, pos, 1))
+            position = end
+
+        return tokens
+
+    def extract(self, text: str, limit: int = 5) -> List[str]:
+        """
+        名詞・固有名詞と、2文字以上の未知語（漢字・カタカナ・英数字）をキーワードとする
+        出現回数×重みの大きい順（同点なら先に出現した順）に最大limit件を返す
+        """
+        scores: Dict[str, int] = {}
+        first_seen: Dict[str, int] = {}
+        for token in self.tokenize(text):
+            if token.pos in (POS_NOUN, POS_PROPER) or (token.pos == POS_UNKNOWN and len(token.surface) >= 2):
+                scores[token.surface] = scores.get(token.surface, 0) + max(token.weight, 1)
+                first_seen.setdefault(token.surface, token.start)
+
+        ranked = sorted(scores, key=lambda word: (-scores[word], first_seen[word]))
+        return ranked[:limit]
+
+
+def load_extractor(path: str = DEFAULT_DICTIONARY_PATH) -> KeywordExtractor:
+    """辞書ファイルをメモリマップしてキーワード抽出器を作成"""
+    return KeywordExtractor(KeywordDictionary(path))
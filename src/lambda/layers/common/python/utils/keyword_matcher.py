@@ -0,0 +1,123 @@
+"""
+Aho-Corasick法による複数キーワードの一括マッチング
+
+キーワードごとに本文を走査すると、キーワード数×本文長の時間がかかる。
+コールドスタート時に全キーワードからオートマトンを1回だけ構築しておけば、
+キーワードが数千件に増えても本文を1回走査するだけで全ての出現位置が得られる。
+"""
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple
+
+
+class KeywordHit(NamedTuple):
+    """キーワードの出現（endは末尾の次の位置）"""
+    start: int
+    end: int
+    keyword: str
+    labels: tuple
+
+
+class KeywordMatcher:
+    """
+    キーワードとラベルの組からオートマトンを構築し、本文中の全出現を返す
+
+    ラベルは任意の値で、1つのキーワードに複数付けられる
+    （例: ("category", "技術的な問題") と ("department", "dept-003")）。
+    """
+
+    def __init__(self):
+        # ノードごとの遷移・失敗遷移・そのノードで終わるキーワードの番号
+        # （_ownはそのノードまでの文字列と一致するキーワード、_outputsは失敗遷移先の分も含めたもの）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[int]] = [[]]
+        self._outputs: List[List[int]] = [[]]
+        self._keywords: List[str] = []
+        self._labels: List[List[Any]] = []
+        self._index: Dict[str, int] = {}
+        self._built = False
+
+    def add(self, keyword: str, label: Any) -> None:
+        """キーワードにラベルを追加（同じキーワードは1つにまとめる）"""
+        if not keyword:
+            return
+
+        if keyword in self._index:
+            labels = self._labels[self._index[keyword]]
+            if label not in labels:
+                labels.append(label)
+            return
+
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+
+        self._index[keyword] = len(self._keywords)
+        self._own[node].append(len(self._keywords))
+        self._keywords.append(keyword)
+        self._labels.append([label])
+        self._built = False
+
+    def add_all(self, keywords: Iterable[str], label: Any) -> None:
+        """複数のキーワードに同じラベルを追加"""
+        for keyword in keywords:
+            self.add(keyword, label)
+
+    def build(self) -> "KeywordMatcher":
+        """
+        失敗遷移を幅優先で計算する（add後、検索前に呼ぶ）
+        出力は毎回各ノードのキーワードから作り直すため、addの後に何度呼んでもよい
+        """
+        self._outputs = [list(own) for own in self._own]
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+
+                # 失敗遷移先で終わるキーワードも、このノードで終わる
+                self._outputs[child] = self._own[child] + self._outputs[self._fail[child]]
+
+        self._built = True
+        return self
+
+    def find_all(self, text: str) -> List[KeywordHit]:
+        """本文を1回走査し、全キーワードの出現を出現順に返す"""
+        if not self._built:
+            self.build()
+
+        hits = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            for keyword_index in self._outputs[node]:
+                keyword = self._keywords[keyword_index]
+                hits.append(KeywordHit(
+                    position + 1 - len(keyword),
+                    position + 1,
+                    keyword,
+                    tuple(self._labels[keyword_index])
+                ))
+        return hits
+
+    def __len__(self) -> int:
+        return len(self._keywords)
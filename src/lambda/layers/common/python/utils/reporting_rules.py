@@ -0,0 +1,98 @@
+"""
+報告ルール（organization_structure.json の reportingRules）による暫定的な報告先の提案
+
+Bedrockの分析が終わるまでの間に表示する暫定結果を、キーワードの一致だけで
+即座に作成する。分析結果が届いたら置き換えられる前提のため、精度より速さを優先する。
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from utils.keyword_matcher import KeywordMatcher
+
+DEFAULT_RULES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "organization_structure.json"
+)
+
+URGENCY_LEVELS = {"high": "高", "medium": "中", "low": "低"}
+
+DEFAULT_RECIPIENT = "直属の上司"
+
+
+class ReportingRules:
+    """報告ルールと組織構造から、キーワードに応じた報告先を提案する"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.rules: List[Dict[str, Any]] = data.get("reportingRules", [])
+        self.departments: Dict[str, str] = {}
+        self.roles: Dict[str, str] = {}
+        for department in data.get("organization", {}).get("departments", []):
+            self.departments[department["id"]] = department["name"]
+            for role in department.get("roles", []):
+                self.roles[role["id"]] = role.get("title", "")
+
+        self.matcher = KeywordMatcher()
+        for index, rule in enumerate(self.rules):
+            self.matcher.add_all(rule.get("keywords", []), index)
+        self.matcher.build()
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_RULES_PATH) -> "ReportingRules":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, text: str) -> Optional[Dict[str, Any]]:
+        """最も多くキーワードが一致したルールと、一致したキーワードを返す（同数なら定義順）"""
+        counts: Dict[int, int] = {}
+        keywords: Dict[int, List[str]] = {}
+        for hit in self.matcher.find_all(text):
+            for index in hit.labels:
+                counts[index] = counts.get(index, 0) + 1
+                if hit.keyword not in keywords.setdefault(index, []):
+                    keywords[index].append(hit.keyword)
+
+        if not counts:
+            return None
+        best = min(counts, key=lambda index: (-counts[index], index))
+        return {"rule": self.rules[best], "keywords": keywords[best]}
+
+    def suggest(self, text: str) -> Dict[str, Any]:
+        """
+        分析結果と同じ形式の暫定結果を作成（provisional=True）
+        報告先は推奨部署と、エスカレーションパスの最初の役職
+        """
+        matched = self.match(text)
+        if matched is None:
+            return {
+                "category": "その他",
+                "urgency": "低",
+                "recommendedRecipient": DEFAULT_RECIPIENT,
+                "recommendedRecipients": [],
+                "keywords": [],
+                "provisional": True,
+            }
+
+        rule = matched["rule"]
+        keywords = matched["keywords"]
+        escalation_path = rule.get("escalationPath", [])
+        first_role = self.roles.get(escalation_path[0], "") if escalation_path else ""
+
+        recipients = []
+        for department_id in rule.get("suggestedDepartments", []):
+            department = self.departments.get(department_id, "")
+            recipients.append({
+                "department": department,
+                "role": first_role,
+                "reason": f"「{'」「'.join(keywords)}」に関する相談は{department}の担当です",
+            })
+
+        first = recipients[0] if recipients else {}
+        return {
+            "category": rule.get("category", "その他"),
+            "urgency": URGENCY_LEVELS.get(rule.get("urgencyLevel"), "低"),
+            "recommendedRecipient": f"{first.get('department', '')} {first.get('role', '')}".strip() or DEFAULT_RECIPIENT,
+            "recommendedRecipients": recipients,
+            "escalationPath": [self.roles.get(role_id, role_id) for role_id in escalation_path],
+            "keywords": keywords,
+            "provisional": True,
+        }
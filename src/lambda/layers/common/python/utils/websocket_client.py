@@ -0,0 +1,122 @@
+"""
+WebSocket（API Gateway Management API）への送信
+
+- 多数の接続へ上限付きのスレッドプールで並行して送信する
+- Management APIのクライアントはエンドポイントごとに1つ作り、コンテナ内で共有する
+- 切断済み（GoneException）の接続は接続管理テーブルからまとめて削除する
+
+全社へのお知らせや多数の閲覧者への状態通知も、1回の呼び出しの中で送り終える。
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Union
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_MAX_WORKERS = 16
+
+# エンドポイントごとのクライアント
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def management_endpoint(websocket_url: str) -> str:
+    """post_to_connectionに使うhttpsのエンドポイント（wss://のURLも受け付ける）"""
+    return websocket_url.replace("wss://", "https://", 1).rstrip("/")
+
+
+def get_management_client(websocket_url: str, max_pool_connections: int = DEFAULT_MAX_WORKERS) -> Any:
+    """WebSocketエンドポイントごとのAPI Gateway Management APIクライアントを取得"""
+    endpoint_url = management_endpoint(websocket_url)
+    with _clients_lock:
+        if endpoint_url not in _clients:
+            # 並行して送信するスレッド数だけ接続を持てるようにする
+            _clients[endpoint_url] = boto3.client(
+                "apigatewaymanagementapi",
+                endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max_pool_connections),
+            )
+        return _clients[endpoint_url]
+
+
+@dataclass
+class FanoutResult:
+    """送信結果（接続IDの一覧）"""
+
+    sent: List[str] = field(default_factory=list)
+    gone: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"sent": len(self.sent), "gone": len(self.gone), "failed": len(self.failed)}
+
+
+class WebSocketFanout:
+    """
+    複数の接続へ同じメッセージを並行して送信する
+    connections_tableを指定した場合、切断済みの接続を送信後にまとめて削除する
+    """
+
+    def __init__(self, connections_table: Any = None, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.connections_table = connections_table
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="websocket-fanout")
+
+    def send(self, targets: Dict[str, str], message: Union[Dict[str, Any], str, bytes]) -> FanoutResult:
+        """
+        targets（接続ID → エンドポイント）の全てにmessageを送信
+        1件ずつの失敗は他の送信を止めない
+        """
+        data = encode_message(message)
+        futures = {
+            connection_id: self.executor.submit(self._post, endpoint, connection_id, data)
+            for connection_id, endpoint in targets.items()
+            if endpoint
+        }
+
+        result = FanoutResult()
+        for connection_id, future in futures.items():
+            getattr(result, future.result()).append(connection_id)
+
+        if result.gone:
+            self.prune(result.gone)
+        return result
+
+    def broadcast(self, websocket_url: str, connection_ids: Iterable[str], message: Union[Dict[str, Any], str, bytes]) -> FanoutResult:
+        """同じエンドポイントの多数の接続へ送信"""
+        return self.send({connection_id: websocket_url for connection_id in connection_ids}, message)
+
+    def prune(self, connection_ids: Iterable[str]) -> None:
+        """切断済みの接続を接続管理テーブルからまとめて削除（BatchWriteItemで25件ずつ）"""
+        if self.connections_table is None:
+            return
+        try:
+            with self.connections_table.batch_writer() as batch:
+                for connection_id in connection_ids:
+                    batch.delete_item(Key={"connectionId": connection_id})
+        except Exception as e:
+            # 削除できなかった接続もTTLで消える
+            print(f"Failed to prune gone connections: {str(e)}")
+
+    def _post(self, endpoint: str, connection_id: str, data: bytes) -> str:
+        """1つの接続に送信し、sent・gone（切断済み）・failedのいずれかを返す"""
+        client = get_management_client(endpoint, self.max_workers)
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=data)
+            return "sent"
+        except client.exceptions.GoneException:
+            return "gone"
+        except Exception as e:
+            print(f"Error sending WebSocket message to {connection_id}: {str(e)}")
+            return "failed"
+
+
+def encode_message(message: Union[Dict[str, Any], str, bytes]) -> bytes:
+    if isinstance(message, bytes):
+        return message
+    if not isinstance(message, str):
+        message = json.dumps(message, ensure_ascii=False, default=str)
+    return message.encode("utf-8")
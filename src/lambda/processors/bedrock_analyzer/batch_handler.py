@@ -0,0 +1,122 @@
+"""
+SQSキューから相談をまとめて受け取り、並行して分析するハンドラー
+
+Step Functions経由では1実行につき1件ずつ分析するため、朝の集中時間帯は
+Lambdaの起動コストがかさみ、Bedrockの呼び出しも重ねられない。
+キュー経由では1回の起動で最大バッチサイズ分の相談を受け取り、
+スレッドプールでBedrockの呼び出しを並行させる。
+1件あたりの待ち時間の上限はSQSイベントソースのバッチウィンドウで決まる。
+
+分析後の処理（組織マッチング・結果の保存・WebSocket通知・状態アイテムの記録）は
+Step Functions経由と同じにするため、分析結果を入力に含めてステートマシンを開始する
+（ステートマシンはBedrockの分析を飛ばして完了処理だけを行う）。
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from aws_lambda_powertools.metrics import MetricUnit
+
+from lambda_function import (
+    analyze_consultation,
+    buffered_metrics,
+    conversations_table,
+    metrics,
+    update_conversation_record,
+)
+from utils.conversation_status import mark_completed, mark_error
+
+# 同時にBedrockを呼び出す最大数（モデルのスロットリングに合わせて調整）
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '8'))
+# キューの再配信の上限（これに達したら失敗を状態アイテムに記録する。DLQの設定と合わせる）
+BATCH_MAX_RECEIVE_COUNT = int(os.environ.get('BATCH_MAX_RECEIVE_COUNT', '3'))
+
+# 分析後の完了処理を行うステートマシン（未設定の場合は状態アイテムへの記録のみ）
+STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN', '')
+stepfunctions = boto3.client('stepfunctions')
+
+
+@metrics.log_metrics
+def lambda_handler(event, context):
+    """
+    SQSメッセージのバッチを分析し、失敗したメッセージのIDだけを返す
+    （失敗したものだけがキューに戻り再試行される）
+    """
+    records = event.get('Records', [])
+    print(f"Received {len(records)} records")
+
+    failures = []
+    if records:
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_CONCURRENCY, len(records))) as executor:
+            outcomes = executor.map(process_record, records)
+            for record, (succeeded, recorded_metrics) in zip(records, outcomes):
+                # ワーカースレッドで溜めたメトリクスはこのスレッドで出力する
+                for name, unit, value in recorded_metrics:
+                    metrics.add_metric(name=name, unit=unit, value=value)
+                if not succeeded:
+                    failures.append({"itemIdentifier": record['messageId']})
+
+    metrics.add_metric(name="BatchRecordsProcessed", unit=MetricUnit.Count, value=len(records))
+    metrics.add_metric(name="BatchRecordsFailed", unit=MetricUnit.Count, value=len(failures))
+
+    return {"batchItemFailures": failures}
+
+
+def process_record(record):
+    """
+    1件のメッセージを分析し、完了処理を開始する
+    (成功したか, 記録したメトリクス) を返す
+    """
+    with buffered_metrics() as recorded_metrics:
+        try:
+            consultation = json.loads(record['body'])
+        except ValueError as e:
+            # 再試行しても読めないため失敗として返さない（キューから削除する）
+            print(f"Invalid record {record.get('messageId')}: {str(e)}")
+            return True, recorded_metrics
+
+        conversation_id = consultation.get('conversationId', '')
+        try:
+            result = analyze_consultation(consultation)
+
+            update_conversation_record(
+                conversation_id,
+                consultation.get('timestamp', ''),
+                {"status": "completed", "analysis": result}
+            )
+            complete_analysis(consultation, result)
+            return True, recorded_metrics
+
+        except Exception as e:
+            print(f"Error processing record {record.get('messageId')}: {str(e)}")
+            # 最後の再配信でも失敗した場合は、分析中のまま残らないよう失敗を記録する（メッセージはDLQへ移る）
+            receive_count = int(record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
+            if receive_count >= BATCH_MAX_RECEIVE_COUNT and conversations_table is not None and conversation_id:
+                try:
+                    mark_error(conversations_table, conversation_id, str(e))
+                except Exception as status_error:
+                    print(f"Failed to record error status: {str(status_error)}")
+            return False, recorded_metrics
+
+
+def complete_analysis(consultation, result):
+    """
+    分析結果を入力に含めてステートマシンを開始する（組織マッチング・保存・通知・状態の記録）
+    同じメッセージの再配信では同じ実行名になるため、既に開始済みであれば成功として扱う
+    """
+    if not STATE_MACHINE_ARN:
+        if conversations_table is not None:
+            mark_completed(conversations_table, consultation['conversationId'], result)
+        return
+
+    execution_input = {key: value for key, value in consultation.items() if key != 'executionName'}
+    execution_input['analysis'] = result
+    try:
+        stepfunctions.start_execution(
+            stateMachineArn=STATE_MACHINE_ARN,
+            name=consultation.get('executionName') or f"chat-{consultation['conversationId']}",
+            input=json.dumps(execution_input, ensure_ascii=False, default=str)
+        )
+    except stepfunctions.exceptions.ExecutionAlreadyExists:
+        print(f"Completion already started for {consultation['conversationId']}")
@@ -0,0 +1,183 @@
+"""
+別リージョンへのヘッジリクエスト
+
+プライマリリージョンの応答（ストリーミングの場合は最初のチャンク）が、
+過去の応答時間のパーセンタイルから決めた待ち時間内に返らなければ、
+セカンダリリージョンへ同じリクエストを送り、先に返ったほうを使う。
+ごく一部の数秒単位の遅延だけを別リージョンで救うため、追加のリクエストは
+おおむね (100 - パーセンタイル)% 程度に収まる。
+
+応答時間はモデルとストリーミングの有無ごとに記録する（最初のチャンクまでの時間と
+応答全体の時間、HaikuとSonnetでは分布が大きく異なるため）。
+非ストリーミングでは応答全体の時間のパーセンタイルで待ち時間を決め、上限で切り詰めない
+（記録が揃うまではヘッジしない）。
+プライマリが即座に失敗した場合にヘッジするのは、タイムアウト・スロットリング・
+サーバー側のエラーのときだけ（リクエスト自体の誤りは別リージョンでも失敗する）。
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+from utils.bedrock_client import RETRYABLE_ERRORS, BedrockUnavailableError
+
+# ヘッジ判定に使う最低サンプル数（これ未満は既定の待ち時間を使う）
+MIN_SAMPLES = 20
+
+# リクエストの実行用（バッチ分析の並列数×2リージョン分を確保）
+executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="bedrock-hedge")
+
+
+class LatencyTracker:
+    """
+    プライマリリージョンの応答時間を直近window件保持し、ヘッジまでの待ち時間を決める
+    default_msがNoneの場合は記録が揃うまでヘッジしない。max_msがNoneの場合は上限で切り詰めない
+    """
+
+    def __init__(self, percentile=95, window=200, default_ms=1500, min_ms=300, max_ms=3000):
+        self.percentile = percentile
+        self.samples = deque(maxlen=window)
+        self.default_ms = default_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.lock = threading.Lock()
+
+    def record(self, elapsed_ms):
+        with self.lock:
+            self.samples.append(elapsed_ms)
+
+    def hedge_delay(self):
+        """ヘッジするまでの待ち時間（秒）。ヘッジしない場合はNone"""
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                delay_ms = self.default_ms
+            else:
+                ordered = sorted(self.samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                delay_ms = ordered[index]
+        if delay_ms is None:
+            return None
+        if self.max_ms is not None:
+            delay_ms = min(self.max_ms, delay_ms)
+        return max(self.min_ms, delay_ms) / 1000
+
+
+def is_hedgeable_error(error):
+    """別リージョンなら成功しうるエラーか（タイムアウト・スロットリング・サーバー側のエラー）"""
+    if isinstance(error, (BedrockUnavailableError, BotocoreConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error.response.get("Error", {}).get("Code", "") in RETRYABLE_ERRORS or status == 429 or status >= 500
+    return False
+
+
+class HedgedBedrock:
+    """
+    2つのリージョンのBedrockクライアントでヘッジしながら呼び出す
+    戻り値は (結果, ヘッジ情報)。ヘッジ情報は {"hedged", "winner", "delayMs"}
+    tracker_settingsはLatencyTrackerの引数（ストリーミング用。非ストリーミングでは既定値と上限を使わない）
+    """
+
+    def __init__(self, primary, secondary, tracker_settings=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.tracker_settings = tracker_settings or {}
+        self.trackers = {}
+        self.trackers_lock = threading.Lock()
+
+    def tracker_for(self, model_id, streaming):
+        """モデルとストリーミングの有無ごとの応答時間"""
+        key = (model_id, streaming)
+        with self.trackers_lock:
+            if key not in self.trackers:
+                settings = dict(self.tracker_settings)
+                if not streaming:
+                    settings.update(default_ms=None, max_ms=None)
+                self.trackers[key] = LatencyTracker(**settings)
+            return self.trackers[key]
+
+    def invoke_model(self, **kwargs):
+        """応答本文（bytes）を返す。待ち時間は応答全体の時間から決める"""
+        def attempt(client):
+            return client.invoke_model(**kwargs)['body'].read()
+
+        return self._race(self.tracker_for(kwargs.get('modelId', ''), False), attempt, lambda body: None)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        """最初のチャンクが先に届いたほうのイベント列を返す（もう一方のストリームは閉じる）"""
+        def attempt(client):
+            stream = client.invoke_model_with_response_stream(**kwargs)['body']
+            events = iter(stream)
+            first = next(events, None)
+            return stream, first, events
+
+        def cancel(result):
+            stream, _, _ = result
+            try:
+                stream.close()
+            except Exception as e:
+                print(f"Failed to close hedged stream: {str(e)}")
+
+        tracker = self.tracker_for(kwargs.get('modelId', ''), True)
+        (stream, first, events), hedge = self._race(tracker, attempt, cancel)
+        chained = itertools.chain([first], events) if first is not None else events
+        return chained, hedge
+
+    def _race(self, tracker, attempt, cancel):
+        delay = tracker.hedge_delay()
+        started = time.monotonic()
+
+        if delay is None:
+            result = attempt(self.primary)
+            tracker.record((time.monotonic() - started) * 1000)
+            return result, {"hedged": False, "winner": "primary", "delayMs": None}
+
+        primary = executor.submit(attempt, self.primary)
+        # 負けた場合も含め、プライマリの応答時間は全て記録する（待ち時間の推定を偏らせない）
+        primary.add_done_callback(
+            lambda future: future.exception() is None
+            and tracker.record((time.monotonic() - started) * 1000)
+        )
+
+        try:
+            return primary.result(timeout=delay), {"hedged": False, "winner": "primary", "delayMs": int(delay * 1000)}
+        except FutureTimeoutError:
+            print(f"Primary region slower than {delay * 1000:.0f} ms, hedging to secondary region")
+        except Exception as e:
+            if not is_hedgeable_error(e):
+                raise
+            # プライマリが即座に失敗した場合（サーキットが開いている・スロットリングなど）はすぐにセカンダリへ
+            print(f"Primary region failed, trying secondary region: {str(e)}")
+
+        secondary = executor.submit(attempt, self.secondary)
+        names = {primary: "primary", secondary: "secondary"}
+        pending = {future for future in names if not (future.done() and future.exception() is not None)}
+        error = primary.exception() if primary.done() else None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+            if not succeeded:
+                continue
+
+            winner = succeeded[0]
+            for other in succeeded[1:]:
+                cancel(other.result())
+            # 負けたほうは結果が届き次第破棄する
+            for other in pending:
+                if not other.cancel():
+                    other.add_done_callback(
+                        lambda loser: loser.exception() is None and cancel(loser.result())
+                    )
+            return winner.result(), {"hedged": True, "winner": names[winner], "delayMs": int(delay * 1000)}
+
+        raise error
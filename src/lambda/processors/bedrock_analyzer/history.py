@@ -0,0 +1,67 @@
+"""
+会話履歴をトークン予算内に収めてプロンプト用テキストにするユーティリティ
+
+直近のやり取りは予算の範囲で原文のまま含め、それより古いやり取りは
+会話ごとに保存している要約（ローリングサマリー）で置き換える。
+会話が長くなってもプロンプトの長さが一定以下に収まる。
+"""
+
+# 要約を保存する会話テーブルのソートキー（通常のやり取りは時刻をソートキーにする）
+SUMMARY_SORT_KEY = "#summary"
+
+ROLE_LABELS = {"user": "ユーザー", "assistant": "アシスタント"}
+
+
+def estimate_tokens(text):
+    """
+    日本語を含むテキストのトークン数を概算する
+    かな・漢字・全角記号は1文字ほぼ1トークン、英数字は4文字で1トークン程度として数える
+    """
+    if not text:
+        return 0
+    wide = sum(1 for char in text if ord(char) >= 0x2E80)
+    narrow = len(text) - wide
+    return wide + (narrow + 3) // 4
+
+
+def turn_lines(turn):
+    """1回のやり取り（相談と回答）をプロンプト用の行に変換"""
+    lines = [f"{ROLE_LABELS['user']}: {turn.get('message', '')}"]
+    if turn.get('response'):
+        lines.append(f"{ROLE_LABELS['assistant']}: {turn['response']}")
+    return lines
+
+
+def select_recent_turns(turns, token_budget):
+    """
+    新しい順に予算内に収まるやり取りを選ぶ
+    turnsは古い順。戻り値は (原文で含めるやり取り, 予算から外れたやり取り)（どちらも古い順）
+    """
+    used = 0
+    start = len(turns)
+    for index in range(len(turns) - 1, -1, -1):
+        tokens = sum(estimate_tokens(line) for line in turn_lines(turns[index]))
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        start = index
+    return turns[start:], turns[:start]
+
+
+def build_history_text(turns, summary, token_budget):
+    """要約と直近のやり取りからプロンプト用の履歴テキストを作成"""
+    recent, _ = select_recent_turns(turns, token_budget)
+
+    sections = []
+    if summary:
+        sections.append("■ これまでの会話の要約:\n" + summary)
+    if recent:
+        lines = [line for turn in recent for line in turn_lines(turn)]
+        sections.append("■ 直近の会話:\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def turns_to_summarize(turns, summarized_until, token_budget):
+    """予算から外れたやり取りのうち、まだ要約に含まれていないものを返す"""
+    _, older = select_recent_turns(turns, token_budget)
+    return [turn for turn in older if turn.get('timestamp', '') > summarized_until]
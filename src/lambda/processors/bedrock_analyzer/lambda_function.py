@@ -1,10 +1,202 @@
 import json
 import boto3
 import os
+import time
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from boto3.dynamodb.conditions import Key
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, single_metric
 
-# Bedrock Runtimeクライアント
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='ap-northeast-1')
+from prompts.templates import ANALYSIS_PROMPT_TEMPLATE, PROMPT_TEMPLATE_VERSION, SUMMARY_PROMPT_TEMPLATE
+from streaming import StreamPublisher
+from history import SUMMARY_SORT_KEY, build_history_text, turn_lines, turns_to_summarize
+from utils.keyword_matcher import KeywordMatcher
+from utils.keyword_extractor import load_extractor
+from utils.bedrock_client import BedrockClient, BedrockUnavailableError
+from utils.conversation_status import mark_completed, mark_error
 
+# Lambda Powertools
+metrics = Metrics()
+
+# Metricsはスレッドセーフではないため、キュー経由の並行分析ではワーカースレッドで
+# 記録したメトリクスをスレッドごとに溜め、ハンドラーのスレッドでまとめて出力する
+_metric_buffer = threading.local()
+
+def add_metric(name, unit, value):
+    """メトリクスを記録（buffered_metricsの中では溜めるだけ）"""
+    buffer = getattr(_metric_buffer, 'items', None)
+    if buffer is not None:
+        buffer.append((name, unit, value))
+    else:
+        metrics.add_metric(name=name, unit=unit, value=value)
+
+@contextmanager
+def buffered_metrics():
+    """このスレッドで記録したメトリクスを (name, unit, value) のリストに溜める"""
+    buffer = []
+    _metric_buffer.items = buffer
+    try:
+        yield buffer
+    finally:
+        _metric_buffer.items = None
+
+# Bedrock Runtimeクライアント（クォータに合わせた送信ペース制御・再試行・サーキットブレーカー付き）
+# 送信ペースはコンテナごとに守るため、アカウントのクォータを想定する同時実行数で分ける
+BEDROCK_EXPECTED_CONCURRENCY = max(1, int(os.environ.get('BEDROCK_EXPECTED_CONCURRENCY', '10')))
+BEDROCK_CLIENT_SETTINGS = {
+    "requests_per_minute": float(os.environ.get('BEDROCK_REQUESTS_PER_MINUTE', '100')) / BEDROCK_EXPECTED_CONCURRENCY,
+    "tokens_per_minute": float(os.environ.get('BEDROCK_TOKENS_PER_MINUTE', '200000')) / BEDROCK_EXPECTED_CONCURRENCY,
+    "max_wait_seconds": float(os.environ.get('BEDROCK_MAX_WAIT_SECONDS', '5')),
+    "max_attempts": int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3')),
+    "failure_threshold": int(os.environ.get('BEDROCK_CIRCUIT_FAILURE_THRESHOLD', '5')),
+    "reset_timeout": float(os.environ.get('BEDROCK_CIRCUIT_RESET_SECONDS', '30')),
+    # ローカルのエミュレーターに向ける場合のみ設定（scripts/utils/bedrock_emulator.py）
+    "endpoint_url": os.environ.get('BEDROCK_ENDPOINT_URL') or None
+}
+bedrock_runtime = BedrockClient(region_name='ap-northeast-1', **BEDROCK_CLIENT_SETTINGS)
+
+# ヘッジ設定（プライマリの応答が遅い場合にセカンダリリージョンへ同じリクエストを送る）
+HEDGING_ENABLED = os.environ.get('BEDROCK_HEDGING_ENABLED', 'false').lower() == 'true'
+BEDROCK_SECONDARY_REGION = os.environ.get('BEDROCK_SECONDARY_REGION', 'us-east-1')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))  # この応答時間を超えたらヘッジ
+HEDGE_MIN_DELAY_MS = int(os.environ.get('HEDGE_MIN_DELAY_MS', '300'))
+HEDGE_MAX_DELAY_MS = int(os.environ.get('HEDGE_MAX_DELAY_MS', '3000'))
+HEDGE_DEFAULT_DELAY_MS = int(os.environ.get('HEDGE_DEFAULT_DELAY_MS', '1500'))  # 応答時間の記録が少ない間
+
+hedged_bedrock = None
+if HEDGING_ENABLED:
+    from hedging import HedgedBedrock
+    hedged_bedrock = HedgedBedrock(
+        bedrock_runtime,
+        BedrockClient(region_name=BEDROCK_SECONDARY_REGION, **BEDROCK_CLIENT_SETTINGS),
+        # 応答時間はモデル・ストリーミングの有無ごとに記録する（既定値と上限はストリーミングの最初のチャンク用）
+        {
+            "percentile": HEDGE_PERCENTILE,
+            "default_ms": HEDGE_DEFAULT_DELAY_MS,
+            "min_ms": HEDGE_MIN_DELAY_MS,
+            "max_ms": HEDGE_MAX_DELAY_MS
+        }
+    )
+
+# モデルルーティング設定
+# まず高速・安価なモデルで分析し、出力が不正または確信度が低い場合のみ大きいモデルで再分析する
+FAST_MODEL_ID = os.environ.get('BEDROCK_FAST_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+ESCALATION_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
+ROUTER_MAX_FAST_CHARS = int(os.environ.get('ROUTER_MAX_FAST_CHARS', '600'))  # これより長い相談は最初から大きいモデル
+ROUTER_MIN_CONFIDENCE = float(os.environ.get('ROUTER_MIN_CONFIDENCE', '0.6'))  # これ未満なら大きいモデルで再分析
+
+# 会話テーブル（会話履歴・ルーティング結果の記録用）
+CONVERSATIONS_TABLE = os.environ.get('CONVERSATIONS_TABLE', '')
+
+# 会話履歴設定
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '1500'))  # 原文で含める直近のやり取りの上限
+HISTORY_MAX_TURNS = int(os.environ.get('HISTORY_MAX_TURNS', '20'))  # 1回に読み込むやり取りの上限
+SUMMARY_MAX_CHARS = int(os.environ.get('SUMMARY_MAX_CHARS', '400'))
+# 要約の更新を非同期で実行する関数（未設定の場合は自分自身）
+SUMMARY_FUNCTION_NAME = os.environ.get('SUMMARY_FUNCTION_NAME', os.environ.get('AWS_LAMBDA_FUNCTION_NAME', ''))
+
+lambda_client = boto3.client('lambda')
+
+# 分析結果キャッシュ設定（テーブル未設定の場合はキャッシュしない）
+ANALYSIS_CACHE_TABLE = os.environ.get('ANALYSIS_CACHE_TABLE', '')
+ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get('ANALYSIS_CACHE_TTL_SECONDS', '3600'))
+
+dynamodb = boto3.resource('dynamodb')
+conversations_table = dynamodb.Table(CONVERSATIONS_TABLE) if CONVERSATIONS_TABLE else None
+analysis_cache_table = dynamodb.Table(ANALYSIS_CACHE_TABLE) if ANALYSIS_CACHE_TABLE else None
+
+# 類似相談検索設定（バケット未設定の場合は使用しない）
+VECTOR_INDEX_BUCKET = os.environ.get('VECTOR_INDEX_BUCKET', '')
+VECTOR_INDEX_PREFIX = os.environ.get('VECTOR_INDEX_PREFIX', 'vector-index')
+VECTOR_INDEX_MAX_ENTRIES = int(os.environ.get('VECTOR_INDEX_MAX_ENTRIES', '5000'))
+VECTOR_INDEX_REFRESH_SECONDS = int(os.environ.get('VECTOR_INDEX_REFRESH_SECONDS', '60'))
+EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v2:0')
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', '256'))
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', '0.92'))
+
+# コールドスタート時にインデックスを読み込み、以降は差分のみ取得する
+vector_index = None
+if VECTOR_INDEX_BUCKET:
+    from vector_index import ConsultationVectorIndex
+    try:
+        vector_index = ConsultationVectorIndex(
+            boto3.client('s3'),
+            VECTOR_INDEX_BUCKET,
+            VECTOR_INDEX_PREFIX,
+            EMBEDDING_DIMENSIONS,
+            max_entries=VECTOR_INDEX_MAX_ENTRIES,
+            refresh_interval=VECTOR_INDEX_REFRESH_SECONDS
+        )
+        vector_index.load()
+    except Exception as e:
+        print(f"Failed to load vector index: {str(e)}")
+        vector_index = None
+
+# キーワード辞書（カテゴリ・緊急度・アクション）
+CATEGORY_KEYWORDS = {
+    "技術的な問題": ["エラー", "バグ", "不具合", "システム"],
+    "業務相談": ["業務", "仕事", "タスク", "プロジェクト"],
+    "人事・組織": ["人事", "組織", "部署", "異動"],
+}
+URGENCY_KEYWORDS = {
+    "高": ["緊急", "至急", "今すぐ", "大至急"],
+    "中": ["なるべく早く", "早めに", "急ぎ"],
+}
+ACTION_KEYWORDS = {
+    "上司への報告": ["報告"],
+    "チームメンバーへの相談": ["相談"],
+    "関係者への確認": ["確認"],
+}
+
+# 報告ルール（部署ごとのキーワード）。共通Layerに同梱
+REPORTING_RULES_PATH = os.environ.get('REPORTING_RULES_PATH', '/opt/python/data/organization_structure.json')
+
+def build_keyword_matcher():
+    """
+    キーワード辞書と報告ルールから、1回の走査で全キーワードを検出するマッチャーを構築
+    ラベルは (種類, 値) の組
+    """
+    matcher = KeywordMatcher()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        matcher.add_all(keywords, ("category", category))
+    for urgency, keywords in URGENCY_KEYWORDS.items():
+        matcher.add_all(keywords, ("urgency", urgency))
+    for action, keywords in ACTION_KEYWORDS.items():
+        matcher.add_all(keywords, ("action", action))
+    
+    try:
+        with open(REPORTING_RULES_PATH, encoding='utf-8') as f:
+            rules = json.load(f).get('reportingRules', [])
+        for rule in rules:
+            for department_id in rule.get('suggestedDepartments', []):
+                matcher.add_all(rule.get('keywords', []), ("department", department_id))
+    except (OSError, ValueError) as e:
+        print(f"Failed to load reporting rules: {str(e)}")
+    
+    return matcher.build()
+
+# コールドスタート時に1回だけ構築
+keyword_matcher = build_keyword_matcher()
+
+# キーワード抽出用の辞書（共通Layerに同梱。メモリマップするため読み込みはほぼ不要）
+try:
+    keyword_extractor = load_extractor()
+except (OSError, ValueError) as e:
+    print(f"Failed to load keyword dictionary: {str(e)}")
+    keyword_extractor = None
+
+# ストリーミング設定
+STREAMING_ENABLED = os.environ.get('BEDROCK_STREAMING_ENABLED', 'false').lower() == 'true'
+
+# ストリーミング時にユーザーへ送るフィールド（モデルの出力はJSONのため）
+STREAM_FIELD = 'suggested_message'
+
+@metrics.log_metrics
 def lambda_handler(event, context):
     """
     Bedrockを使用してユーザーの相談内容を分析
@@ -12,59 +204,741 @@ def lambda_handler(event, context):
     print(f"Event: {json.dumps(event)}")
     
     try:
-        # Step Functionsから受け取るデータ
-        message = event.get('message', '')
-        conversation_id = event.get('conversationId', '')
+        # 会話履歴の要約更新（分析後に非同期で呼び出される）
+        if event.get('action') == 'summarize':
+            return summarize_conversation(event.get('conversationId', ''))
+        
+        # 一括送信の1件（Map状態から呼び出される）
+        if event.get('batchId'):
+            return analyze_batch_item(event)
+        
+        return analyze_consultation(event)
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "error": str(e),
+            "conversationId": event.get('conversationId', '')
+        }
+
+def analyze_consultation(event):
+    """
+    1件の相談を分析して結果を返す（Step Functions・キューの両方から利用）
+    """
+    # 受け取るデータ
+    message = event.get('message', '')
+    conversation_id = event.get('conversationId', '')
+    timestamp = event.get('timestamp', '')
+    # 同期実行（Expressワークフロー）の期限。ワークフローのタイムアウトより短く、過ぎたら結果を記録しない
+    deadline = time.monotonic() + float(event['deadlineSeconds']) if event.get('deadlineSeconds') else None
+    
+    # 会話履歴（要約＋予算内の直近のやり取り）を含めてプロンプトを作成
+    turns, summary_item = get_conversation_history(conversation_id, timestamp)
+    history_text = build_history_text(turns, summary_item.get('summary', ''), HISTORY_TOKEN_BUDGET)
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(message=message, history=history_text, context='')
+    
+    # WebSocket接続がある場合はストリーミングで部分結果を送信
+    connection_id = event.get('connectionId', '')
+    websocket_url = event.get('websocketUrl', os.environ.get('WEBSOCKET_URL', ''))
+    stream = event.get('stream', STREAMING_ENABLED)
+    publisher = None
+    if connection_id and websocket_url:
+        publisher = StreamPublisher(conversation_id, connection_id, websocket_url, field=STREAM_FIELD)
+        # 受付時に作成した暫定結果を先に送信
+        if event.get('provisional'):
+            publisher.send_provisional(event['provisional'])
+        if not stream:
+            publisher = None
+    
+    # 同一内容の相談は過去の分析結果を再利用（bypassCacheで無効化）
+    # 会話の途中では前後関係で分析が変わるため再利用しない
+    bypass_cache = event.get('bypassCache', False) or bool(history_text)
+    use_cache = analysis_cache_table is not None and not bypass_cache
+    cache_key = build_cache_key(message) if use_cache else None
+    analysis = get_cached_analysis(cache_key) if use_cache else None
+    cache_hit = analysis is not None
+    
+    # 完全一致しない場合は、意味的に近い過去の相談の分析結果を探す
+    embedding = None
+    similar = None
+    if not cache_hit and vector_index is not None and not bypass_cache:
+        embedding = embed_message(message)
+        similar = find_similar_analysis(embedding)
+        if similar:
+            analysis = {key: value for key, value in similar['entry'].items() if key not in ('conversationId', 'indexId')}
+    
+    routing = None
+    invocations = []
+    fallback = False
+    if analysis is not None:
+        if publisher:
+            publisher.send_text(analysis['analysis'])
+    elif deadline_exceeded(deadline):
+        return deadline_exceeded_result(conversation_id)
+    else:
+        try:
+            analysis, routing, invocations = run_routed_analysis(prompt, message, publisher)
+        except BedrockUnavailableError as e:
+            # Bedrockが使えない間は待たずにキーワードによる簡易分析を返す
+            print(f"Bedrock unavailable, using rule-based analysis: {str(e)}")
+            add_metric(name="BedrockFallback", unit=MetricUnit.Count, value=1)
+            analysis = build_fallback_analysis(message)
+            fallback = True
+            if publisher:
+                publisher.send_text(analysis['analysis'])
+    
+    # 期限切れの場合は呼び出し側が非同期の流れで分析し直すため、記録・キャッシュ・索引を重複させない
+    if deadline_exceeded(deadline):
+        return deadline_exceeded_result(conversation_id)
+    
+    if use_cache and not cache_hit and not fallback:
+        put_cached_analysis(cache_key, analysis)
+    
+    # 結果を構造化
+    result = {
+        "conversationId": conversation_id,
+        **analysis,
+        "timestamp": timestamp,
+        "provisional": False
+    }
+    
+    if similar:
+        # 再利用元を記録
+        result["reusedFrom"] = similar['entry']['conversationId']
+        result["similarity"] = round(similar['similarity'], 4)
+    elif embedding is not None and not fallback:
+        add_to_vector_index(embedding, result)
+    
+    # 次回以降の会話履歴として相談と回答を記録
+    record = {
+        "message": message,
+        "response": analysis['analysis'],
+        "category": analysis['category'],
+        "urgency": analysis['urgency'],
+        "recommendedRecipient": analysis['recommendedRecipient']
+    }
+    if routing:
+        # しきい値調整のため、ルーティング結果を会話ごとに記録
+        result["routing"] = routing
+        record["routing"] = routing
+    if invocations:
+        # プロンプト・カテゴリごとのレイテンシとコストを後から集計できるよう記録
+        record["bedrockUsage"] = invocations
+    update_conversation_record(conversation_id, timestamp, record)
+    
+    # 予算から外れたやり取りがあれば要約を非同期で更新
+    current_turn = {"timestamp": timestamp, "message": message, "response": analysis['analysis']}
+    if turns_to_summarize(turns + [current_turn], summary_item.get('summarizedUntil', ''), HISTORY_TOKEN_BUDGET):
+        request_summary_update(conversation_id)
+    
+    return result
+
+def deadline_exceeded(deadline):
+    """同期実行の期限を過ぎたか（期限がない場合はFalse）"""
+    return deadline is not None and time.monotonic() > deadline
+
+def deadline_exceeded_result(conversation_id):
+    print(f"Sync deadline exceeded: {conversation_id}")
+    add_metric(name="SyncDeadlineExceeded", unit=MetricUnit.Count, value=1)
+    return {
+        "error": "Sync deadline exceeded",
+        "conversationId": conversation_id
+    }
+
+def analyze_batch_item(event):
+    """
+    一括送信の1件を分析し、会話レコードに状態と分析結果を保存
+    失敗しても例外にせず状態をerrorとして記録する（他の件の分析を止めない）
+    Map状態の出力が大きくならないよう、状態だけを返す
+    """
+    conversation_id = event.get('conversationId', '')
+    timestamp = event.get('timestamp', '')
+    try:
+        result = analyze_consultation(event)
+        update_conversation_record(conversation_id, timestamp, {"status": "completed", "analysis": result})
+        record_status(mark_completed, conversation_id, result)
+        status = "completed"
+    except Exception as e:
+        print(f"Batch item failed {conversation_id}: {str(e)}")
+        update_conversation_record(conversation_id, timestamp, {"status": "error", "error": str(e)})
+        record_status(mark_error, conversation_id, str(e))
+        status = "error"
+    
+    add_metric(
+        name="BatchItemCompleted" if status == "completed" else "BatchItemFailed",
+        unit=MetricUnit.Count,
+        value=1
+    )
+    return {"batchId": event['batchId'], "conversationId": conversation_id, "status": status}
+
+def record_status(mark, conversation_id, value):
+    """会話の状態アイテムに完了・失敗を記録（状態取得APIはこのアイテムだけを読む）"""
+    if conversations_table is None or not conversation_id:
+        return
+    try:
+        mark(conversations_table, conversation_id, value)
+    except Exception as e:
+        print(f"Failed to record status: {str(e)}")
+
+def route_consultation(message):
+    """
+    相談内容のキーワードと長さから、最初に使用するモデルを決定
+    """
+    scan = scan_keywords(message)
+    urgency = scan["urgency"]
+    signals = {
+        "category": scan["category"],
+        "urgency": urgency,
+        "departments": scan["departments"],
+        "keywords": extract_keywords(message),
+        "length": len(message)
+    }
+    
+    if len(message) > ROUTER_MAX_FAST_CHARS:
+        model_id, reason = ESCALATION_MODEL_ID, "long_message"
+    elif urgency == "高":
+        # 緊急の相談は判断を誤るコストが大きいため最初から大きいモデルを使う
+        model_id, reason = ESCALATION_MODEL_ID, "high_urgency"
+    else:
+        model_id, reason = FAST_MODEL_ID, "default"
+    
+    return model_id, reason, signals
+
+def run_routed_analysis(prompt, message, publisher=None):
+    """
+    ルーティングに従って分析を実行し、必要であれば大きいモデルで再分析する
+    (構造化された分析結果, ルーティング記録, Bedrock呼び出しごとの使用量) を返す
+    """
+    model_id, reason, signals = route_consultation(message)
+    add_metric(
+        name="BedrockRoutedFast" if model_id == FAST_MODEL_ID else "BedrockRoutedLarge",
+        unit=MetricUnit.Count,
+        value=1
+    )
+    
+    analysis_text, usage = analyze_with_bedrock(prompt, model_id, publisher)
+    analysis = structure_analysis_result(analysis_text)
+    record_invocation_metrics(usage, analysis)
+    invocations = [usage]
+    routing = {
+        "initialModel": model_id,
+        "finalModel": model_id,
+        "reason": reason,
+        "signals": signals,
+        "initialConfidence": analysis["confidence"],
+        "escalated": False
+    }
+    
+    escalation_reason = None
+    if model_id != ESCALATION_MODEL_ID:
+        if analysis["confidence"] is None:
+            escalation_reason = "invalid_output"
+        elif analysis["confidence"] < ROUTER_MIN_CONFIDENCE:
+            escalation_reason = "low_confidence"
+    
+    if escalation_reason:
+        print(f"Escalating to {ESCALATION_MODEL_ID}: {escalation_reason}")
+        add_metric(name="BedrockEscalated", unit=MetricUnit.Count, value=1)
+        if publisher:
+            publisher.reset()
         
-        # プロンプトの作成
-        prompt = f"""あなたは社内の報連相（報告・連絡・相談）をサポートするアシスタントです。
-以下の相談内容を分析し、適切な報告先と伝え方を提案してください。
+        try:
+            escalated_text, usage = analyze_with_bedrock(prompt, ESCALATION_MODEL_ID, publisher)
+        except BedrockUnavailableError as e:
+            # 再分析できない場合は最初の分析結果を使う
+            print(f"Escalation failed: {str(e)}")
+            add_metric(name="BedrockEscalationFailed", unit=MetricUnit.Count, value=1)
+            routing["escalationError"] = str(e)
+            if publisher:
+                publisher.send_text(analysis['analysis'])
+        else:
+            escalated = structure_analysis_result(escalated_text)
+            record_invocation_metrics(usage, escalated)
+            invocations.append(usage)
+            analysis = escalated
+            routing.update({
+                "finalModel": ESCALATION_MODEL_ID,
+                "escalated": True,
+                "escalationReason": escalation_reason
+            })
+    
+    analysis["modelId"] = routing["finalModel"]
+    return analysis, routing, invocations
 
-相談内容: {message}
+def analyze_with_bedrock(prompt, model_id, publisher=None):
+    """
+    Bedrockで分析を実行し、(分析結果のテキスト, 使用量) を返す
+    publisherが指定された場合はストリーミングで呼び出す
+    """
+    if publisher:
+        return invoke_bedrock_streaming(prompt, model_id, publisher)
+    
+    # Bedrockへのリクエスト
+    request = {
+        "modelId": model_id,
+        "contentType": 'application/json',
+        "accept": 'application/json',
+        "body": build_request_body(prompt)
+    }
+    started = time.monotonic()
+    if hedged_bedrock:
+        body, hedge = hedged_bedrock.invoke_model(**request)
+        record_hedge_metrics(hedge)
+    else:
+        body = bedrock_runtime.invoke_model(**request)['body'].read()
+    latency_ms = (time.monotonic() - started) * 1000
+    
+    # レスポンスの解析
+    response_body = json.loads(body)
+    usage = response_body.get('usage', {})
+    # 非ストリーミングでは応答全体が揃った時点が最初のトークン
+    return response_body['content'][0]['text'], build_usage(
+        model_id, usage.get('input_tokens', 0), usage.get('output_tokens', 0), latency_ms, latency_ms
+    )
 
-以下の観点で分析してください：
-1. この相談の種類は何か（例：人間関係、業務改善、スキル向上など）
-2. 誰に相談すべきか（例：直属の上司、人事部、同僚など）
-3. どのように伝えるべきか（具体的な言い方の例）
+def build_usage(model_id, input_tokens, output_tokens, ttft_ms, latency_ms):
+    """
+    1回のBedrock呼び出しの使用量
+    生成速度は最初のトークン以降の時間で算出（非ストリーミングでは全体の時間）
+    """
+    generation_seconds = (latency_ms - ttft_ms if latency_ms > ttft_ms else latency_ms) / 1000
+    return {
+        "modelId": model_id,
+        "inputTokens": input_tokens,
+        "outputTokens": output_tokens,
+        "ttftMs": round(ttft_ms),
+        "latencyMs": round(latency_ms),
+        "tokensPerSecond": round(output_tokens / generation_seconds, 1) if generation_seconds > 0 else None
+    }
 
-回答は日本語で、具体的かつ実用的なアドバイスをお願いします。"""
+def record_invocation_metrics(usage, analysis=None):
+    """
+    Bedrock呼び出しの使用量をメトリクスとして記録
+    全体の値（アラーム用）に加え、分析結果がある場合はカテゴリ・緊急度・モデル別にも記録する
+    """
+    values = [
+        ("BedrockInputTokens", MetricUnit.Count, usage["inputTokens"]),
+        ("BedrockOutputTokens", MetricUnit.Count, usage["outputTokens"]),
+        ("BedrockTokensPerRequest", MetricUnit.Count, usage["inputTokens"] + usage["outputTokens"]),
+        ("BedrockTimeToFirstToken", MetricUnit.Milliseconds, usage["ttftMs"]),
+        ("BedrockLatency", MetricUnit.Milliseconds, usage["latencyMs"])
+    ]
+    if usage["tokensPerSecond"] is not None:
+        values.append(("BedrockOutputTokensPerSecond", MetricUnit.CountPerSecond, usage["tokensPerSecond"]))
+    
+    for name, unit, value in values:
+        add_metric(name=name, unit=unit, value=value)
+    
+    if analysis is None:
+        return
+    # 次元の組み合わせが他のメトリクスと異なるため、個別に出力する
+    for name, unit, value in values:
+        with single_metric(name=name, unit=unit, value=value) as metric:
+            metric.add_dimension(name="Category", value=analysis["category"])
+            metric.add_dimension(name="Urgency", value=analysis["urgency"])
+            metric.add_dimension(name="ModelId", value=usage["modelId"])
 
-        # Bedrockへのリクエスト
+def record_hedge_metrics(hedge):
+    """ヘッジ率・セカンダリの勝率を算出するためのメトリクスを記録"""
+    add_metric(name="BedrockHedgeEligible", unit=MetricUnit.Count, value=1)
+    if hedge["hedged"]:
+        add_metric(name="BedrockHedged", unit=MetricUnit.Count, value=1)
+        if hedge["winner"] == "secondary":
+            add_metric(name="BedrockHedgeWon", unit=MetricUnit.Count, value=1)
+
+def structure_analysis_result(analysis_text):
+    """
+    分析結果を構造化
+    JSONとして解釈できない場合はテキストからキーワードで推定し、confidenceをNoneにする
+    """
+    data = parse_analysis_json(analysis_text)
+    
+    if data is None:
+        scan = scan_keywords(analysis_text)
+        return {
+            "analysis": analysis_text,
+            "category": scan["category"],
+            "urgency": scan["urgency"],
+            "recommendedRecipient": "直属の上司",
+            "recommendedRecipients": [],
+            "suggestedActions": scan["actions"],
+            "keywords": extract_keywords(analysis_text),
+            "confidence": None
+        }
+    
+    recipients = data["recommended_recipients"]
+    first = recipients[0]
+    return {
+        "analysis": format_analysis_text(data),
+        "category": data["category"],
+        "urgency": data["urgency"],
+        "recommendedRecipient": f"{first.get('department', '')} {first.get('role', '')}".strip(),
+        "recommendedRecipients": recipients,
+        "suggestedActions": extract_suggested_actions(analysis_text),
+        "keywords": data.get("keywords", []),
+        "confidence": max(0.0, min(1.0, float(data["confidence"])))
+    }
+
+def build_fallback_analysis(message):
+    """
+    Bedrockを使わずに相談内容のキーワードだけで分析結果を作成
+    """
+    analysis = structure_analysis_result(message)
+    analysis["analysis"] = "現在AIによる分析を利用できないため、キーワードに基づく簡易的な提案を表示しています。"
+    analysis["modelId"] = None
+    analysis["fallback"] = True
+    return analysis
+
+def parse_analysis_json(analysis_text):
+    """
+    モデル出力からJSONを取り出して検証する（不正な場合はNone）
+    """
+    start = analysis_text.find('{')
+    end = analysis_text.rfind('}')
+    if start < 0 or end < start:
+        return None
+    
+    try:
+        data = json.loads(analysis_text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    
+    required = ("suggested_message", "category", "urgency", "recommended_recipients", "confidence")
+    if not isinstance(data, dict) or any(key not in data for key in required):
+        return None
+    if not isinstance(data["recommended_recipients"], list) or not data["recommended_recipients"]:
+        return None
+    if not isinstance(data["recommended_recipients"][0], dict):
+        return None
+    if not isinstance(data["confidence"], (int, float)):
+        return None
+    
+    return data
+
+def format_analysis_text(data):
+    """構造化された分析結果を画面表示用のテキストに整形"""
+    sections = [data["suggested_message"]]
+    
+    recipients = "\n".join(
+        f"- {r.get('department', '')} {r.get('role', '')}: {r.get('reason', '')}"
+        for r in data["recommended_recipients"]
+    )
+    sections.append(f"■ 推奨される報告先\n{recipients}")
+    
+    if data.get("additional_notes"):
+        sections.append(f"■ 補足\n{data['additional_notes']}")
+    
+    return "\n\n".join(sections)
+
+def scan_keywords(text):
+    """
+    本文を1回走査し、カテゴリ・緊急度・アクション・部署をまとめて判定
+    カテゴリと部署は出現回数が多い順（同数なら辞書の定義順）
+    """
+    counts = {"category": {}, "urgency": {}, "action": {}, "department": {}}
+    for hit in keyword_matcher.find_all(text):
+        for kind, value in hit.labels:
+            counts[kind][value] = counts[kind].get(value, 0) + 1
+    
+    categories = counts["category"]
+    category = max(CATEGORY_KEYWORDS, key=lambda name: categories.get(name, 0))
+    if not categories:
+        category = "その他"
+    
+    urgency = "低"
+    for level in URGENCY_KEYWORDS:
+        if level in counts["urgency"]:
+            urgency = level
+            break
+    
+    actions = [action for action in ACTION_KEYWORDS if action in counts["action"]]
+    departments = sorted(counts["department"], key=lambda name: -counts["department"][name])
+    
+    return {
+        "category": category,
+        "urgency": urgency,
+        "actions": actions if actions else ["適切な担当者への連絡"],
+        "departments": departments
+    }
+
+def extract_suggested_actions(text):
+    """提案されたアクションを抽出"""
+    return scan_keywords(text)["actions"]
+
+def extract_keywords(text):
+    """キーワードを抽出（辞書が読み込めない場合は既定値）"""
+    if keyword_extractor is None:
+        return ["報告", "相談", "連絡"]
+    return keyword_extractor.extract(text)
+
+def update_conversation_record(conversation_id, timestamp, attributes):
+    """
+    会話レコードに属性を追加（テーブル・キーが不明な場合は何もしない）
+    """
+    if conversations_table is None or not conversation_id or not timestamp:
+        return
+    
+    names = {}
+    values = {":updatedAt": datetime.utcnow().isoformat()}
+    assignments = ["updatedAt = :updatedAt"]
+    for i, (name, value) in enumerate(attributes.items()):
+        names[f"#a{i}"] = name
+        # DynamoDBはfloatを扱えないためDecimalに変換
+        values[f":a{i}"] = json.loads(json.dumps(value), parse_float=Decimal)
+        assignments.append(f"#a{i} = :a{i}")
+    
+    try:
+        conversations_table.update_item(
+            Key={"conversationId": conversation_id, "timestamp": timestamp},
+            UpdateExpression="SET " + ", ".join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        # 記録の失敗で分析結果を失わない
+        print(f"Failed to update conversation record: {str(e)}")
+
+def get_conversation_history(conversation_id, before_timestamp):
+    """
+    会話の直近のやり取り（古い順）と要約アイテムを取得
+    要約はソートキーが"#summary"のアイテムに保存している
+    """
+    if conversations_table is None or not conversation_id:
+        return [], {}
+    
+    try:
+        # 時刻のソートキーは"0"以上（"#summary"は含まれない）
+        key_condition = Key('conversationId').eq(conversation_id)
+        if before_timestamp:
+            key_condition = key_condition & Key('timestamp').between('0', before_timestamp)
+        else:
+            key_condition = key_condition & Key('timestamp').gte('0')
+        
+        response = conversations_table.query(
+            KeyConditionExpression=key_condition,
+            ScanIndexForward=False,
+            Limit=HISTORY_MAX_TURNS + 1
+        )
+        turns = [
+            {
+                "timestamp": item['timestamp'],
+                "message": item.get('message', ''),
+                "response": item.get('response', '')
+            }
+            for item in reversed(response.get('Items', []))
+            if item['timestamp'] != before_timestamp and item.get('message')
+        ][-HISTORY_MAX_TURNS:]
+        
+        summary_item = conversations_table.get_item(
+            Key={"conversationId": conversation_id, "timestamp": SUMMARY_SORT_KEY}
+        ).get('Item', {})
+        return turns, summary_item
+    
+    except Exception as e:
+        # 履歴が取れなくても今回の相談は分析する
+        print(f"Failed to get conversation history: {str(e)}")
+        return [], {}
+
+def request_summary_update(conversation_id):
+    """会話履歴の要約更新を非同期で依頼"""
+    if not SUMMARY_FUNCTION_NAME:
+        return
+    
+    try:
+        lambda_client.invoke(
+            FunctionName=SUMMARY_FUNCTION_NAME,
+            InvocationType='Event',
+            Payload=json.dumps({"action": "summarize", "conversationId": conversation_id})
+        )
+    except Exception as e:
+        print(f"Failed to request summary update: {str(e)}")
+
+def summarize_conversation(conversation_id):
+    """
+    予算から外れた古いやり取りを既存の要約に統合して保存
+    """
+    turns, summary_item = get_conversation_history(conversation_id, '')
+    summarized_until = summary_item.get('summarizedUntil', '')
+    pending = turns_to_summarize(turns, summarized_until, HISTORY_TOKEN_BUDGET)
+    if not pending:
+        return {"conversationId": conversation_id, "summarized": 0}
+    
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(
+        max_chars=SUMMARY_MAX_CHARS,
+        summary=summary_item.get('summary', '') or 'なし',
+        turns="\n".join(line for turn in pending for line in turn_lines(turn))
+    )
+    summary, usage = analyze_with_bedrock(prompt, FAST_MODEL_ID)
+    summary = summary.strip()[:SUMMARY_MAX_CHARS]
+    record_invocation_metrics(usage)
+    
+    try:
+        # 並行して更新された場合に新しい要約を古い要約で上書きしない
+        conversations_table.put_item(
+            Item={
+                "conversationId": conversation_id,
+                "timestamp": SUMMARY_SORT_KEY,
+                "summary": summary,
+                "summarizedUntil": pending[-1]['timestamp'],
+                "updatedAt": datetime.utcnow().isoformat()
+            },
+            ConditionExpression="attribute_not_exists(summarizedUntil) OR summarizedUntil < :until",
+            ExpressionAttributeValues={":until": pending[-1]['timestamp']}
+        )
+    except conversations_table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Summary already updated: {conversation_id}")
+    
+    return {"conversationId": conversation_id, "summarized": len(pending)}
+
+def embed_message(message):
+    """相談内容の埋め込みベクトルを取得（失敗した場合はNone）"""
+    try:
         response = bedrock_runtime.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',  # 高速で安価なモデル
+            modelId=EMBEDDING_MODEL_ID,
             contentType='application/json',
             accept='application/json',
             body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "temperature": 0.7,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+                "inputText": message,
+                "dimensions": EMBEDDING_DIMENSIONS,
+                "normalize": True
             })
         )
-        
-        # レスポンスの解析
-        response_body = json.loads(response['body'].read())
-        analysis_result = response_body['content'][0]['text']
-        
-        # 結果を構造化
-        result = {
-            "conversationId": conversation_id,
-            "analysis": analysis_result,
-            "category": "人間関係",  # 後で動的に判定
-            "recommendedRecipient": "直属の上司",  # 後で動的に判定
-            "timestamp": event.get('timestamp', '')
-        }
-        
-        return result
-        
+        return json.loads(response['body'].read())['embedding']
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            "error": str(e),
-            "conversationId": conversation_id
-        }
\ No newline at end of file
+        print(f"Embedding error: {str(e)}")
+        return None
+
+def find_similar_analysis(embedding):
+    """類似度が閾値を超える過去の分析結果を返す（なければNone）"""
+    if embedding is None:
+        return None
+    
+    try:
+        vector_index.refresh()
+        match = vector_index.search(embedding)
+    except Exception as e:
+        print(f"Vector index search error: {str(e)}")
+        return None
+    
+    if match and match[0] >= SIMILARITY_THRESHOLD:
+        similarity, entry = match
+        print(f"Reusing analysis of {entry['conversationId']} (similarity={similarity:.4f})")
+        add_metric(name="SimilarAnalysisReused", unit=MetricUnit.Count, value=1)
+        return {'similarity': similarity, 'entry': entry}
+    
+    add_metric(name="SimilarAnalysisMiss", unit=MetricUnit.Count, value=1)
+    return None
+
+def add_to_vector_index(embedding, result):
+    """新しく分析した相談をインデックスに追加"""
+    try:
+        entry = {key: value for key, value in result.items() if key not in ('timestamp', 'routing')}
+        vector_index.add(embedding, entry)
+    except Exception as e:
+        print(f"Vector index update error: {str(e)}")
+
+def normalize_message(message):
+    """キャッシュキー用に相談内容を正規化（全角/半角・空白・大文字小文字の揺れを吸収）"""
+    normalized = unicodedata.normalize('NFKC', message)
+    return ' '.join(normalized.split()).lower()
+
+def build_cache_key(message):
+    """正規化した相談内容・プロンプトのバージョン・使用モデルからキャッシュキーを作成"""
+    source = '\n'.join([PROMPT_TEMPLATE_VERSION, FAST_MODEL_ID, ESCALATION_MODEL_ID, normalize_message(message)])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def get_cached_analysis(cache_key):
+    """キャッシュから分析結果を取得（存在しない・期限切れの場合はNone）"""
+    try:
+        response = analysis_cache_table.get_item(Key={'cacheKey': cache_key})
+    except Exception as e:
+        # キャッシュの障害で分析自体を止めない
+        print(f"Cache read error: {str(e)}")
+        add_metric(name="AnalysisCacheMiss", unit=MetricUnit.Count, value=1)
+        return None
+    
+    item = response.get('Item')
+    if not item:
+        add_metric(name="AnalysisCacheMiss", unit=MetricUnit.Count, value=1)
+        return None
+    
+    # DynamoDBのTTL削除は即時ではないため、期限切れの項目は自前で除外する
+    if int(item.get('ttl', 0)) <= int(time.time()):
+        add_metric(name="AnalysisCacheEviction", unit=MetricUnit.Count, value=1)
+        add_metric(name="AnalysisCacheMiss", unit=MetricUnit.Count, value=1)
+        return None
+    
+    add_metric(name="AnalysisCacheHit", unit=MetricUnit.Count, value=1)
+    return json.loads(item['result'])
+
+def put_cached_analysis(cache_key, analysis):
+    """分析結果をキャッシュに保存"""
+    try:
+        analysis_cache_table.put_item(Item={
+            'cacheKey': cache_key,
+            'result': json.dumps(analysis, ensure_ascii=False),
+            'promptVersion': PROMPT_TEMPLATE_VERSION,
+            'ttl': int(time.time()) + ANALYSIS_CACHE_TTL_SECONDS
+        })
+    except Exception as e:
+        print(f"Cache write error: {str(e)}")
+
+def build_request_body(prompt):
+    """Bedrock (Anthropic Messages API) へのリクエストボディを作成"""
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    })
+
+def invoke_bedrock_streaming(prompt, model_id, publisher):
+    """
+    Bedrockをストリーミングで呼び出し、部分テキストをWebSocketへ転送する
+    (全文を連結したテキスト, 使用量) を返す
+    """
+    request = {
+        "modelId": model_id,
+        "contentType": 'application/json',
+        "accept": 'application/json',
+        "body": build_request_body(prompt)
+    }
+    started = time.monotonic()
+    if hedged_bedrock:
+        events, hedge = hedged_bedrock.invoke_model_with_response_stream(**request)
+        record_hedge_metrics(hedge)
+    else:
+        events = bedrock_runtime.invoke_model_with_response_stream(**request)['body']
+    
+    parts = []
+    ttft_ms = None
+    input_tokens = output_tokens = 0
+    for event in events:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        
+        payload = json.loads(chunk['bytes'])
+        event_type = payload.get('type')
+        if event_type == 'message_start':
+            input_tokens = payload.get('message', {}).get('usage', {}).get('input_tokens', 0)
+        elif event_type == 'message_delta':
+            output_tokens = payload.get('usage', {}).get('output_tokens', output_tokens)
+        elif event_type == 'content_block_delta':
+            text = payload.get('delta', {}).get('text', '')
+            if text:
+                if ttft_ms is None:
+                    ttft_ms = (time.monotonic() - started) * 1000
+                parts.append(text)
+                publisher.append(text)
+    
+    publisher.close()
+    latency_ms = (time.monotonic() - started) * 1000
+    return ''.join(parts), build_usage(
+        model_id, input_tokens, output_tokens, ttft_ms if ttft_ms is not None else latency_ms, latency_ms
+    )
@@ -1,5 +1,8 @@
 """Bedrock分析用プロンプトテンプレート"""
 
+# プロンプトを変更したら必ず更新する（分析結果キャッシュのキーに含まれる）
+PROMPT_TEMPLATE_VERSION = "analysis-v1"
+
 ANALYSIS_PROMPT_TEMPLATE = """あなたは社内の報連相（報告・連絡・相談）をサポートするアシスタントです。
 ユーザーからの相談内容を分析し、適切な報告先と伝え方を提案してください。
 
@@ -10,17 +13,19 @@ ANALYSIS_PROMPT_TEMPLATE = """あなたは社内の報連相（報告・連絡
 
 {context}
 
-以下の観点で分析し、JSON形式で回答してください：
+以下の観点で分析し、JSON形式のみで回答してください：
 
-1. カテゴリ分類（技術的な問題、業務相談、人事・組織、その他）
-2. 緊急度（高、中、低）
-3. 推奨される報告先（部署、役職）
-4. 報告理由
-5. 推奨されるメッセージ例
+1. 推奨されるメッセージ例
+2. カテゴリ分類（技術的な問題、業務相談、人事・組織、その他）
+3. 緊急度（高、中、低）
+4. 推奨される報告先（部署、役職）
+5. 報告理由
 6. キーワード（関連する重要な単語）
+7. この分析への確信度（0.0〜1.0。情報が不足している・判断が難しい場合は低くする）
 
 回答形式:
 {{
+    "suggested_message": "報告メッセージの例",
     "category": "カテゴリ",
     "urgency": "緊急度",
     "recommended_recipients": [
@@ -30,8 +35,21 @@ ANALYSIS_PROMPT_TEMPLATE = """あなたは社内の報連相（報告・連絡
             "reason": "この人に報告すべき理由"
         }}
     ],
-    "suggested_message": "報告メッセージの例",
     "keywords": ["キーワード1", "キーワード2"],
-    "additional_notes": "追加のアドバイス"
+    "additional_notes": "追加のアドバイス",
+    "confidence": 0.8
 }}
 """
+
+# 会話履歴の要約用（予算から外れた古いやり取りを既存の要約に統合する）
+SUMMARY_PROMPT_TEMPLATE = """以下は社内の報連相に関する相談チャットの記録です。
+これまでの要約に新しいやり取りを統合し、{max_chars}文字以内の日本語で要約してください。
+相談の経緯、登場する部署・人物、決まったこと、未解決の事項を優先して残してください。
+要約の本文のみを出力してください。
+
+■ これまでの要約:
+{summary}
+
+■ 新しいやり取り:
+{turns}
+"""
@@ -0,0 +1,207 @@
+"""ストリーミング中の分析テキストをWebSocketへ送信するユーティリティ"""
+import json
+import os
+import re
+import time
+
+from utils.websocket_client import get_management_client
+
+# ストリーミング設定
+STREAM_FLUSH_CHARS = int(os.environ.get('STREAM_FLUSH_CHARS', '80'))  # この文字数が溜まったら送信
+STREAM_FLUSH_INTERVAL_MS = int(os.environ.get('STREAM_FLUSH_INTERVAL_MS', '300'))  # 最後の送信からこの時間が経ったら送信
+
+JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+
+class JsonStringFieldExtractor:
+    """
+    ストリーミング中のJSONテキストから指定フィールドの文字列値だけを取り出す
+    モデルの出力はJSONのため、そのまま送るとユーザーには読めない
+    """
+
+    def __init__(self, field):
+        self.marker = f'"{field}"'
+        self.pending = ''
+        self.state = 'search'  # search -> value -> done
+
+    def feed(self, text):
+        """部分テキストを受け取り、新たに確定したフィールド値の文字列を返す"""
+        self.pending += text
+
+        if self.state == 'search':
+            index = self.pending.find(self.marker)
+            if index < 0:
+                # マーカーがチャンクをまたぐ場合に備えて末尾だけ残す
+                self.pending = self.pending[-len(self.marker):]
+                return ''
+
+            rest = self.pending[index + len(self.marker):]
+            match = re.match(r'\s*:\s*"', rest)
+            if not match:
+                if re.fullmatch(r'\s*(:\s*)?', rest):
+                    # 値の開始がまだ届いていない
+                    self.pending = self.pending[index:]
+                else:
+                    # 文字列以外の値（同名の別キーなど）は読み飛ばす
+                    self.pending = rest
+                return ''
+
+            self.pending = rest[match.end():]
+            self.state = 'value'
+
+        if self.state != 'value':
+            return ''
+
+        output = []
+        text = self.pending
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == '\\':
+                if i + 1 >= len(text):
+                    break
+                escaped = text[i + 1]
+                if escaped == 'u':
+                    if i + 6 > len(text):
+                        break
+                    code = int(text[i + 2:i + 6], 16)
+                    if 0xD800 <= code <= 0xDBFF:
+                        # サロゲートペアは後半の\uXXXXが届くまで待って1文字にまとめる
+                        low = text[i + 6:i + 12]
+                        if len(low) < 6 and '\\u'.startswith(low[:2]):
+                            break
+                        if low.startswith('\\u') and 0xDC00 <= int(low[2:], 16) <= 0xDFFF:
+                            output.append(chr(0x10000 + ((code - 0xD800) << 10) + (int(low[2:], 16) - 0xDC00)))
+                            i += 12
+                            continue
+                        code = 0xFFFD
+                    elif 0xDC00 <= code <= 0xDFFF:
+                        # 対になっていないサロゲートはUTF-8で送れないため置換文字にする
+                        code = 0xFFFD
+                    output.append(chr(code))
+                    i += 6
+                    continue
+                output.append(JSON_ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            if char == '"':
+                self.state = 'done'
+                i += 1
+                break
+            output.append(char)
+            i += 1
+
+        self.pending = text[i:]
+        return ''.join(output)
+
+
+class StreamPublisher:
+    """
+    ストリーミング中の部分テキストをまとめてWebSocketへ送信する
+    トークンごとに送信せず、一定の文字数または一定時間ごとにまとめて送る
+    """
+
+    def __init__(self, conversation_id, connection_id, websocket_url, field=None):
+        self.conversation_id = conversation_id
+        self.connection_id = connection_id
+        self.client = get_management_client(websocket_url)
+        self.field = field
+        self.extractor = JsonStringFieldExtractor(field) if field else None
+        self.buffer = []
+        self.buffered_chars = 0
+        self.sequence = 0
+        self.last_flush = time.monotonic()
+        self.active = True
+
+    def append(self, text):
+        """部分テキストをバッファに追加し、閾値を超えたら送信"""
+        if not self.active:
+            return
+
+        if self.extractor:
+            text = self.extractor.feed(text)
+            if not text:
+                return
+
+        self.buffer.append(text)
+        self.buffered_chars += len(text)
+
+        elapsed_ms = (time.monotonic() - self.last_flush) * 1000
+        # 最初のチャンクは即座に送信して体感待ち時間を短縮
+        if self.sequence == 0 or self.buffered_chars >= STREAM_FLUSH_CHARS or elapsed_ms >= STREAM_FLUSH_INTERVAL_MS:
+            self.flush()
+
+    def flush(self, final=False):
+        """バッファの内容を送信"""
+        if not self.active or (not self.buffer and not final):
+            return
+
+        self.send({
+            'conversationId': self.conversation_id,
+            'type': 'analysis_chunk',
+            'sequence': self.sequence,
+            'delta': ''.join(self.buffer),
+            'final': final,
+            'status': 'processing'
+        })
+
+        self.buffer = []
+        self.buffered_chars = 0
+        self.sequence += 1
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """残りのバッファを最終チャンクとして送信"""
+        self.flush(final=True)
+
+    def reset(self):
+        """
+        送信済みのテキストを破棄するようクライアントに通知する
+        （より大きなモデルで再分析する場合など）
+        """
+        self.buffer = []
+        self.buffered_chars = 0
+        self.sequence = 0
+        self.extractor = JsonStringFieldExtractor(self.field) if self.field else None
+        if self.active:
+            self.send({
+                'conversationId': self.conversation_id,
+                'type': 'analysis_reset',
+                'status': 'processing'
+            })
+
+    def send_provisional(self, result):
+        """ルールベースの暫定結果を送信（分析結果が届いたら置き換えられる）"""
+        if not self.active:
+            return
+
+        self.send({
+            'conversationId': self.conversation_id,
+            'type': 'provisional_result',
+            'provisional': True,
+            'result': result,
+            'status': 'processing'
+        })
+
+    def send_text(self, text):
+        """確定済みのテキストを一度に送信（キャッシュヒット時など）"""
+        if not self.active:
+            return
+
+        self.buffer = [text]
+        self.flush(final=True)
+
+    def send(self, message):
+        """WebSocketへメッセージを送信（接続が切れていたら以降の送信を止める）"""
+        try:
+            self.client.post_to_connection(
+                ConnectionId=self.connection_id,
+                Data=json.dumps(message, ensure_ascii=False)
+            )
+        except self.client.exceptions.GoneException:
+            # 接続が切れている場合はストリーミング送信のみ停止（分析は継続）
+            print(f"Connection gone: {self.connection_id}")
+            self.active = False
+        except Exception as e:
+            print(f"Error sending stream chunk: {str(e)}")
+            self.active = False
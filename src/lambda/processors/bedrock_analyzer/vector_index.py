@@ -0,0 +1,298 @@
+"""
+類似相談検索用のインメモリベクトルインデックス
+
+S3上のファイル形式（スナップショット・差分とも同じ形式）:
+    ヘッダ（リトルエンディアン）
+        magic     4バイト  b"HKVI"
+        version   uint16
+        dim       uint32
+        count     uint32
+        meta_len  uint32
+    本体
+        ベクトル  float16 × count × dim（正規化済み）
+        メタデータ  UTF-8 JSON（{"entries": [...], "lastDeltaKey": "..."}）
+
+ベクトル部分はnp.frombufferでそのまま読み込めるため、コールドスタート時の
+ロードはS3からの取得時間がほぼ全てになる。
+
+S3上の配置:
+    {prefix}/deltas/{時刻}-{乱数}.hkvi       追加した相談1件ごとの差分
+    {prefix}/snapshots/{時刻}-{乱数}.hkvi    含む最後の差分の名前を付けたスナップショット
+
+エントリには差分の名前をindexIdとして持たせ、同じ相談を二重に読み込まない。
+"""
+import json
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+MAGIC = b"HKVI"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHIII")
+
+# 差分の名前の先頭の時刻（時刻順に並ぶ）
+DELTA_TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+DELTA_TIME_LENGTH = len(datetime(2000, 1, 1).strftime(DELTA_TIME_FORMAT))
+# 古いスナップショットは最新のものから数えてこの数だけ残す
+SNAPSHOTS_TO_KEEP = 2
+
+
+def encode_index(vectors, entries, last_delta_key=""):
+    """ベクトルとメタデータをバイナリ形式にエンコード"""
+    vectors = np.asarray(vectors, dtype=np.float16)
+    count, dim = vectors.shape
+    meta = json.dumps(
+        {"entries": entries, "lastDeltaKey": last_delta_key},
+        ensure_ascii=False
+    ).encode("utf-8")
+    return HEADER.pack(MAGIC, FORMAT_VERSION, dim, count, len(meta)) + vectors.tobytes() + meta
+
+
+def decode_index(data):
+    """バイナリ形式をデコードし (ベクトル, エントリ, lastDeltaKey) を返す"""
+    magic, version, dim, count, meta_len = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector index format: {magic!r} v{version}")
+
+    offset = HEADER.size
+    vector_bytes = count * dim * 2
+    vectors = np.frombuffer(data, dtype=np.float16, count=count * dim, offset=offset).reshape(count, dim)
+    meta = json.loads(data[offset + vector_bytes:offset + vector_bytes + meta_len].decode("utf-8"))
+    return vectors, meta["entries"], meta.get("lastDeltaKey", "")
+
+
+class ConsultationVectorIndex:
+    """
+    過去に分析した相談のベクトルを保持し、コサイン類似度で最近傍を検索する
+
+    新しい分析結果は差分ファイルとしてS3に追加し、他のコンテナは
+    refresh_interval秒ごとに未取得の差分だけを読み込む。
+    差分が溜まったらスナップショットに統合する。
+    差分の書き込みは名前の時刻より遅れて完了することがあるため、一覧は
+    最後に読んだ差分よりoverlap_seconds前から取得し、読み込み済みの差分・
+    エントリは読み飛ばす。
+    バッチ分析では複数スレッドから呼ばれるため、操作はロックで直列化する。
+    """
+
+    def __init__(self, s3_client, bucket, prefix, dim, max_entries=5000,
+                 refresh_interval=60, compact_threshold=200, overlap_seconds=300):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.snapshot_prefix = f"{prefix}/snapshots/"
+        self.delta_prefix = f"{prefix}/deltas/"
+        self.dim = dim
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.compact_threshold = compact_threshold
+        self.overlap = timedelta(seconds=overlap_seconds)
+
+        # 検索用にfloat32で保持（容量を倍々で確保して追加をO(1)に近づける）
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.entries = []
+        self.ids = set()
+        self.last_delta_key = ""
+        # 重なりの範囲内で読み込み済みの差分（範囲外になったものは忘れる）
+        self.seen_delta_keys = set()
+        self.deltas_since_snapshot = 0
+        self.last_refresh = 0.0
+        self.lock = threading.RLock()
+
+    def load(self):
+        """最新のスナップショットと未統合の差分を読み込む（コールドスタート時）"""
+        with self.lock:
+            snapshot_key = self._latest_snapshot_key()
+            if snapshot_key:
+                data = self.s3.get_object(Bucket=self.bucket, Key=snapshot_key)["Body"].read()
+                vectors, entries, last_delta_key = decode_index(data)
+                self._append(vectors, entries)
+                self.last_delta_key = last_delta_key
+            else:
+                print("Vector index snapshot not found, starting empty")
+
+            self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """前回以降に追加された差分だけを読み込む"""
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = now
+
+            self._read_new_deltas()
+
+            if self.deltas_since_snapshot >= self.compact_threshold:
+                self.compact()
+
+    def search(self, vector):
+        """最も類似した相談を返す (類似度, エントリ)。インデックスが空ならNone"""
+        with self.lock:
+            if self.size == 0:
+                return None
+
+            query = normalize(vector)
+            scores = self.matrix[:self.size] @ query
+            best = int(np.argmax(scores))
+            return float(scores[best]), self.entries[best]
+
+    def add(self, vector, entry):
+        """新しい相談を追加し、差分ファイルとしてS3に保存"""
+        with self.lock:
+            vectors = normalize(vector).reshape(1, self.dim)
+            delta_key = f"{self.delta_prefix}{datetime.utcnow().strftime(DELTA_TIME_FORMAT)}-{uuid.uuid4().hex[:8]}.hkvi"
+            entries = with_index_ids([entry], delta_key)
+            self._append(vectors, entries)
+
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=delta_key,
+                Body=encode_index(vectors, entries)
+            )
+            # 自分で追加した差分は既にメモリ上にある
+            self.seen_delta_keys.add(delta_key)
+            self.deltas_since_snapshot += 1
+
+    def compact(self):
+        """
+        読み込み済みの内容を、含む最後の差分の名前でスナップショットとして保存
+        複数のコンテナが同時に統合しても互いに上書きせず、次のロードでは
+        より新しい差分まで含むものが選ばれる
+        """
+        with self.lock:
+            # 自分で追加した差分も含め、一覧に現れた最後の差分までを統合する
+            self._read_new_deltas()
+            if not self.last_delta_key:
+                return
+            snapshot_key = self.snapshot_prefix + self.last_delta_key[len(self.delta_prefix):]
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=snapshot_key,
+                Body=encode_index(self.matrix[:self.size], self.entries, self.last_delta_key)
+            )
+            self.deltas_since_snapshot = 0
+            print(f"Vector index compacted: {self.size} entries up to {self.last_delta_key}")
+
+            try:
+                self._delete_old_snapshots()
+            except Exception as e:
+                # 残った古いスナップショットは読み込まれないだけで害はない
+                print(f"Failed to delete old vector index snapshots: {str(e)}")
+
+    def _read_new_deltas(self):
+        """重なりの範囲以降の差分を列挙し、未読のものを読み込む"""
+        # 差分キーは時刻順に並ぶため、StartAfterで重なりの範囲以降のみ列挙する
+        start_after = self._overlap_start()
+        paginator = self.s3.get_paginator("list_objects_v2")
+        params = {"Bucket": self.bucket, "Prefix": self.delta_prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+
+        for page in paginator.paginate(**params):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                self.last_delta_key = max(self.last_delta_key, key)
+                if key in self.seen_delta_keys:
+                    continue
+                self.seen_delta_keys.add(key)
+
+                data = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+                vectors, entries, _ = decode_index(data)
+                if self._append(vectors, with_index_ids(entries, key)):
+                    self.deltas_since_snapshot += 1
+
+        # 重なりの範囲より前の差分は二度と列挙されない
+        start_after = self._overlap_start()
+        self.seen_delta_keys = {key for key in self.seen_delta_keys if key > start_after}
+
+    def _latest_snapshot_key(self):
+        """最も新しい差分まで含むスナップショットのキー（なければNone）"""
+        keys = self._list_keys(self.snapshot_prefix)
+        return max(keys) if keys else None
+
+    def _delete_old_snapshots(self):
+        keys = sorted(self._list_keys(self.snapshot_prefix))[:-SNAPSHOTS_TO_KEEP]
+        if keys:
+            self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+
+    def _list_keys(self, prefix):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+
+    def _overlap_start(self):
+        """最後に読んだ差分の時刻からoverlap分だけ遡ったStartAfterの値"""
+        if not self.last_delta_key:
+            return ""
+        name = self.last_delta_key[len(self.delta_prefix):]
+        try:
+            last_time = datetime.strptime(name[:DELTA_TIME_LENGTH], DELTA_TIME_FORMAT)
+        except ValueError:
+            return self.last_delta_key
+        return self.delta_prefix + (last_time - self.overlap).strftime(DELTA_TIME_FORMAT)
+
+    def _append(self, vectors, entries):
+        """
+        ベクトルとエントリを追加（上限を超えた古いものは削除）
+        indexIdが既にあるエントリは読み飛ばし、追加した件数を返す
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        keep = []
+        for i, entry in enumerate(entries):
+            index_id = entry.get("indexId")
+            if index_id is not None:
+                if index_id in self.ids:
+                    continue
+                self.ids.add(index_id)
+            keep.append(i)
+        if len(keep) < len(entries):
+            vectors = vectors[keep]
+            entries = [entries[i] for i in keep]
+        if not entries:
+            return 0
+
+        needed = self.size + len(vectors)
+        if needed > len(self.matrix):
+            capacity = max(needed, len(self.matrix) * 2, 64)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+
+        self.matrix[self.size:needed] = vectors
+        self.entries.extend(entries)
+        self.size = needed
+
+        if self.size > self.max_entries:
+            overflow = self.size - self.max_entries
+            for entry in self.entries[:overflow]:
+                self.ids.discard(entry.get("indexId"))
+            self.matrix[:self.max_entries] = self.matrix[overflow:self.size]
+            self.entries = self.entries[overflow:]
+            self.size = self.max_entries
+        return len(entries)
+
+
+def with_index_ids(entries, delta_key):
+    """差分のエントリに、差分の名前から作ったindexIdを付ける（既にあればそのまま）"""
+    name = delta_key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return [
+        entry if "indexId" in entry else {**entry, "indexId": name if len(entries) == 1 else f"{name}#{i}"}
+        for i, entry in enumerate(entries)
+    ]
+
+
+def normalize(vector):
+    """L2正規化（内積がそのままコサイン類似度になる）"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,119 @@
+# src/lambda/processors/notification_sender/lambda_function.py
+import json
+import os
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from utils.websocket_client import WebSocketFanout
+
+# 会話テーブル（会話のやり取りから利用者を特定する）
+CONVERSATIONS_TABLE = os.environ.get('CONVERSATIONS_TABLE', '')
+# 接続管理テーブル（利用者の開いている全ての接続を検索する）
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+CONNECTIONS_USER_INDEX = 'userId-index'
+
+dynamodb = boto3.resource('dynamodb')
+conversations_table = dynamodb.Table(CONVERSATIONS_TABLE) if CONVERSATIONS_TABLE else None
+connections_table = dynamodb.Table(CONNECTIONS_TABLE) if CONNECTIONS_TABLE else None
+
+# 並行して送信する接続数の上限
+FANOUT_MAX_WORKERS = int(os.environ.get('WEBSOCKET_FANOUT_MAX_WORKERS', '16'))
+fanout = WebSocketFanout(connections_table, max_workers=FANOUT_MAX_WORKERS)
+
+def lambda_handler(event, context):
+    """
+    分析結果をWebSocketで通知する
+    会話の利用者の全ての接続（複数の端末・タブ）と、送信元の接続に送る
+    状態（completed/error）はステートマシンが渡す（状態取得APIと同じ値にする）
+    """
+    print(f"Sender Event: {json.dumps(event, ensure_ascii=False, default=str)}")
+
+    conversation_id = event.get('conversationId', '')
+    message = build_message(event)
+    message['conversationId'] = conversation_id
+
+    targets = resolve_connections(event)
+    if not targets:
+        print("No WebSocket connections to notify")
+        return {'statusCode': 200, 'sent': 0, 'gone': 0, 'failed': 0}
+
+    # 並行して送信し、切断済みの接続は接続管理テーブルからまとめて削除する
+    result = fanout.send(targets, message)
+
+    print(f"Notified {len(result.sent)} connections ({len(result.gone)} gone, {len(result.failed)} failed)")
+    return {'statusCode': 200, **result.as_dict()}
+
+def build_message(event):
+    """
+    通知するメッセージを作成
+    状態の指定がない場合は、分析結果がエラーを含むかどうかで判断する
+    """
+    analysis = event.get('analysis') or {}
+    status = event.get('status') or ('error' if isinstance(analysis, dict) and analysis.get('error') else 'completed')
+    if status == 'error':
+        return {
+            'type': 'analysis',
+            'status': 'error',
+            'error': event.get('error') or (analysis.get('error') if isinstance(analysis, dict) else None) or 'Analysis failed'
+        }
+    return {
+        'type': 'analysis',
+        'status': 'completed',
+        'analysis': event.get('analysis'),
+        'suggestion': event.get('suggestion')
+    }
+
+def resolve_connections(event):
+    """
+    送信先の接続ID → エンドポイントの対応を作成
+    利用者は通知に含まれていなければ会話のやり取りの記録から特定し、GSIを1回検索する
+    """
+    default_endpoint = event.get('websocketEndpoint') or event.get('websocketUrl') or os.environ.get('WEBSOCKET_URL', '')
+    targets = {}
+
+    user_id = event.get('userId') or get_conversation_user(event.get('conversationId'), event.get('timestamp'))
+    if user_id and connections_table is not None:
+        for item in query_user_connections(user_id):
+            targets[item['connectionId']] = item.get('endpoint') or default_endpoint
+
+    # 送信元の接続（未認証の接続は登録に利用者を持たないため個別に送る）
+    connection_id = event.get('connectionId')
+    if connection_id and connection_id not in targets:
+        targets[connection_id] = default_endpoint
+
+    return {connection_id: endpoint for connection_id, endpoint in targets.items() if endpoint}
+
+def get_conversation_user(conversation_id, timestamp):
+    """会話のやり取りを受け付けた利用者（不明な場合は空文字）"""
+    if conversations_table is None or not conversation_id or not timestamp:
+        return ''
+
+    try:
+        response = conversations_table.get_item(
+            Key={'conversationId': conversation_id, 'timestamp': timestamp},
+            ProjectionExpression='userId'
+        )
+        return response.get('Item', {}).get('userId', '')
+    except Exception as e:
+        print(f"Failed to get conversation user: {str(e)}")
+        return ''
+
+def query_user_connections(user_id):
+    """利用者の接続をGSIで検索（ページングを含む）"""
+    query = {
+        'IndexName': CONNECTIONS_USER_INDEX,
+        'KeyConditionExpression': Key('userId').eq(user_id),
+        'ProjectionExpression': 'connectionId, endpoint'
+    }
+    items = []
+    try:
+        while True:
+            response = connections_table.query(**query)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        print(f"Failed to query user connections: {str(e)}")
+        return items
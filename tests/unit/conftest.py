@@ -0,0 +1,20 @@
+"""
+ユニットテスト共通設定
+
+Lambdaレイヤーとプロセッサのモジュールを、デプロイ時と同じ名前でimportできるようにする。
+モジュールの読み込み時にboto3のクライアントを作るため、リージョンの既定値を設定する。
+"""
+import os
+import sys
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+for path in (
+    "src/lambda/layers/common/python",
+    "src/lambda/processors/bedrock_analyzer",
+):
+    path = os.path.join(ROOT, path)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,126 @@
+"""分析結果キャッシュ（キーの正規化・TTL・bypassCache）のテスト"""
+import json
+
+import pytest
+
+import lambda_function as analyzer
+
+ANALYSIS = {
+    "analysis": "上司に報告してください",
+    "category": "業務相談",
+    "urgency": "中",
+    "recommendedRecipient": "直属の上司",
+}
+NOW = 1_800_000_000
+
+
+class FakeCacheTable:
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key["cacheKey"])
+        return {"Item": item} if item else {}
+
+    def put_item(self, Item):
+        self.items[Item["cacheKey"]] = Item
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    table = FakeCacheTable()
+    monkeypatch.setattr(analyzer, "analysis_cache_table", table)
+    monkeypatch.setattr(analyzer.time, "time", lambda: NOW)
+    return table
+
+
+@pytest.fixture
+def consultation(cache, monkeypatch):
+    """会話履歴・類似検索を使わず、分析の呼び出し回数を記録する"""
+    calls = {"analyze": 0}
+
+    def run_routed_analysis(prompt, message, publisher=None):
+        calls["analyze"] += 1
+        return dict(ANALYSIS), None, []
+
+    monkeypatch.setattr(analyzer, "get_conversation_history", lambda conversation_id, timestamp: ([], {}))
+    monkeypatch.setattr(analyzer, "vector_index", None)
+    monkeypatch.setattr(analyzer, "run_routed_analysis", run_routed_analysis)
+    monkeypatch.setattr(analyzer, "update_conversation_record", lambda *args: None)
+    return calls
+
+
+def event(**kwargs):
+    return {"conversationId": "conv-1", "message": "残業が多いです", "timestamp": "2026-10-18T09:00:00.000Z", **kwargs}
+
+
+def test_normalize_message_absorbs_width_space_and_case():
+    assert analyzer.normalize_message("  ＡＢＣ　残業が\n多いです ") == "abc 残業が 多いです"
+
+
+def test_cache_key_ignores_formatting_differences():
+    assert analyzer.build_cache_key("ＰＣが 壊れました") == analyzer.build_cache_key("pcが　壊れました\n")
+    assert analyzer.build_cache_key("PCが壊れました") != analyzer.build_cache_key("PCが壊れました！？")
+
+
+def test_cache_key_depends_on_prompt_version(monkeypatch):
+    key = analyzer.build_cache_key("残業が多いです")
+    monkeypatch.setattr(analyzer, "PROMPT_TEMPLATE_VERSION", analyzer.PROMPT_TEMPLATE_VERSION + "-next")
+
+    assert analyzer.build_cache_key("残業が多いです") != key
+
+
+def test_put_sets_ttl(cache):
+    analyzer.put_cached_analysis("key-1", ANALYSIS)
+
+    item = cache.items["key-1"]
+    assert item["ttl"] == NOW + analyzer.ANALYSIS_CACHE_TTL_SECONDS
+    assert json.loads(item["result"]) == ANALYSIS
+
+
+def test_expired_item_is_a_miss(cache):
+    cache.items["key-1"] = {"cacheKey": "key-1", "result": json.dumps(ANALYSIS), "ttl": NOW}
+
+    with analyzer.buffered_metrics() as recorded:
+        assert analyzer.get_cached_analysis("key-1") is None
+
+    # DynamoDBのTTL削除を待たずに期限切れとして扱う
+    assert ("AnalysisCacheEviction", analyzer.MetricUnit.Count, 1) in recorded
+
+
+def test_live_item_is_a_hit(cache):
+    cache.items["key-1"] = {"cacheKey": "key-1", "result": json.dumps(ANALYSIS), "ttl": NOW + 1}
+
+    with analyzer.buffered_metrics() as recorded:
+        assert analyzer.get_cached_analysis("key-1") == ANALYSIS
+
+    assert ("AnalysisCacheHit", analyzer.MetricUnit.Count, 1) in recorded
+
+
+def test_same_consultation_reuses_the_cached_analysis(consultation, cache):
+    with analyzer.buffered_metrics():
+        first = analyzer.analyze_consultation(event())
+        second = analyzer.analyze_consultation(event(message="　残業が多いです "))
+
+    assert consultation["analyze"] == 1
+    assert second["analysis"] == first["analysis"]
+    assert len(cache.items) == 1
+
+
+def test_bypass_cache_neither_reads_nor_writes(consultation, cache):
+    with analyzer.buffered_metrics():
+        analyzer.analyze_consultation(event())
+        analyzer.analyze_consultation(event(bypassCache=True))
+
+    assert consultation["analyze"] == 2
+    assert len(cache.items) == 1
+
+
+def test_consultation_with_history_is_not_cached(consultation, cache, monkeypatch):
+    turns = [{"timestamp": "2026-10-18T08:00:00.000Z", "message": "先週の件です", "response": "確認します"}]
+    monkeypatch.setattr(analyzer, "get_conversation_history", lambda conversation_id, timestamp: (turns, {}))
+
+    with analyzer.buffered_metrics():
+        analyzer.analyze_consultation(event())
+
+    assert cache.items == {}
@@ -0,0 +1,103 @@
+"""キュー経由の一括分析（部分的なバッチ失敗）のテスト"""
+import json
+
+import pytest
+
+import batch_handler
+
+ANALYSIS = {"conversationId": "conv-ok", "analysis": "上司に報告してください"}
+
+
+class StubStepFunctions:
+    class exceptions:
+        class ExecutionAlreadyExists(Exception):
+            pass
+
+    def __init__(self):
+        self.started = []
+
+    def start_execution(self, stateMachineArn, name, input):
+        if name in [started["name"] for started in self.started]:
+            raise self.exceptions.ExecutionAlreadyExists()
+        self.started.append({"name": name, "input": json.loads(input)})
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """分析は会話IDがconv-failのときだけ失敗し、状態の記録と完了処理の開始を記録する"""
+    calls = {"errors": [], "records": []}
+    stepfunctions = StubStepFunctions()
+
+    def analyze_consultation(consultation):
+        if consultation["conversationId"] == "conv-fail":
+            raise RuntimeError("Bedrock unavailable")
+        return {**ANALYSIS, "conversationId": consultation["conversationId"]}
+
+    monkeypatch.setattr(batch_handler.metrics, "namespace", "Test")
+    monkeypatch.setattr(batch_handler, "analyze_consultation", analyze_consultation)
+    monkeypatch.setattr(batch_handler, "update_conversation_record", lambda *args: calls["records"].append(args))
+    monkeypatch.setattr(batch_handler, "conversations_table", object())
+    monkeypatch.setattr(
+        batch_handler, "mark_error", lambda table, conversation_id, error: calls["errors"].append((conversation_id, error))
+    )
+    monkeypatch.setattr(batch_handler, "STATE_MACHINE_ARN", "arn:aws:states:ap-northeast-1:123456789012:stateMachine:test")
+    monkeypatch.setattr(batch_handler, "stepfunctions", stepfunctions)
+    calls["started"] = stepfunctions.started
+    return calls
+
+
+def record(message_id, body, receive_count=1):
+    return {
+        "messageId": message_id,
+        "body": body if isinstance(body, str) else json.dumps(body, ensure_ascii=False),
+        "attributes": {"ApproximateReceiveCount": str(receive_count)},
+    }
+
+
+def consultation(conversation_id):
+    return {"conversationId": conversation_id, "message": "残業が多いです", "timestamp": "2026-10-18T09:00:00.000Z"}
+
+
+def test_only_failed_messages_are_returned(batch):
+    event = {"Records": [
+        record("m-1", consultation("conv-ok")),
+        record("m-2", consultation("conv-fail")),
+        record("m-3", consultation("conv-ok-2")),
+    ]}
+
+    response = batch_handler.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m-2"}]}
+    assert sorted(started["name"] for started in batch["started"]) == ["chat-conv-ok", "chat-conv-ok-2"]
+    assert batch["started"][0]["input"]["analysis"]["analysis"] == ANALYSIS["analysis"]
+    # 再配信が残っている間は失敗を記録しない
+    assert batch["errors"] == []
+
+
+def test_unreadable_message_is_not_retried(batch):
+    response = batch_handler.lambda_handler({"Records": [record("m-1", "{not json")]}, None)
+
+    assert response == {"batchItemFailures": []}
+
+
+def test_last_delivery_records_the_error(batch):
+    event = {"Records": [record("m-1", consultation("conv-fail"), receive_count=batch_handler.BATCH_MAX_RECEIVE_COUNT)]}
+
+    response = batch_handler.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m-1"}]}
+    assert batch["errors"] == [("conv-fail", "Bedrock unavailable")]
+
+
+def test_redelivered_message_does_not_start_completion_twice(batch):
+    event = {"Records": [record("m-1", consultation("conv-ok"))]}
+
+    batch_handler.lambda_handler(event, None)
+    response = batch_handler.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": []}
+    assert len(batch["started"]) == 1
+
+
+def test_empty_batch(batch):
+    assert batch_handler.lambda_handler({"Records": []}, None) == {"batchItemFailures": []}
@@ -0,0 +1,69 @@
+"""Bedrock分析Lambdaの同期実行の期限のテスト"""
+import time
+
+import pytest
+
+import lambda_function as analyzer
+
+ANALYSIS = {
+    "analysis": "上司に報告してください",
+    "category": "業務相談",
+    "urgency": "中",
+    "recommendedRecipient": "直属の上司",
+}
+
+
+@pytest.fixture
+def consultation(monkeypatch):
+    """会話履歴・キャッシュ・類似検索を使わず、分析と記録の呼び出しを記録する"""
+    calls = {"analyze": 0, "records": []}
+
+    def run_routed_analysis(prompt, message, publisher=None):
+        calls["analyze"] += 1
+        time.sleep(calls.get("analysis_seconds", 0))
+        return dict(ANALYSIS), None, []
+
+    monkeypatch.setattr(analyzer, "get_conversation_history", lambda conversation_id, timestamp: ([], {}))
+    monkeypatch.setattr(analyzer, "analysis_cache_table", None)
+    monkeypatch.setattr(analyzer, "vector_index", None)
+    monkeypatch.setattr(analyzer, "run_routed_analysis", run_routed_analysis)
+    monkeypatch.setattr(
+        analyzer, "update_conversation_record", lambda *args: calls["records"].append(args)
+    )
+    return calls
+
+
+def event(**kwargs):
+    return {"conversationId": "conv-1", "message": "残業が多いです", "timestamp": "2026-10-18T09:00:00.000Z", **kwargs}
+
+
+def test_analysis_without_deadline_is_recorded(consultation):
+    with analyzer.buffered_metrics():
+        result = analyzer.analyze_consultation(event())
+
+    assert result["analysis"] == ANALYSIS["analysis"]
+    assert len(consultation["records"]) == 1
+
+
+def test_result_after_sync_deadline_is_not_recorded(consultation):
+    consultation["analysis_seconds"] = 0.05
+
+    with analyzer.buffered_metrics() as recorded:
+        result = analyzer.analyze_consultation(event(deadlineSeconds=0.01))
+
+    # 呼び出し側がStandardで分析し直すため、記録・キャッシュは重複させない
+    assert result == {"error": "Sync deadline exceeded", "conversationId": "conv-1"}
+    assert consultation["records"] == []
+    assert ("SyncDeadlineExceeded", analyzer.MetricUnit.Count, 1) in recorded
+
+
+def test_bedrock_is_not_called_after_sync_deadline(consultation, monkeypatch):
+    monkeypatch.setattr(
+        analyzer, "get_conversation_history", lambda conversation_id, timestamp: time.sleep(0.05) or ([], {})
+    )
+
+    with analyzer.buffered_metrics():
+        result = analyzer.analyze_consultation(event(deadlineSeconds=0.01))
+
+    assert "error" in result
+    assert consultation["analyze"] == 0
@@ -0,0 +1,203 @@
+"""Bedrockクライアントの送信ペース制御・再試行・サーキットブレーカーのテスト"""
+import io
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from utils import bedrock_client
+from utils.bedrock_client import (
+    BedrockClient,
+    BedrockUnavailableError,
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimitExceededError,
+    RetryBudget,
+    TokenBucket,
+    estimate_request_tokens,
+)
+
+
+class FakeClock:
+    """time.monotonicとtime.sleepの代わり（sleepは時刻を進めるだけ）"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bedrock_client, "time", clock)
+    monkeypatch.setattr(bedrock_client.random, "uniform", lambda low, high: high)
+    return clock
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+class FailingBody:
+    """読み込み中に失敗する応答本文"""
+
+    def read(self):
+        raise ReadTimeoutError(endpoint_url="https://bedrock-runtime")
+
+
+class FakeRuntime:
+    """用意した例外・応答を順に返すbedrock-runtimeクライアント"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_client(runtime, **kwargs):
+    settings = {"requests_per_minute": 6000, "tokens_per_minute": 6000000, "max_attempts": 3}
+    settings.update(kwargs)
+    return BedrockClient(client=runtime, **settings)
+
+
+def test_token_bucket_waits_for_refill(clock):
+    bucket = TokenBucket(capacity=2, refill_per_second=1)
+
+    assert bucket.reserve(1, max_wait=5) == 0
+    assert bucket.reserve(1, max_wait=5) == 0
+    assert bucket.reserve(1, max_wait=5) == pytest.approx(1.0)
+
+    clock.now += 3
+    # 補充は容量まで
+    assert bucket.reserve(2, max_wait=5) == pytest.approx(0.0)
+
+
+def test_token_bucket_rejects_long_wait_without_reserving(clock):
+    bucket = TokenBucket(capacity=1, refill_per_second=0.5)
+    bucket.reserve(1, max_wait=0)
+
+    with pytest.raises(RateLimitExceededError):
+        bucket.reserve(1, max_wait=1)
+    # 容量を超える要求は満杯になるまで待つ
+    assert bucket.reserve(10, max_wait=5) == pytest.approx(2.0)
+
+
+def test_token_bucket_charges_full_amount_of_large_request(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=1)
+
+    # 満杯なら容量を超える要求も待たずに通し、超えた分は後の要求が待つ
+    assert bucket.reserve(25, max_wait=5) == 0
+    assert bucket.available == pytest.approx(-15)
+    with pytest.raises(RateLimitExceededError):
+        bucket.reserve(1, max_wait=5)
+    assert bucket.reserve(1, max_wait=20) == pytest.approx(16.0)
+
+    clock.now += 17
+    assert bucket.reserve(1, max_wait=0) == 0
+
+
+def test_retry_budget_is_refunded_by_successes():
+    budget = RetryBudget(capacity=2, retry_cost=1, success_refund=0.5)
+
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    budget.record_success()
+    assert not budget.try_acquire()
+    budget.record_success()
+    assert budget.try_acquire()
+
+
+def test_circuit_breaker_opens_and_half_opens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 試行中は他の呼び出しを通さない
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # 試行が失敗したらすぐに開き直す
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_estimate_request_tokens_counts_messages_and_max_tokens():
+    body = '{"messages": [{"content": "相談です"}, {"content": [{"text": "ab"}]}], "max_tokens": 100}'
+    assert estimate_request_tokens(body) == 106
+    assert estimate_request_tokens("not json") == 0
+
+
+def test_call_retries_retryable_errors(clock):
+    runtime = FakeRuntime(client_error("ThrottlingException"), {"body": io.BytesIO(b"ok")})
+    client = make_client(runtime)
+
+    assert client.invoke_model(modelId="m", body="{}")["body"].read() == b"ok"
+    assert runtime.calls == 2
+    assert clock.slept == [0.5]
+
+
+def test_body_read_failure_is_retried(clock):
+    runtime = FakeRuntime({"body": FailingBody()}, {"body": io.BytesIO(b"ok")})
+    client = make_client(runtime)
+
+    assert client.invoke_model(modelId="m", body="{}")["body"].read() == b"ok"
+    assert runtime.calls == 2
+
+
+def test_body_read_failures_count_towards_circuit_breaker(clock):
+    runtime = FakeRuntime({"body": FailingBody()}, {"body": FailingBody()})
+    client = make_client(runtime, max_attempts=2, failure_threshold=1)
+
+    with pytest.raises(BedrockUnavailableError):
+        client.invoke_model(modelId="m", body="{}")
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+
+
+def test_call_gives_up_after_max_attempts_and_counts_failure(clock):
+    runtime = FakeRuntime(*[client_error("ServiceUnavailableException")] * 2)
+    client = make_client(runtime, max_attempts=2, failure_threshold=1)
+
+    with pytest.raises(BedrockUnavailableError):
+        client.invoke_model(modelId="m", body="{}")
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+
+
+def test_non_retryable_error_is_not_counted_as_success(clock):
+    runtime = FakeRuntime(client_error("ValidationException"))
+    client = make_client(runtime)
+    client.circuit_breaker.failures = 3
+    client.retry_budget.available = 5
+
+    with pytest.raises(ClientError):
+        client.invoke_model(modelId="m", body="{}")
+
+    assert runtime.calls == 1
+    assert client.circuit_breaker.failures == 3
+    assert client.retry_budget.available == 5
@@ -0,0 +1,38 @@
+"""会話の所有者の確認のテスト"""
+from utils.conversation_access import can_access_conversation, get_conversation_owner
+
+
+class FakeTable:
+    """最初のやり取りの問い合わせだけを持つ会話テーブル"""
+
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return {"Items": self.items[:kwargs["Limit"]]}
+
+
+def test_owner_is_user_of_first_turn():
+    table = FakeTable([{"userId": "user-a"}, {"userId": "user-b"}])
+
+    assert get_conversation_owner(table, "conv-1") == "user-a"
+    query, = table.queries
+    assert query["ScanIndexForward"] is True
+    assert query["Limit"] == 1
+
+
+def test_other_user_cannot_access_conversation():
+    table = FakeTable([{"userId": "user-a"}])
+
+    assert can_access_conversation(table, "conv-1", "user-a")
+    assert not can_access_conversation(table, "conv-1", "user-b")
+    assert not can_access_conversation(table, "conv-1", "")
+
+
+def test_new_or_unowned_conversation_is_accessible():
+    assert get_conversation_owner(FakeTable([]), "conv-1") is None
+    assert can_access_conversation(FakeTable([]), "conv-1", "user-b")
+    assert get_conversation_owner(FakeTable([{}]), "conv-1") == ""
+    assert can_access_conversation(FakeTable([{}]), "conv-1", "user-b")
@@ -0,0 +1,144 @@
+"""別リージョンへのヘッジリクエストのテスト"""
+import io
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from hedging import MIN_SAMPLES, HedgedBedrock, LatencyTracker, is_hedgeable_error
+from utils.bedrock_client import BedrockUnavailableError, CircuitOpenError
+
+SETTINGS = {"percentile": 95, "default_ms": 50, "min_ms": 10, "max_ms": 3000}
+
+
+def client_error(code, status=400):
+    return ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "InvokeModel"
+    )
+
+
+class FakeRegion:
+    """invoke_modelの応答または例外を返す。releaseされるまで応答を保留できる"""
+
+    def __init__(self, body=b"{}", error=None, blocked=False):
+        self.body = body
+        self.error = error
+        self.released = threading.Event()
+        if not blocked:
+            self.released.set()
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        self.released.wait(5)
+        if self.error:
+            raise self.error
+        return {"body": io.BytesIO(self.body)}
+
+
+def test_latency_tracker_uses_default_until_enough_samples():
+    tracker = LatencyTracker(percentile=90, default_ms=1500, min_ms=300, max_ms=3000)
+    assert tracker.hedge_delay() == 1.5
+
+    for elapsed_ms in range(1, MIN_SAMPLES):
+        tracker.record(elapsed_ms * 100)
+    assert tracker.hedge_delay() == 1.5
+
+
+def test_latency_tracker_percentile_is_clamped():
+    tracker = LatencyTracker(percentile=90, default_ms=1500, min_ms=300, max_ms=1500)
+    for elapsed_ms in range(1, 101):
+        tracker.record(elapsed_ms * 10)
+    # 100件の90パーセンタイルは昇順で91番目
+    assert tracker.hedge_delay() == pytest.approx(0.91)
+
+    for _ in range(200):
+        tracker.record(10)
+    assert tracker.hedge_delay() == pytest.approx(0.3)
+
+    for _ in range(200):
+        tracker.record(10000)
+    assert tracker.hedge_delay() == pytest.approx(1.5)
+
+
+def test_latency_tracker_without_default_or_max():
+    tracker = LatencyTracker(percentile=50, default_ms=None, min_ms=300, max_ms=None)
+    assert tracker.hedge_delay() is None
+
+    for _ in range(MIN_SAMPLES):
+        tracker.record(20000)
+    assert tracker.hedge_delay() == 20.0
+
+
+def test_trackers_are_kept_per_model_and_streaming():
+    hedged = HedgedBedrock(FakeRegion(), FakeRegion(), SETTINGS)
+
+    haiku = hedged.tracker_for("haiku", True)
+    assert hedged.tracker_for("haiku", True) is haiku
+    assert hedged.tracker_for("sonnet", True) is not haiku
+    # 非ストリーミングは応答全体の時間で判断し、記録が揃うまではヘッジしない
+    assert hedged.tracker_for("haiku", False).hedge_delay() is None
+    assert haiku.hedge_delay() == pytest.approx(0.05)
+
+
+def test_non_streaming_call_is_not_hedged_until_samples_are_recorded():
+    primary = FakeRegion(b"primary")
+    secondary = FakeRegion(b"secondary")
+    hedged = HedgedBedrock(primary, secondary, SETTINGS)
+
+    body, hedge = hedged.invoke_model(modelId="sonnet", body="{}")
+
+    assert body == b"primary"
+    assert hedge["hedged"] is False
+    assert secondary.calls == 0
+    assert len(hedged.tracker_for("sonnet", False).samples) == 1
+
+
+def test_slow_primary_is_hedged_and_secondary_wins():
+    primary = FakeRegion(b"primary", blocked=True)
+    secondary = FakeRegion(b"secondary")
+    hedged = HedgedBedrock(primary, secondary, SETTINGS)
+    tracker = hedged.tracker_for("sonnet", False)
+    for _ in range(MIN_SAMPLES):
+        tracker.record(10)
+
+    body, hedge = hedged.invoke_model(modelId="sonnet", body="{}")
+    primary.released.set()
+
+    assert body == b"secondary"
+    assert hedge == {"hedged": True, "winner": "secondary", "delayMs": 10}
+
+
+@pytest.mark.parametrize("error", [
+    BedrockUnavailableError("ThrottlingException after 3 attempts"),
+    CircuitOpenError("Bedrock circuit is open"),
+    client_error("ServiceUnavailableException", 503),
+])
+def test_primary_failure_is_hedged_when_retryable_elsewhere(error):
+    hedged = HedgedBedrock(FakeRegion(error=error), FakeRegion(b"secondary"), SETTINGS)
+    tracker = hedged.tracker_for("sonnet", False)
+    for _ in range(MIN_SAMPLES):
+        tracker.record(1000)
+
+    body, hedge = hedged.invoke_model(modelId="sonnet", body="{}")
+    assert body == b"secondary"
+    assert hedge["winner"] == "secondary"
+
+
+def test_request_error_is_not_hedged():
+    secondary = FakeRegion(b"secondary")
+    hedged = HedgedBedrock(FakeRegion(error=client_error("ValidationException")), secondary, SETTINGS)
+    tracker = hedged.tracker_for("sonnet", False)
+    for _ in range(MIN_SAMPLES):
+        tracker.record(1000)
+
+    with pytest.raises(ClientError):
+        hedged.invoke_model(modelId="sonnet", body="{}")
+    assert secondary.calls == 0
+
+
+def test_is_hedgeable_error():
+    assert is_hedgeable_error(client_error("ThrottlingException"))
+    assert is_hedgeable_error(client_error("UnknownError", 500))
+    assert not is_hedgeable_error(client_error("AccessDeniedException", 403))
+    assert not is_hedgeable_error(ValueError("bad"))
@@ -0,0 +1,62 @@
+"""会話履歴のトークン予算のテスト"""
+from history import build_history_text, estimate_tokens, select_recent_turns, turn_lines, turns_to_summarize
+
+
+def make_turn(timestamp, message, response=""):
+    return {"timestamp": timestamp, "message": message, "response": response}
+
+
+def turn_tokens(turn):
+    return sum(estimate_tokens(line) for line in turn_lines(turn))
+
+
+def test_estimate_tokens_counts_wide_characters_individually():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("相談です") == 4
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("残業abcd") == 3
+
+
+def test_turn_lines_omits_missing_response():
+    assert turn_lines({"message": "質問"}) == ["ユーザー: 質問"]
+    assert turn_lines(make_turn("1", "質問", "回答")) == ["ユーザー: 質問", "アシスタント: 回答"]
+
+
+def test_select_recent_turns_keeps_newest_turns_within_budget():
+    turns = [make_turn(str(i), "相談" * 10, "回答" * 10) for i in range(5)]
+    per_turn = turn_tokens(turns[0])
+
+    recent, older = select_recent_turns(turns, per_turn * 2)
+    assert recent == turns[3:]
+    assert older == turns[:3]
+
+    recent, older = select_recent_turns(turns, per_turn * 2 - 1)
+    assert recent == turns[4:]
+
+
+def test_select_recent_turns_stops_at_first_turn_over_budget():
+    # 古いやり取りが短くても、予算を超えたやり取りより前は含めない（順序を保つ）
+    turns = [make_turn("1", "短い"), make_turn("2", "長い" * 100), make_turn("3", "短い")]
+    recent, older = select_recent_turns(turns, turn_tokens(turns[2]) + 10)
+    assert recent == turns[2:]
+    assert older == turns[:2]
+
+
+def test_build_history_text_combines_summary_and_recent_turns():
+    turns = [make_turn("1", "古い相談" * 50), make_turn("2", "新しい相談", "回答")]
+    text = build_history_text(turns, "以前は人事の相談", turn_tokens(turns[1]))
+
+    assert text == (
+        "■ これまでの会話の要約:\n以前は人事の相談\n\n"
+        "■ 直近の会話:\nユーザー: 新しい相談\nアシスタント: 回答"
+    )
+    assert build_history_text([], "", 100) == ""
+
+
+def test_turns_to_summarize_skips_already_summarized_turns():
+    turns = [make_turn(str(i), "相談" * 20) for i in range(1, 5)]
+    budget = turn_tokens(turns[0])
+
+    assert turns_to_summarize(turns, "", budget) == turns[:3]
+    assert turns_to_summarize(turns, "2", budget) == turns[2:3]
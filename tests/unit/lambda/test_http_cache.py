@@ -0,0 +1,23 @@
+"""条件付きGET（ETag / If-None-Match）の共通処理のテスト"""
+from utils.http_cache import build_etag, etag_matches
+
+
+def test_build_etag_is_strong_and_depends_on_body():
+    etag = build_etag('{"status": "completed"}')
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert len(etag) == 34
+    assert build_etag('{"status": "completed"}') == etag
+    assert build_etag('{"status": "processing"}') != etag
+
+
+def test_etag_matches_any_candidate_with_weak_comparison():
+    etag = build_etag("body")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches(f"W/{etag}", etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches(None, etag)
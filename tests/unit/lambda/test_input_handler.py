@@ -0,0 +1,128 @@
+"""メッセージ送信APIの再送（Idempotency-Key）のテスト"""
+import importlib.util
+import json
+import os
+
+import pytest
+from aws_lambda_powertools.utilities.idempotency.exceptions import (
+    IdempotencyItemAlreadyExistsError,
+    IdempotencyItemNotFoundError,
+)
+from aws_lambda_powertools.utilities.idempotency.persistence.dynamodb import DynamoDBPersistenceLayer
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "src", "lambda", "api", "input_handler", "lambda_function.py"
+)
+
+
+class InMemoryRecords:
+    """冪等性テーブルの代わり（DynamoDBの条件付き書き込みと同じ判定をする）"""
+
+    def __init__(self):
+        self.records = {}
+
+    def get(self, idempotency_key):
+        if idempotency_key not in self.records:
+            raise IdempotencyItemNotFoundError
+        return self.records[idempotency_key]
+
+    def put(self, layer, data_record):
+        existing = self.records.get(data_record.idempotency_key)
+        if existing is not None and not existing.is_expired:
+            # DynamoDBPersistenceLayerと同じく、既存のレコードと内容が異なる再送はここで拒否する
+            layer._validate_payload(data_payload=data_record, stored_data_record=existing)
+            raise IdempotencyItemAlreadyExistsError(old_data_record=existing)
+        self.records[data_record.idempotency_key] = data_record
+
+    def update(self, data_record):
+        self.records[data_record.idempotency_key] = data_record
+
+    def delete(self, data_record):
+        self.records.pop(data_record.idempotency_key, None)
+
+
+class StubStepFunctions:
+    def __init__(self):
+        self.started = []
+
+    def start_execution(self, stateMachineArn, name, input):
+        self.started.append(name)
+        return {"executionArn": f"{stateMachineArn}:{name}"}
+
+
+class LambdaContext:
+    function_name = "input-handler"
+    memory_limit_in_mb = 256
+    invoked_function_arn = "arn:aws:lambda:ap-northeast-1:123456789012:function:input-handler"
+    aws_request_id = "request-1"
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+@pytest.fixture
+def input_handler(monkeypatch):
+    # 各Lambdaのモジュール名は同じ（lambda_function）なので、ファイルから別名で読み込む
+    monkeypatch.setenv("CONVERSATION_TABLE_NAME", "")
+    monkeypatch.setenv("IDEMPOTENCY_TABLE_NAME", "idempotency")
+    monkeypatch.setenv("STATE_MACHINE_ARN", "arn:aws:states:ap-northeast-1:123456789012:stateMachine:processor")
+    records = InMemoryRecords()
+    monkeypatch.setattr(DynamoDBPersistenceLayer, "_get_record", lambda layer, *args, **kwargs: records.get(*args, **kwargs))
+    monkeypatch.setattr(DynamoDBPersistenceLayer, "_put_record", lambda layer, *args, **kwargs: records.put(layer, *args, **kwargs))
+    monkeypatch.setattr(DynamoDBPersistenceLayer, "_update_record", lambda layer, *args, **kwargs: records.update(*args, **kwargs))
+    monkeypatch.setattr(DynamoDBPersistenceLayer, "_delete_record", lambda layer, *args, **kwargs: records.delete(*args, **kwargs))
+    spec = importlib.util.spec_from_file_location("input_handler_lambda_function", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.stepfunctions = StubStepFunctions()
+    return module
+
+
+def post_event(message="残業が多いです", idempotency_key="key-1", user_id="user-1"):
+    headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+    return {
+        "httpMethod": "POST",
+        "resource": "/api/v1/chat",
+        "headers": headers,
+        "body": json.dumps({"message": message}, ensure_ascii=False),
+        "requestContext": {"authorizer": {"claims": {"sub": user_id}}},
+    }
+
+
+def post(input_handler, **kwargs):
+    response = input_handler.lambda_handler(post_event(**kwargs), LambdaContext())
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_replay_returns_the_first_response_without_starting_again(input_handler):
+    first_status, first = post(input_handler)
+    replay_status, replay = post(input_handler)
+
+    assert first_status == replay_status == 202
+    assert replay == first
+    assert input_handler.stepfunctions.started == [f"chat-{first['conversationId']}"]
+
+
+def test_same_key_with_different_message_is_rejected(input_handler):
+    post(input_handler)
+
+    status, body = post(input_handler, message="別の相談です")
+
+    assert status == 422
+    assert "Idempotency-Key" in body["error"]
+    assert len(input_handler.stepfunctions.started) == 1
+
+
+def test_same_key_from_another_user_is_a_new_request(input_handler):
+    _, first = post(input_handler)
+    _, other = post(input_handler, user_id="user-2")
+
+    assert other["conversationId"] != first["conversationId"]
+    assert len(input_handler.stepfunctions.started) == 2
+
+
+def test_request_without_key_is_not_deduplicated(input_handler):
+    post(input_handler, idempotency_key=None)
+    post(input_handler, idempotency_key=None)
+
+    assert len(input_handler.stepfunctions.started) == 2
@@ -0,0 +1,97 @@
+"""メモリマップした辞書によるキーワード抽出のテスト"""
+import pytest
+
+from utils.keyword_extractor import (
+    HEADER,
+    POS_FUNCTION,
+    POS_NOUN,
+    POS_PROPER,
+    POS_STOP,
+    POS_UNKNOWN,
+    KeywordDictionary,
+    KeywordExtractor,
+    Token,
+    encode_dictionary,
+    load_extractor,
+)
+
+ENTRIES = [
+    ("残業", POS_NOUN, 3),
+    ("残業代", POS_NOUN, 5),
+    ("上司", POS_NOUN, 2),
+    ("相談", POS_STOP, 0),
+    ("人事部", POS_PROPER, 4),
+]
+
+
+@pytest.fixture
+def dictionary(tmp_path):
+    path = tmp_path / "keyword_dictionary.bin"
+    path.write_bytes(encode_dictionary(ENTRIES))
+    dictionary = KeywordDictionary(str(path))
+    yield dictionary
+    dictionary.close()
+
+
+def test_encode_dictionary_dedupes_and_records_max_chars(tmp_path):
+    data = encode_dictionary(ENTRIES + [("上司", POS_NOUN, 9)])
+    _, _, max_chars, count = HEADER.unpack_from(data, 0)
+    assert (max_chars, count) == (3, 5)
+
+    path = tmp_path / "dictionary.bin"
+    path.write_bytes(data)
+    dictionary = KeywordDictionary(str(path))
+    # 同じ見出し語は後のものが残る
+    assert dictionary.longest_match("上司", 0) == (2, POS_NOUN, 9)
+    dictionary.close()
+
+
+def test_dictionary_rejects_unknown_format(tmp_path):
+    path = tmp_path / "broken.bin"
+    path.write_bytes(b"XXXX" + encode_dictionary(ENTRIES)[4:])
+    with pytest.raises(ValueError):
+        KeywordDictionary(str(path))
+
+
+def test_longest_match_prefers_longest_entry(dictionary):
+    assert len(dictionary) == 5
+    assert dictionary.longest_match("残業代が出ない", 0) == (3, POS_NOUN, 5)
+    assert dictionary.longest_match("残業が多い", 0) == (2, POS_NOUN, 3)
+    assert dictionary.longest_match("残念", 0) is None
+    assert dictionary.longest_match("人事", 0) is None
+
+
+def test_tokenize_splits_unknown_words_by_char_type(dictionary):
+    tokens = KeywordExtractor(dictionary).tokenize("上司とシフト調整、 残業代")
+
+    assert tokens == [
+        Token("上司", 0, POS_NOUN, 2),
+        Token("と", 2, POS_FUNCTION, 1),
+        Token("シフト", 3, POS_UNKNOWN, 1),
+        Token("調整", 6, POS_UNKNOWN, 1),
+        Token("残業代", 10, POS_NOUN, 5),
+    ]
+
+
+def test_unknown_word_stops_where_dictionary_word_begins(dictionary):
+    tokens = KeywordExtractor(dictionary).tokenize("深夜残業")
+    assert [token.surface for token in tokens] == ["深夜", "残業"]
+
+
+def test_extract_ranks_by_weighted_count_and_skips_stop_words(dictionary):
+    extractor = KeywordExtractor(dictionary)
+    text = "上司に相談したが、上司は人事部に相談しろと言う。残業が続く。"
+
+    # 上司 2回×2 と 人事部 1回×4 は同点で先に出現した順。1文字の未知語（言・続）は除く
+    assert extractor.extract(text) == ["上司", "人事部", "残業"]
+    assert extractor.extract(text, limit=2) == ["上司", "人事部"]
+    assert "相談" not in extractor.extract(text, limit=10)
+
+
+def test_load_extractor_opens_dictionary_file(tmp_path):
+    path = tmp_path / "keyword_dictionary.bin"
+    path.write_bytes(encode_dictionary(ENTRIES))
+
+    extractor = load_extractor(str(path))
+    assert extractor.extract("残業代") == ["残業代"]
+    extractor.dictionary.close()
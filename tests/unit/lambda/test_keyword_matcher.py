@@ -0,0 +1,66 @@
+"""Aho-Corasickによるキーワード一括マッチングのテスト"""
+from utils.keyword_matcher import KeywordHit, KeywordMatcher
+
+
+def hits_of(matcher, text):
+    return [(hit.keyword, hit.start, hit.end, hit.labels) for hit in matcher.find_all(text)]
+
+
+def test_finds_all_overlapping_keywords_by_end_position():
+    matcher = KeywordMatcher()
+    matcher.add_all(["ハラスメント", "パワハラ", "ハラ"], "category")
+    matcher.add("残業", "urgency")
+    matcher.build()
+
+    assert hits_of(matcher, "残業とパワハラスメント") == [
+        ("残業", 0, 2, ("urgency",)),
+        # 同じ位置で終わる場合は長いキーワードが先
+        ("パワハラ", 3, 7, ("category",)),
+        ("ハラ", 5, 7, ("category",)),
+        ("ハラスメント", 5, 11, ("category",)),
+    ]
+
+
+def test_same_keyword_collects_labels_once():
+    matcher = KeywordMatcher()
+    matcher.add("エラー", ("category", "技術的な問題"))
+    matcher.add("エラー", ("department", "dept-003"))
+    matcher.add("エラー", ("category", "技術的な問題"))
+
+    assert len(matcher) == 1
+    hit, = matcher.find_all("エラーです")
+    assert hit == KeywordHit(0, 3, "エラー", (("category", "技術的な問題"), ("department", "dept-003")))
+
+
+def test_builds_automatically_and_ignores_empty_keyword():
+    matcher = KeywordMatcher()
+    matcher.add("", "x")
+    matcher.add("業務", "x")
+
+    assert len(matcher) == 1
+    assert hits_of(matcher, "業務相談") == [("業務", 0, 2, ("x",))]
+    assert matcher.find_all("") == []
+
+
+def test_rebuild_after_add_does_not_duplicate_hits():
+    matcher = KeywordMatcher()
+    matcher.add("ハラ", "a")
+    matcher.add("パワハラ", "b")
+    matcher.build()
+    first = hits_of(matcher, "パワハラ")
+
+    matcher.add("セクハラ", "c")
+    matcher.build()
+    matcher.build()
+
+    assert hits_of(matcher, "パワハラ") == first == [("パワハラ", 0, 4, ("b",)), ("ハラ", 2, 4, ("a",))]
+    assert hits_of(matcher, "セクハラ") == [("セクハラ", 0, 4, ("c",)), ("ハラ", 2, 4, ("a",))]
+
+
+def test_keyword_added_after_build_is_found_via_failure_links():
+    matcher = KeywordMatcher()
+    matcher.add("abcd", "long")
+    matcher.build()
+    matcher.add("bc", "short")
+
+    assert hits_of(matcher, "abcd") == [("bc", 1, 3, ("short",)), ("abcd", 0, 4, ("long",))]
@@ -0,0 +1,132 @@
+"""モデルのルーティングと大きいモデルでの再分析のテスト"""
+import json
+
+import pytest
+
+import lambda_function as analyzer
+from utils.bedrock_client import BedrockUnavailableError
+
+
+def model_output(confidence):
+    return json.dumps({
+        "suggested_message": "上司に報告してください",
+        "category": "業務相談",
+        "urgency": "中",
+        "recommended_recipients": [{"department": "営業部", "role": "課長", "reason": "担当のため"}],
+        "confidence": confidence,
+    }, ensure_ascii=False)
+
+
+def usage(model_id):
+    return {"modelId": model_id, "inputTokens": 10, "outputTokens": 10}
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    """モデルごとの出力（例外も可）を返し、呼び出したモデルを記録する"""
+    outputs = {}
+    calls = []
+
+    def analyze_with_bedrock(prompt, model_id, publisher=None):
+        calls.append(model_id)
+        output = outputs[model_id]
+        if isinstance(output, Exception):
+            raise output
+        return output, usage(model_id)
+
+    monkeypatch.setattr(analyzer, "analyze_with_bedrock", analyze_with_bedrock)
+    monkeypatch.setattr(analyzer, "record_invocation_metrics", lambda usage, analysis=None: None)
+    return outputs, calls
+
+
+def run(message="会議の資料について相談です"):
+    with analyzer.buffered_metrics() as recorded:
+        analysis, routing, invocations = analyzer.run_routed_analysis("prompt", message)
+    return analysis, routing, invocations, recorded
+
+
+def test_short_consultation_uses_the_fast_model():
+    model_id, reason, signals = analyzer.route_consultation("会議の資料について相談です")
+
+    assert (model_id, reason) == (analyzer.FAST_MODEL_ID, "default")
+    assert signals["length"] == len("会議の資料について相談です")
+
+
+def test_urgent_consultation_uses_the_large_model():
+    model_id, reason, signals = analyzer.route_consultation("至急対応が必要です")
+
+    assert (model_id, reason) == (analyzer.ESCALATION_MODEL_ID, "high_urgency")
+    assert signals["urgency"] == "高"
+
+
+def test_long_consultation_uses_the_large_model(monkeypatch):
+    monkeypatch.setattr(analyzer, "ROUTER_MAX_FAST_CHARS", 10)
+
+    model_id, reason, _ = analyzer.route_consultation("会議の資料について相談です")
+
+    assert (model_id, reason) == (analyzer.ESCALATION_MODEL_ID, "long_message")
+
+
+def test_confident_fast_analysis_is_not_escalated(bedrock):
+    outputs, calls = bedrock
+    outputs[analyzer.FAST_MODEL_ID] = model_output(0.9)
+
+    analysis, routing, invocations, recorded = run()
+
+    assert calls == [analyzer.FAST_MODEL_ID]
+    assert analysis["modelId"] == analyzer.FAST_MODEL_ID
+    assert routing["escalated"] is False
+    assert len(invocations) == 1
+    assert ("BedrockRoutedFast", analyzer.MetricUnit.Count, 1) in recorded
+
+
+def test_low_confidence_is_escalated(bedrock):
+    outputs, calls = bedrock
+    outputs[analyzer.FAST_MODEL_ID] = model_output(0.3)
+    outputs[analyzer.ESCALATION_MODEL_ID] = model_output(0.8)
+
+    analysis, routing, invocations, recorded = run()
+
+    assert calls == [analyzer.FAST_MODEL_ID, analyzer.ESCALATION_MODEL_ID]
+    assert analysis["modelId"] == analyzer.ESCALATION_MODEL_ID
+    assert analysis["confidence"] == 0.8
+    assert routing["initialConfidence"] == 0.3
+    assert routing["escalationReason"] == "low_confidence"
+    assert [item["modelId"] for item in invocations] == calls
+    assert ("BedrockEscalated", analyzer.MetricUnit.Count, 1) in recorded
+
+
+def test_invalid_output_is_escalated(bedrock):
+    outputs, calls = bedrock
+    outputs[analyzer.FAST_MODEL_ID] = "報告してください"
+    outputs[analyzer.ESCALATION_MODEL_ID] = model_output(0.8)
+
+    analysis, routing, _, _ = run()
+
+    assert routing["escalationReason"] == "invalid_output"
+    assert analysis["modelId"] == analyzer.ESCALATION_MODEL_ID
+
+
+def test_large_model_is_not_escalated_again(bedrock):
+    outputs, calls = bedrock
+    outputs[analyzer.ESCALATION_MODEL_ID] = model_output(0.1)
+
+    analysis, routing, _, _ = run("至急対応が必要です")
+
+    assert calls == [analyzer.ESCALATION_MODEL_ID]
+    assert routing["escalated"] is False
+
+
+def test_failed_escalation_keeps_the_first_analysis(bedrock):
+    outputs, calls = bedrock
+    outputs[analyzer.FAST_MODEL_ID] = model_output(0.3)
+    outputs[analyzer.ESCALATION_MODEL_ID] = BedrockUnavailableError("circuit open")
+
+    analysis, routing, invocations, recorded = run()
+
+    assert analysis["modelId"] == analyzer.FAST_MODEL_ID
+    assert analysis["confidence"] == 0.3
+    assert routing["escalated"] is False
+    assert routing["escalationError"] == "circuit open"
+    assert len(invocations) == 1
+    assert ("BedrockEscalationFailed", analyzer.MetricUnit.Count, 1) in recorded
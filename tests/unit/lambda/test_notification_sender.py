@@ -0,0 +1,73 @@
+"""分析結果のWebSocket通知のテスト"""
+import importlib.util
+import json
+import os
+
+import pytest
+
+from utils.websocket_client import FanoutResult
+
+SENDER_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "src", "lambda", "processors", "notification_sender", "lambda_function.py"
+)
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    # 各Lambdaのモジュール名は同じ（lambda_function）なので、ファイルから別名で読み込む
+    monkeypatch.setenv("CONVERSATIONS_TABLE", "")
+    monkeypatch.setenv("CONNECTIONS_TABLE", "")
+    spec = importlib.util.spec_from_file_location("notification_sender_lambda_function", SENDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RecordingFanout:
+    def __init__(self, sender):
+        self.sender = sender
+        self.sent = []
+
+    def send(self, targets, message):
+        self.sent.append((targets, message))
+        return FanoutResult(sent=list(targets))
+
+
+def notify(sender, monkeypatch, event):
+    fanout = RecordingFanout(sender)
+    monkeypatch.setattr(sender, "fanout", fanout)
+    sender.lambda_handler({"connectionId": "conn-1", "websocketEndpoint": "wss://example/dev", **event}, None)
+    (targets, message), = fanout.sent
+    assert targets == {"conn-1": "wss://example/dev"}
+    return message
+
+
+def test_completed_analysis_is_notified_as_completed(sender, monkeypatch):
+    message = notify(sender, monkeypatch, {
+        "conversationId": "conv-1",
+        "status": "completed",
+        "analysis": {"analysis": "上司に報告してください"},
+        "suggestion": {"department": "人事部"},
+    })
+
+    assert message == {
+        "type": "analysis",
+        "status": "completed",
+        "analysis": {"analysis": "上司に報告してください"},
+        "suggestion": {"department": "人事部"},
+        "conversationId": "conv-1",
+    }
+
+
+def test_error_status_is_propagated(sender, monkeypatch):
+    message = notify(sender, monkeypatch, {"conversationId": "conv-1", "status": "error", "error": "AnalysisFailed"})
+
+    assert message == {"type": "analysis", "status": "error", "error": "AnalysisFailed", "conversationId": "conv-1"}
+
+
+def test_error_result_without_status_is_not_reported_as_completed(sender, monkeypatch):
+    message = notify(sender, monkeypatch, {"conversationId": "conv-1", "analysis": {"error": "Bedrock failed"}})
+
+    assert message["status"] == "error"
+    assert message["error"] == "Bedrock failed"
+    assert json.dumps(message)
@@ -0,0 +1,80 @@
+"""報告ルールによる暫定的な報告先の提案のテスト"""
+from utils.reporting_rules import DEFAULT_RECIPIENT, ReportingRules
+
+DATA = {
+    "organization": {
+        "departments": [
+            {"id": "dept-001", "name": "人事部", "roles": [{"id": "role-001", "title": "人事部長"}]},
+            {"id": "dept-002", "name": "コンプライアンス室", "roles": [{"id": "role-002", "title": "室長"}]},
+        ]
+    },
+    "reportingRules": [
+        {
+            "category": "労務",
+            "keywords": ["残業", "休暇"],
+            "urgencyLevel": "medium",
+            "suggestedDepartments": ["dept-001"],
+            "escalationPath": ["role-001"],
+        },
+        {
+            "category": "ハラスメント",
+            "keywords": ["パワハラ", "暴言"],
+            "urgencyLevel": "high",
+            "suggestedDepartments": ["dept-002", "dept-001"],
+            "escalationPath": ["role-002", "role-001"],
+        },
+    ],
+}
+
+
+def test_match_prefers_rule_with_most_hits_then_definition_order():
+    rules = ReportingRules(DATA)
+
+    assert rules.match("残業が多い")["rule"]["category"] == "労務"
+    matched = rules.match("残業中に上司のパワハラと暴言があった")
+    assert matched["rule"]["category"] == "ハラスメント"
+    assert matched["keywords"] == ["パワハラ", "暴言"]
+    # 同数なら先に定義したルール
+    assert rules.match("休暇中の暴言")["rule"]["category"] == "労務"
+    assert rules.match("特になし") is None
+
+
+def test_suggest_builds_provisional_result_from_rule():
+    suggestion = ReportingRules(DATA).suggest("パワハラを受けています、暴言もパワハラです")
+
+    assert suggestion == {
+        "category": "ハラスメント",
+        "urgency": "高",
+        "recommendedRecipient": "コンプライアンス室 室長",
+        "recommendedRecipients": [
+            {
+                "department": "コンプライアンス室",
+                "role": "室長",
+                "reason": "「パワハラ」「暴言」に関する相談はコンプライアンス室の担当です",
+            },
+            {
+                "department": "人事部",
+                "role": "室長",
+                "reason": "「パワハラ」「暴言」に関する相談は人事部の担当です",
+            },
+        ],
+        "escalationPath": ["室長", "人事部長"],
+        "keywords": ["パワハラ", "暴言"],
+        "provisional": True,
+    }
+
+
+def test_suggest_without_match_falls_back_to_direct_manager():
+    suggestion = ReportingRules(DATA).suggest("雑談です")
+
+    assert suggestion["category"] == "その他"
+    assert suggestion["urgency"] == "低"
+    assert suggestion["recommendedRecipient"] == DEFAULT_RECIPIENT
+    assert suggestion["recommendedRecipients"] == []
+    assert suggestion["provisional"] is True
+
+
+def test_load_reads_bundled_rules():
+    rules = ReportingRules.load()
+    assert rules.rules
+    assert rules.suggest("相談")["provisional"] is True
@@ -0,0 +1,168 @@
+"""状態取得APIの条件付きGETとキャッシュ指定のテスト"""
+import importlib.util
+import json
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "src", "lambda", "api", "status_handler", "lambda_function.py"
+)
+
+
+@pytest.fixture
+def status_handler(monkeypatch):
+    # 各Lambdaのモジュール名は同じ（lambda_function）なので、ファイルから別名で読み込む
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    monkeypatch.setenv("CONVERSATION_TABLE_NAME", "")
+    monkeypatch.setenv("STATUS_FINAL_MAX_AGE_SECONDS", "600")
+    spec = importlib.util.spec_from_file_location("status_handler_lambda_function", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+COMPLETED = {"conversationId": "conv-1", "status": "completed", "analysis": "上司に報告してください"}
+PROCESSING = {"conversationId": "conv-1", "status": "processing", "message": "分析中です..."}
+TURN = "2026-10-18T09:00:00.000Z"
+
+
+def status_event(final=False, if_none_match=None, turn=TURN):
+    resource = "/api/v1/chat/{conversationId}/status" + ("/final" if final else "")
+    event = {
+        "httpMethod": "GET",
+        "resource": resource,
+        "path": "/api/v1/chat/conv-1/status" + ("/final" if final else ""),
+        "pathParameters": {"conversationId": "conv-1"},
+    }
+    if final and turn is not None:
+        event["queryStringParameters"] = {"turn": turn}
+    if if_none_match is not None:
+        event["headers"] = {"if-none-match": if_none_match}
+    return event
+
+
+def test_status_has_etag_and_is_revalidated(status_handler):
+    response = status_handler.build_status_response(status_event(), 200, PROCESSING)
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["ETag"] == status_handler.build_etag(response["body"])
+    assert response["headers"]["Cache-Control"] == "private, no-cache"
+    assert "Content-Location" not in response["headers"]
+    assert json.loads(response["body"]) == PROCESSING
+
+
+def test_matching_if_none_match_returns_304_without_body(status_handler):
+    etag = status_handler.build_status_response(status_event(), 200, PROCESSING)["headers"]["ETag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        response = status_handler.build_status_response(status_event(if_none_match=if_none_match), 200, PROCESSING)
+        assert response["statusCode"] == 304
+        assert response["body"] == ""
+        assert response["headers"]["ETag"] == etag
+
+    response = status_handler.build_status_response(status_event(if_none_match='"stale"'), 200, PROCESSING)
+    assert response["statusCode"] == 200
+
+
+def test_final_status_points_to_cacheable_representation(status_handler):
+    response = status_handler.build_status_response(status_event(), 200, COMPLETED, TURN)
+
+    # 同じ会話で次の相談が始まりうるため、通常のURLは最終状態でも再検証させる
+    assert response["headers"]["Cache-Control"] == "private, no-cache"
+    assert response["headers"]["Content-Location"] == (
+        "/api/v1/chat/conv-1/status/final?turn=2026-10-18T09%3A00%3A00.000Z"
+    )
+
+    # やり取りの時刻が分からない（実行履歴から作った）状態はキャッシュできる場所を示さない
+    response = status_handler.build_status_response(status_event(), 200, COMPLETED)
+    assert "Content-Location" not in response["headers"]
+
+
+def test_final_resource_is_immutable(status_handler):
+    response = status_handler.build_status_response(status_event(final=True), 200, COMPLETED, TURN)
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["Cache-Control"] == "private, max-age=600, immutable"
+    assert "ETag" in response["headers"]
+
+    etag = response["headers"]["ETag"]
+    response = status_handler.build_status_response(status_event(final=True, if_none_match=etag), 200, COMPLETED, TURN)
+    assert response["statusCode"] == 304
+
+
+def test_final_resource_rejects_other_turn(status_handler):
+    # 次の相談が始まった後は、前のやり取りのURLで新しい結果を返さない
+    event = status_event(final=True, turn="2026-10-18T08:00:00.000Z")
+    response = status_handler.build_status_response(event, 200, COMPLETED, TURN)
+
+    assert response["statusCode"] == 409
+    assert response["headers"]["Cache-Control"] == "no-store"
+
+    response = status_handler.build_status_response(status_event(final=True), 200, COMPLETED)
+    assert response["statusCode"] == 409
+
+
+def test_final_resource_requires_turn(status_handler):
+    response = status_handler.lambda_handler(status_event(final=True, turn=None), None)
+
+    assert response["statusCode"] == 400
+
+
+def test_final_resource_rejects_processing_status(status_handler):
+    response = status_handler.build_status_response(status_event(final=True), 200, PROCESSING, TURN)
+
+    assert response["statusCode"] == 409
+    assert response["headers"]["Cache-Control"] == "no-store"
+    assert "ETag" not in response["headers"]
+    assert json.loads(response["body"])["status"] == "processing"
+
+
+def test_error_responses_are_not_cached(status_handler):
+    response = status_handler.build_status_response(status_event(if_none_match="*"), 404, {"error": "Conversation not found"})
+
+    assert response["statusCode"] == 404
+    assert "ETag" not in response["headers"]
+    assert "Cache-Control" not in response["headers"]
+
+
+class FakeStepFunctions:
+    """describe_executionの応答または例外を返す"""
+
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.arns = []
+
+    def describe_execution(self, executionArn):
+        self.arns.append(executionArn)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+def test_unknown_conversation_falls_back_to_describe_execution(status_handler, monkeypatch):
+    stepfunctions = FakeStepFunctions({"status": "SUCCEEDED", "output": json.dumps({"analysis": "報告してください"})})
+    monkeypatch.setattr(status_handler, "stepfunctions", stepfunctions)
+    monkeypatch.setattr(
+        status_handler, "STATE_MACHINE_ARN", "arn:aws:states:ap-northeast-1:123456789012:stateMachine:processor"
+    )
+
+    response = status_handler.lambda_handler(status_event(), None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["status"] == "completed"
+    assert stepfunctions.arns == ["arn:aws:states:ap-northeast-1:123456789012:execution:processor:chat-conv-1"]
+
+
+def test_unknown_execution_returns_404(status_handler, monkeypatch):
+    error = ClientError({"Error": {"Code": "ExecutionDoesNotExist"}}, "DescribeExecution")
+    monkeypatch.setattr(status_handler, "stepfunctions", FakeStepFunctions(error=error))
+    monkeypatch.setattr(
+        status_handler, "STATE_MACHINE_ARN", "arn:aws:states:ap-northeast-1:123456789012:stateMachine:processor"
+    )
+
+    response = status_handler.lambda_handler(status_event(), None)
+
+    assert response["statusCode"] == 404
@@ -0,0 +1,197 @@
+"""ストリーミング中の分析テキストの抽出とWebSocket送信のテスト"""
+import json
+
+import pytest
+
+import streaming
+from streaming import JsonStringFieldExtractor, StreamPublisher
+
+
+def feed_all(extractor, chunks):
+    return [extractor.feed(chunk) for chunk in chunks]
+
+
+def test_extracts_only_the_field_value():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    text = ''.join(feed_all(extractor, ['{"analysis": "上司に', '報告してください", "department": "人事部"}']))
+
+    assert text == "上司に報告してください"
+
+
+def test_marker_split_across_chunks():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    assert feed_all(extractor, ['{"ana', 'lysis"', ' :', ' "', 'ok"}']) == ['', '', '', '', 'ok']
+
+
+def test_decodes_escapes_split_across_chunks():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    chunks = feed_all(extractor, ['{"analysis": "a\\', 'nb\\"c\\\\', 'd\\t"}'])
+
+    assert ''.join(chunks) == 'a\nb"c\\d\t'
+    # エスケープの途中では前半だけを返す
+    assert chunks[0] == 'a'
+
+
+def test_decodes_unicode_escape_split_across_chunks():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    chunks = feed_all(extractor, ['{"analysis": "\\u5831', '\\u90', '23"}'])
+
+    assert chunks == ['報', '', '連']
+
+
+def test_joins_surrogate_pair_split_across_chunks():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    chunks = feed_all(extractor, ['{"analysis": "OK\\ud83d', '\\ude', '00!"}'])
+
+    assert chunks == ['OK', '', '\U0001F600!']
+    # UTF-8で送信できる
+    ''.join(chunks).encode("utf-8")
+
+
+def test_unpaired_surrogate_is_replaced():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    text = extractor.feed('{"analysis": "a\\ud83db\\ude00c"}')
+
+    assert text == 'a�b�c'
+
+
+def test_stops_at_the_end_of_the_field():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    chunks = feed_all(extractor, ['{"analysis": "done", ', '"analysisDetail": "ignored"}'])
+
+    assert chunks == ['done', '']
+
+
+def test_skips_non_string_value_with_the_same_name():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    text = ''.join(feed_all(extractor, ['{"meta": {"analysis": null}, ', '"analysis": "本文"}']))
+
+    assert text == "本文"
+
+
+def test_similar_key_is_not_matched():
+    extractor = JsonStringFieldExtractor("analysis")
+
+    text = ''.join(feed_all(extractor, ['{"analysisSummary": "x", "analysis": "y"}']))
+
+    assert text == "y"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+class GoneException(Exception):
+    pass
+
+
+class StubManagementClient:
+    class exceptions:
+        GoneException = GoneException
+
+    def __init__(self):
+        self.posted = []
+        self.gone = False
+
+    def post_to_connection(self, ConnectionId, Data):
+        if self.gone:
+            raise GoneException()
+        self.posted.append((ConnectionId, json.loads(Data)))
+
+    def messages(self):
+        return [message for _, message in self.posted]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(streaming, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = StubManagementClient()
+    monkeypatch.setattr(streaming, "get_management_client", lambda url: client)
+    return client
+
+
+@pytest.fixture
+def publisher(clock, client, monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_FLUSH_CHARS", 10)
+    monkeypatch.setattr(streaming, "STREAM_FLUSH_INTERVAL_MS", 300)
+    return StreamPublisher("conv-1", "conn-1", "wss://example/dev")
+
+
+def test_first_chunk_is_sent_immediately(publisher, client):
+    publisher.append("a")
+
+    assert [m["delta"] for m in client.messages()] == ["a"]
+    assert client.posted[0][0] == "conn-1"
+
+
+def test_flushes_when_enough_chars_are_buffered(publisher, client):
+    publisher.append("a")
+    publisher.append("12345")
+    assert len(client.posted) == 1
+
+    publisher.append("67890")
+
+    assert [m["delta"] for m in client.messages()] == ["a", "1234567890"]
+    assert [m["sequence"] for m in client.messages()] == [0, 1]
+
+
+def test_flushes_when_the_interval_has_passed(publisher, client, clock):
+    publisher.append("a")
+    publisher.append("b")
+    assert len(client.posted) == 1
+
+    clock.now += 0.5
+    publisher.append("c")
+
+    assert [m["delta"] for m in client.messages()] == ["a", "bc"]
+
+
+def test_close_sends_the_rest_as_final(publisher, client):
+    publisher.append("a")
+    publisher.append("b")
+
+    publisher.close()
+
+    last = client.messages()[-1]
+    assert last["delta"] == "b"
+    assert last["final"] is True
+
+
+def test_publishes_only_the_extracted_field(clock, client):
+    publisher = StreamPublisher("conv-1", "conn-1", "wss://example/dev", field="analysis")
+
+    publisher.append('{"analysis": ')
+    assert client.posted == []
+    publisher.append('"報告')
+
+    assert [m["delta"] for m in client.messages()] == ["報告"]
+
+
+def test_stops_sending_after_the_connection_is_gone(publisher, client):
+    client.gone = True
+    publisher.append("a")
+    client.gone = False
+
+    publisher.append("b")
+    publisher.close()
+
+    assert publisher.active is False
+    assert client.posted == []
@@ -0,0 +1,162 @@
+"""類似相談検索用ベクトルインデックスのテスト"""
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from vector_index import (
+    DELTA_TIME_FORMAT,
+    DELTA_TIME_LENGTH,
+    ConsultationVectorIndex,
+    decode_index,
+    encode_index,
+    normalize,
+)
+
+DIM = 4
+
+
+class FakeS3:
+    """list_objects_v2・get_object・put_object・delete_objectsだけを持つS3"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=""):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        yield {"Contents": [{"Key": key} for key in keys]}
+
+
+def make_index(s3, **kwargs):
+    return ConsultationVectorIndex(s3, "bucket", "vector-index", DIM, refresh_interval=0, **kwargs)
+
+
+def test_encode_decode_round_trip():
+    vectors = np.array([normalize([1, 0, 0, 0]), normalize([1, 1, 0, 0])])
+    entries = [{"conversationId": "a"}, {"conversationId": "b"}]
+
+    decoded, decoded_entries, last_delta_key = decode_index(encode_index(vectors, entries, "deltas/x"))
+
+    assert decoded.dtype == np.float16
+    assert decoded.shape == (2, DIM)
+    np.testing.assert_allclose(decoded, vectors, atol=1e-3)
+    assert decoded_entries == entries
+    assert last_delta_key == "deltas/x"
+
+
+def test_decode_rejects_unknown_format():
+    data = bytearray(encode_index(np.zeros((1, DIM)), [{}]))
+    data[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        decode_index(bytes(data))
+
+
+def test_search_returns_most_similar_entry():
+    index = make_index(FakeS3())
+    assert index.search([1, 0, 0, 0]) is None
+
+    index.add([1, 0, 0, 0], {"conversationId": "a"})
+    index.add([0, 1, 0, 0], {"conversationId": "b"})
+
+    similarity, entry = index.search([0.1, 0.9, 0, 0])
+    assert entry["conversationId"] == "b"
+    assert similarity == pytest.approx(0.9 / np.linalg.norm([0.1, 0.9]), rel=1e-5)
+
+
+def test_other_container_picks_up_deltas_once():
+    s3 = FakeS3()
+    writer = make_index(s3)
+    reader = make_index(s3)
+    reader.load()
+
+    writer.add([1, 0, 0, 0], {"conversationId": "a"})
+    reader.refresh()
+    reader.refresh()
+    # 自分の差分も読み直さない
+    writer.refresh()
+
+    assert reader.size == 1
+    assert writer.size == 1
+
+
+def test_late_delta_with_earlier_name_is_picked_up():
+    s3 = FakeS3()
+    reader = make_index(s3)
+    reader.load()
+
+    make_index(s3).add([1, 0, 0, 0], {"conversationId": "a"})
+    reader.refresh()
+    written_key, = [key for key in s3.objects if "/deltas/" in key]
+
+    # 先に時刻を決めた差分の書き込みが後から完了した
+    name = written_key[len("vector-index/deltas/"):]
+    written_at = datetime.strptime(name[:DELTA_TIME_LENGTH], DELTA_TIME_FORMAT)
+    late_key = f"vector-index/deltas/{(written_at - timedelta(seconds=1)).strftime(DELTA_TIME_FORMAT)}-late0000.hkvi"
+    s3.put_object("bucket", late_key, encode_index(normalize([0, 1, 0, 0]).reshape(1, DIM), [{"conversationId": "b"}]))
+    reader.refresh()
+
+    assert sorted(entry["conversationId"] for entry in reader.entries) == ["a", "b"]
+
+
+def test_compacted_snapshot_is_named_by_last_delta_and_not_duplicated():
+    s3 = FakeS3()
+    writer = make_index(s3)
+    writer.add([1, 0, 0, 0], {"conversationId": "a"})
+    writer.add([0, 1, 0, 0], {"conversationId": "b"})
+    writer.compact()
+
+    snapshot_keys = [key for key in s3.objects if "/snapshots/" in key]
+    assert snapshot_keys == ["vector-index/snapshots/" + writer.last_delta_key.rsplit("/", 1)[-1]]
+
+    # スナップショットに含まれる差分が一覧に残っていても二重に読み込まない
+    reader = make_index(s3)
+    reader.load()
+    assert reader.size == 2
+
+
+def test_concurrent_compactions_keep_the_newest_snapshot():
+    s3 = FakeS3()
+    first = make_index(s3)
+    second = make_index(s3)
+    first.add([1, 0, 0, 0], {"conversationId": "a"})
+    first.compact()
+
+    second.load()
+    second.add([0, 1, 0, 0], {"conversationId": "b"})
+    first.compact()
+    second.compact()
+    first.add([0, 0, 1, 0], {"conversationId": "c"})
+    first.refresh()
+    first.compact()
+
+    assert len([key for key in s3.objects if "/snapshots/" in key]) == 2
+
+    reader = make_index(s3)
+    reader.load()
+    assert sorted(entry["conversationId"] for entry in reader.entries) == ["a", "b", "c"]
+
+
+def test_max_entries_drops_oldest():
+    index = make_index(FakeS3(), max_entries=2)
+    for i in range(3):
+        vector = [0] * DIM
+        vector[i] = 1
+        index.add(vector, {"conversationId": str(i)})
+
+    assert [entry["conversationId"] for entry in index.entries] == ["1", "2"]
+    assert index.search([1, 0, 0, 0])[1]["conversationId"] != "0"
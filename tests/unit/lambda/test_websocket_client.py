@@ -0,0 +1,118 @@
+"""WebSocketへの並行送信（切断済み接続の削除を含む）のテスト"""
+import json
+import threading
+
+import pytest
+
+from utils import websocket_client
+from utils.websocket_client import WebSocketFanout, get_management_client, management_endpoint
+
+
+class GoneException(Exception):
+    pass
+
+
+class StubManagementClient:
+    class exceptions:
+        GoneException = GoneException
+
+    def __init__(self, gone=(), failing=()):
+        self.gone = set(gone)
+        self.failing = set(failing)
+        self.posted = {}
+        self.lock = threading.Lock()
+
+    def post_to_connection(self, ConnectionId, Data):
+        if ConnectionId in self.gone:
+            raise GoneException()
+        if ConnectionId in self.failing:
+            raise RuntimeError("throttled")
+        with self.lock:
+            self.posted[ConnectionId] = Data
+
+
+class RecordingBatch:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.table.batches += 1
+        return False
+
+    def delete_item(self, Key):
+        self.table.deleted.append(Key["connectionId"])
+
+
+class StubConnectionsTable:
+    def __init__(self):
+        self.deleted = []
+        self.batches = 0
+
+    def batch_writer(self):
+        return RecordingBatch(self)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = StubManagementClient(gone={"gone-1", "gone-2"}, failing={"busy-1"})
+    monkeypatch.setattr(websocket_client, "get_management_client", lambda endpoint, max_pool_connections=None: client)
+    return client
+
+
+def test_sends_to_live_connections_and_prunes_gone_ones(client):
+    table = StubConnectionsTable()
+    fanout = WebSocketFanout(table, max_workers=4)
+    targets = {connection_id: "wss://example/dev" for connection_id in ["live-1", "gone-1", "live-2", "gone-2"]}
+
+    result = fanout.send(targets, {"type": "analysis", "status": "completed"})
+
+    assert sorted(result.sent) == ["live-1", "live-2"]
+    assert sorted(result.gone) == ["gone-1", "gone-2"]
+    assert json.loads(client.posted["live-1"]) == {"type": "analysis", "status": "completed"}
+    assert sorted(table.deleted) == ["gone-1", "gone-2"]
+    assert table.batches == 1
+
+
+def test_failed_send_does_not_stop_others_and_is_not_pruned(client):
+    table = StubConnectionsTable()
+    fanout = WebSocketFanout(table, max_workers=4)
+
+    result = fanout.broadcast("wss://example/dev", ["busy-1", "live-1"], "hello")
+
+    assert result.as_dict() == {"sent": 1, "gone": 0, "failed": 1}
+    assert table.deleted == []
+    assert table.batches == 0
+
+
+def test_prune_without_table_only_reports(client):
+    fanout = WebSocketFanout(None, max_workers=2)
+
+    result = fanout.broadcast("wss://example/dev", ["gone-1", "live-1"], {"type": "ping"})
+
+    assert result.gone == ["gone-1"]
+    assert result.sent == ["live-1"]
+
+
+def test_connections_without_endpoint_are_skipped(client):
+    fanout = WebSocketFanout(None, max_workers=2)
+
+    result = fanout.send({"live-1": "", "live-2": "wss://example/dev"}, {"type": "ping"})
+
+    assert result.sent == ["live-2"]
+    assert list(client.posted) == ["live-2"]
+
+
+def test_management_client_is_shared_per_endpoint(monkeypatch):
+    created = []
+    monkeypatch.setattr(websocket_client, "_clients", {})
+    monkeypatch.setattr(websocket_client.boto3, "client", lambda *args, **kwargs: created.append(kwargs) or object())
+
+    first = get_management_client("wss://example/dev/")
+    second = get_management_client("https://example/dev")
+
+    assert first is second
+    assert [kwargs["endpoint_url"] for kwargs in created] == ["https://example/dev"]
+    assert management_endpoint("wss://example/dev/") == "https://example/dev"
@@ -0,0 +1,115 @@
+"""WebSocketの相談受付（他の利用者の会話への送信の拒否）のテスト"""
+import importlib.util
+import json
+import os
+
+import pytest
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "src", "lambda", "api", "websocket_handler", "message.py"
+)
+
+
+class FakeConversationsTable:
+    """どの会話も最初のやり取りをownerが記録している会話テーブル"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.queries = []
+        self.put_items = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return {"Items": [{"userId": self.owner}]}
+
+    def put_item(self, Item):
+        self.put_items.append(Item)
+
+
+class FakeConnectionsTable:
+    def __init__(self, users):
+        self.users = users
+
+    def get_item(self, Key, ProjectionExpression):
+        user_id = self.users.get(Key["connectionId"])
+        return {"Item": {"userId": user_id}} if user_id else {}
+
+
+class StubManagementClient:
+    def __init__(self):
+        self.frames = []
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.frames.append((ConnectionId, json.loads(Data)))
+
+
+class StubStepFunctions:
+    def __init__(self):
+        self.started = []
+
+    def start_execution(self, stateMachineArn, name, input):
+        self.started.append(json.loads(input))
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    # 各Lambdaのモジュール名は衝突しうるため、ファイルから別名で読み込む
+    monkeypatch.setenv("CONVERSATIONS_TABLE", "")
+    monkeypatch.setenv("CONNECTIONS_TABLE", "")
+    monkeypatch.setenv("STATE_MACHINE_ARN", "arn:aws:states:ap-northeast-1:123456789012:stateMachine:processor")
+    spec = importlib.util.spec_from_file_location("websocket_message_handler", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    client = StubManagementClient()
+    module.get_management_client = lambda endpoint: client
+    module.client = client
+    module.stepfunctions = StubStepFunctions()
+    module.conversations_table = FakeConversationsTable("user-a")
+    module.connections_table = FakeConnectionsTable({"conn-a": "user-a", "conn-b": "user-b"})
+    module.mark_processing = lambda *args: None
+    return module
+
+
+def message_event(connection_id, body):
+    return {
+        "requestContext": {"connectionId": connection_id, "domainName": "example.com", "stage": "dev"},
+        "body": json.dumps(body, ensure_ascii=False),
+    }
+
+
+def test_other_users_conversation_is_rejected(handler):
+    response = handler.lambda_handler(
+        message_event("conn-b", {"requestId": "r-1", "conversationId": "conv-a", "message": "続きです"}), None
+    )
+
+    # 会話の存在を知らせないよう、見つからないとして返す
+    assert response["statusCode"] == 404
+    assert handler.client.frames == [
+        ("conn-b", {"type": "error", "requestId": "r-1", "error": "Conversation not found"})
+    ]
+    assert handler.stepfunctions.started == []
+    assert handler.conversations_table.put_items == []
+
+
+def test_unauthenticated_connection_cannot_continue_owned_conversation(handler):
+    response = handler.lambda_handler(
+        message_event("conn-anonymous", {"conversationId": "conv-a", "message": "続きです"}), None
+    )
+
+    assert response["statusCode"] == 404
+    assert handler.stepfunctions.started == []
+
+
+def test_owner_can_continue_conversation(handler):
+    response = handler.lambda_handler(
+        message_event("conn-a", {"requestId": "r-1", "conversationId": "conv-a", "message": "続きです"}), None
+    )
+
+    assert response["statusCode"] == 200
+    started, = handler.stepfunctions.started
+    assert started["conversationId"] == "conv-a"
+    assert started["connectionId"] == "conn-a"
+    (_, frame), = handler.client.frames
+    assert frame["type"] == "accepted"
+    assert handler.conversations_table.put_items[0]["userId"] == "user-a"